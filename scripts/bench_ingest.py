@@ -0,0 +1,70 @@
+"""Time the export ingest path (parse + insert) on synthetic plain-text messages.
+
+Usage: python scripts/bench_ingest.py [--rows 200000] [--chunk-size 5000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta, timezone
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from telegram_bot import db_utils, message_utils  # noqa: E402
+
+CHAT_ID = "bench"
+
+
+def _raw_messages(rows: int):
+    for msg_id in range(1, rows + 1):
+        yield {
+            "id": msg_id,
+            "type": "message",
+            "file": "",
+            "date": 1_600_000_000 + msg_id * 60,
+            "text": f"message {msg_id} with some plain text in it",
+            "raw": {"FromID": {"UserID": str(msg_id % 50)}},
+            "ori_width": None,
+            "ori_height": None,
+            "og_info": None,
+        }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500, help="parse/filter batch size")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_utils.APP_DB_PATH = Path(tmp) / "app.db"
+        tz = timezone(timedelta(hours=8))
+
+        started = time.perf_counter()
+        rows = list(message_utils.iter_message_rows(CHAT_ID, _raw_messages(args.rows), tz, batch_size=args.batch_size))
+        parsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        inserted = db_utils.ingest_message_rows(CHAT_ID, rows, args.chunk_size)
+        written = time.perf_counter() - started
+
+        size = os.path.getsize(db_utils.APP_DB_PATH)
+    total = parsed + written
+    print(f"parse:  {args.rows / parsed:,.0f} msgs/s ({parsed:.2f}s)")
+    print(f"insert: {inserted / written:,.0f} msgs/s ({written:.2f}s, {inserted} new, search={db_utils.SEARCH_ENGINE})")
+    print(f"total:  {args.rows / total:,.0f} msgs/s; db {size / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+"""Compare LIKE and full-text search on a synthetic Chinese corpus.
+
+Usage: python scripts/bench_search.py [--rows 1000000] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from telegram_bot import db_utils  # noqa: E402
+
+CHAT_ID = "bench"
+WORDS = [
+    "电影", "资源", "分享", "下载", "高清", "字幕", "合集", "更新", "动画", "纪录片",
+    "音乐", "专辑", "无损", "软件", "破解", "教程", "课程", "学习", "阅读", "小说",
+    "网盘", "链接", "失效", "补档", "频道", "通知", "今天", "明天", "周末", "推荐",
+    "北京", "上海", "天气", "新闻", "科技", "游戏", "手机", "电脑", "相机", "旅行",
+    "美食", "咖啡", "好的", "谢谢", "大家", "我们", "这个", "那个", "已经", "还是",
+]
+ASCII_WORDS = ["4K", "1080p", "HDR", "mkv", "flac", "Python", "release", "v2"]
+QUERIES = ["电影", "高清字幕", "无损音乐", "纪录片 -动画", "python", "北京天气", "分享链接 4k"]
+
+
+def _random_text(rng: random.Random) -> str:
+    parts = [rng.choice(WORDS) for _ in range(rng.randint(4, 24))]
+    if rng.random() < 0.2:
+        parts.insert(rng.randrange(len(parts)), rng.choice(ASCII_WORDS))
+    return "".join(parts)
+
+
+def _fill(conn, rows: int, seed: int) -> float:
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    batch = []
+    for msg_id in range(1, rows + 1):
+        batch.append({
+            "msg_id": msg_id,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_600_000_000 + msg_id * 60)),
+            "timestamp": 1_600_000_000 + msg_id * 60,
+            "msg_file_name": "",
+            "msg_files": [],
+            "user": "1",
+            "sender_id": "1",
+            "is_self": 0,
+            "msg": _random_text(rng),
+            "reply_to_msg_id": 0,
+            "reply_to_top_id": 0,
+            "replies_num": 0,
+            "reactions": {},
+            "ori_height": None,
+            "ori_width": None,
+            "og_info": None,
+        })
+        if len(batch) >= 10_000:
+            db_utils.save_messages(conn, CHAT_ID, batch)
+            batch = []
+    if batch:
+        db_utils.save_messages(conn, CHAT_ID, batch)
+    return time.perf_counter() - started
+
+
+def _run_query(conn, engine: str, query: str) -> tuple[int, float]:
+    db_utils.SEARCH_ENGINE = engine
+    join_sql, where_sql, params = db_utils.build_message_search(query)
+    started = time.perf_counter()
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM {join_sql} messages m WHERE m.chat_id=?{where_sql}",
+        (CHAT_ID, *params),
+    ).fetchone()[0]
+    conn.execute(
+        f"SELECT m.msg_id FROM {join_sql} messages m WHERE m.chat_id=?{where_sql} ORDER BY m.msg_id LIMIT 20",
+        (CHAT_ID, *params),
+    ).fetchall()
+    return total, time.perf_counter() - started
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--engine", default="trigram", choices=["trigram", "unicode61"])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_utils.APP_DB_PATH = Path(tmp) / "app.db"
+        db_utils.SEARCH_ENGINE = args.engine
+        conn = db_utils.get_app_connection()
+        try:
+            elapsed = _fill(conn, args.rows, args.seed)
+            print(f"inserted {args.rows} rows with {args.engine} index in {elapsed:.1f}s")
+            print(f"{'query':<16}{'like ms':>10}{args.engine + ' ms':>14}{'hits':>10}{'speedup':>10}")
+            for query in QUERIES:
+                timings: dict[str, list[float]] = {"like": [], args.engine: []}
+                hits: dict[str, int] = {}
+                for _ in range(args.repeat):
+                    for engine in timings:
+                        hits[engine], seconds = _run_query(conn, engine, query)
+                        timings[engine].append(seconds)
+                like_ms = statistics.median(timings["like"]) * 1000
+                fts_ms = statistics.median(timings[args.engine]) * 1000
+                mismatch = "" if hits["like"] == hits[args.engine] else f" (like={hits['like']})"
+                print(f"{query:<16}{like_ms:>10.1f}{fts_ms:>14.1f}{hits[args.engine]:>10}{like_ms / max(fts_ms, 1e-6):>9.1f}x{mismatch}")
+        finally:
+            conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from telegram_bot.db_utils import get_app_connection, rebuild_chat_stats, rebuild_message_reactions  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="校验并重建 chat_stats 计数表与 reactions 聚合表")
+    parser.add_argument("--chat-id", default=None, help="只重建指定 chat（默认全部）")
+    args = parser.parse_args()
+
+    conn = get_app_connection()
+    try:
+        drifted = rebuild_chat_stats(conn, args.chat_id)
+        reactions = rebuild_message_reactions(conn, args.chat_id)
+        chats = conn.execute("SELECT COUNT(*) FROM chat_stats").fetchone()[0]
+    finally:
+        conn.close()
+
+    for chat_id in drifted:
+        print(f"计数不一致，已修正：{chat_id}")
+    print(f"chat_stats 重建完成：{chats} 个 chat，修正 {len(drifted)} 个")
+    print(f"message_reactions 重建完成：{reactions} 条")
+    return 1 if drifted else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from telegram_bot.db_utils import get_app_connection, rebuild_search_index  # noqa: E402
+
+
+def main() -> int:
+    conn = get_app_connection()
+    try:
+        rebuild_search_index(conn)
+        total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    finally:
+        conn.close()
+
+    print(f"全文索引重建完成：消息 {total} 条")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,19 +1,47 @@
 """High level chat export handler."""
 
+from contextlib import closing
 from datetime import timezone, timedelta
 import os
 
-import re
 from . import db_utils
-from .db_utils import get_connection, save_messages
+from .db_utils import get_connection, ingest_message_rows
 from .update_messages import export_chat, refresh_chat_reactions
 from .project_logger import get_logger
-from .message_utils import load_json, parse_messages
-from .og_utils import calculate_size, get_open_graph_info
+from .message_utils import iter_json_array, iter_message_rows
+from .og_utils import calculate_size, wake_og_enricher
 from .paths import BASE_DIR, ensure_runtime_dirs
 
 ensure_runtime_dirs()
 
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+# Rows written per writer transaction.
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
+
+
+def _until_cancelled(items, cancel):
+    for item in items:
+        if cancel is not None and cancel.is_set():
+            return
+        yield item
+
+
+def _with_display_info(chat_id: str, raw_messages):
+    """
+    Attach display sizes to raw tdl messages as they stream by.
+
+    Og info is left empty here: save_messages queues link messages and the og
+    enricher fills them in afterwards, so ingest never waits on the network.
+    """
+    for m in raw_messages:
+        msg_file = m.get("file", "")
+        msg_file_name = f'downloads/{chat_id}/{chat_id}_{m.get("id")}_{msg_file}' if msg_file else ""
+        ori_width, ori_height = calculate_size(msg_file_name, None, None)
+        m['ori_width'] = ori_width
+        m['ori_height'] = ori_height
+        m['og_info'] = None
+        yield m
+
 
 def handle(
     chat_id: str,
@@ -23,21 +51,31 @@ def handle(
     remark: str | None,
     download_images_only: bool = False,
     refresh_reactions: bool = False,
-):
-    """Export messages and store them in the database."""
+    cancel=None,
+) -> int:
+    """
+    Export messages and store them in the database; returns how many were new.
+
+    ``cancel`` is an optional threading.Event; once set, tdl is stopped and the
+    remaining ingest batches and the reaction refresh are skipped.
+    """
     logger = get_logger(remark or chat_id)
     data_dir = BASE_DIR / 'data' / chat_id
     data_dir.mkdir(parents=True, exist_ok=True)
-    msg_json_path = str(data_dir / f'{chat_id}_chat.json')
+    legacy_msg_json_path = data_dir / f'{chat_id}_chat.json'
     msg_json_temp_path = str(data_dir / f'{chat_id}_chat_temp.json')
     reactions_json_temp_path = str(data_dir / f'{chat_id}_reactions_temp.json')
     db_path = str(data_dir / 'messages.db')
 
-    with get_connection(chat_id) as conn:
+    # Older versions merged every export into this file; it is no longer used.
+    legacy_msg_json_path.unlink(missing_ok=True)
+
+    inserted = 0
+    with closing(get_connection(chat_id)) as conn:
+        exported = False
         try:
-            export_chat(
-                chat_id,
-                msg_json_path,
+            exported = export_chat(
+                chat_id,
                 msg_json_temp_path,
                 conn,
                 is_download=is_download,
@@ -45,45 +83,35 @@ def handle(
                 is_raw=is_raw,
                 download_images_only=download_images_only,
                 remark=remark,
+                cancel=cancel,
             )
         except Exception as e:
-            logger.exception(f'Error writing {msg_json_path}: {e}')
+            logger.exception(f'Error exporting to {msg_json_temp_path}: {e}')
 
-        if os.path.exists(msg_json_path):
-            try:
-                data = load_json(msg_json_path)
-                tz = timezone(timedelta(hours=8))
-                messages_data = data.get("messages", [])
-                # fetch og info and display sizes
-                for m in messages_data:
-                    links = []
-                    if isinstance(m.get("text"), str):
-                        links = re.findall(r'(https?://\S+)', m["text"])
-                    msg_file = m.get("file", "")
-                    msg_file_name = f'downloads/{chat_id}/{chat_id}_{m.get("id")}_{msg_file}' if msg_file else ""
-                    og_info = None
-                    og_width = og_height = None
-                    if links and not msg_file:
-                        og_info = get_open_graph_info(links[0], chat_id)
-                        if og_info:
-                            og_width = og_info.get('width')
-                            og_height = og_info.get('height')
-                    ori_width, ori_height = calculate_size(msg_file_name, og_width, og_height)
-                    m['ori_width'] = ori_width
-                    m['ori_height'] = ori_height
-                    m['og_info'] = og_info
-                messages = parse_messages(chat_id, messages_data, tz, remark)
-                save_messages(conn, chat_id, messages)
-                if refresh_reactions:
-                    refresh_chat_reactions(chat_id, reactions_json_temp_path, conn, remark=remark)
-                db_utils.set_last_export_time(conn, db_utils.get_exported_time(conn))
-            except Exception as e:
-                logger.exception(f'Error parsing {msg_json_path}: {e}')
-            finally:
-                os.remove(msg_json_path)
+        if exported and os.path.exists(msg_json_temp_path):
+            try:
+                tz = timezone(timedelta(hours=8))
+                raw_messages = _with_display_info(chat_id, iter_json_array(msg_json_temp_path, "messages"))
+                rows = iter_message_rows(chat_id, raw_messages, tz, remark, batch_size=INGEST_BATCH_SIZE)
+                # The export overlaps the previous window, so stored messages are upserted.
+                inserted = ingest_message_rows(
+                    chat_id, _until_cancelled(rows, cancel), INGEST_CHUNK_SIZE, logger=logger, upsert=True
+                )
+                logger.info(f"Inserted {inserted} new messages")
+                if inserted:
+                    wake_og_enricher()
+                if cancel is not None and cancel.is_set():
+                    logger.info("Export cancelled; the next run starts from the previous cursor")
+                else:
+                    if refresh_reactions:
+                        refresh_chat_reactions(chat_id, reactions_json_temp_path, conn, remark=remark, cancel=cancel)
+                    db_utils.set_last_export_time(conn, db_utils.get_exported_time(conn))
+            except Exception as e:
+                logger.exception(f'Error parsing {msg_json_temp_path}: {e}')
 
         if os.path.exists(msg_json_temp_path):
             os.remove(msg_json_temp_path)
 
     logger.info(f"Messages data saved to {db_path}")
+    return inserted
 
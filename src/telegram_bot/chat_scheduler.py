@@ -0,0 +1,210 @@
+"""Central scheduler for the periodic chat exports.
+
+All chats share one heap ordered by next-due time and a small fixed pool of
+worker threads (``CHAT_WORKERS``), instead of one sleeping thread per chat.
+After every run a chat's interval is re-derived from its observed message rate:
+it aims for about ``CHAT_POLL_TARGET_MESSAGES`` new messages per run, stays
+within ``CHAT_POLL_MIN_SECONDS``..``CHAT_POLL_MAX_SECONDS``, and doubles while
+a chat stays silent.
+
+Each chat carries a cancel event that is handed to its run: ``cancel`` stops
+the run in progress but keeps the chat scheduled, ``remove`` also unschedules it.
+"""
+
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Callable
+
+from .project_logger import get_logger
+
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "2"))
+CHAT_POLL_MIN_SECONDS = int(os.getenv("CHAT_POLL_MIN_SECONDS", "300"))
+CHAT_POLL_MAX_SECONDS = int(os.getenv("CHAT_POLL_MAX_SECONDS", str(6 * 3600)))
+CHAT_POLL_DEFAULT_SECONDS = int(os.getenv("CHAT_POLL_DEFAULT_SECONDS", "1800"))
+CHAT_POLL_TARGET_MESSAGES = float(os.getenv("CHAT_POLL_TARGET_MESSAGES", "20"))
+# Weight of the latest run in the message-rate estimate.
+_RATE_SMOOTHING = 0.5
+
+logger = get_logger("scheduler")
+
+
+@dataclass
+class _ChatState:
+    chat_id: str
+    interval: float
+    due: float
+    seq: int = 0
+    running: bool = False
+    removed: bool = False
+    rate: float | None = None
+    last_run_at: float | None = None
+    last_inserted: int | None = None
+    cancel: threading.Event = field(default_factory=threading.Event)
+
+
+class ChatScheduler:
+    def __init__(
+        self,
+        run_chat: Callable[[str, threading.Event], int | None],
+        workers: int = CHAT_WORKERS,
+        min_interval: float = CHAT_POLL_MIN_SECONDS,
+        max_interval: float = CHAT_POLL_MAX_SECONDS,
+        default_interval: float = CHAT_POLL_DEFAULT_SECONDS,
+        target_messages: float = CHAT_POLL_TARGET_MESSAGES,
+    ):
+        self._run_chat = run_chat
+        self.workers = max(1, int(workers))
+        self.min_interval = float(min_interval)
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.default_interval = self._clamp(default_interval)
+        self.target_messages = max(1.0, float(target_messages))
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = count()
+        self._chats: dict[str, _ChatState] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._idle_workers = self.workers
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, float(interval)))
+
+    def _push(self, state: _ChatState) -> None:
+        # Lazy deletion: older heap entries of the chat no longer match state.seq.
+        state.seq = next(self._seq)
+        heapq.heappush(self._heap, (state.due, state.seq, state.chat_id))
+        self._cond.notify_all()
+
+    def add(self, chat_id: str, delay: float = 0.0) -> bool:
+        """Schedule a chat, first run after ``delay`` seconds; False if already scheduled."""
+        chat_id = str(chat_id)
+        with self._cond:
+            state = self._chats.get(chat_id)
+            if state is not None:
+                if not state.removed:
+                    return False
+                # Removed mid-run and added back: keep it, it is rescheduled when the run ends.
+                state.removed = False
+                return True
+            state = self._chats[chat_id] = _ChatState(chat_id, self.default_interval, time.time() + delay)
+            self._push(state)
+            return True
+
+    def remove(self, chat_id: str) -> bool:
+        """Unschedule a chat; a run in progress finishes but is not rescheduled."""
+        with self._cond:
+            state = self._chats.get(str(chat_id))
+            if state is None or state.removed:
+                return False
+            if state.running:
+                state.removed = True
+                state.cancel.set()
+            else:
+                del self._chats[state.chat_id]
+            return True
+
+    def cancel(self, chat_id: str) -> bool:
+        """Stop the chat's run in progress, if any; the chat stays scheduled."""
+        with self._cond:
+            state = self._chats.get(str(chat_id))
+            if state is None or not state.running:
+                return False
+            state.cancel.set()
+            return True
+
+    def has(self, chat_id: str) -> bool:
+        with self._cond:
+            state = self._chats.get(str(chat_id))
+            return state is not None and not state.removed
+
+    def next_interval(self, state: _ChatState, inserted: int, started_at: float) -> float:
+        if state.last_run_at is None:
+            return state.interval
+        window = max(1.0, started_at - state.last_run_at)
+        observed = max(0, inserted) / window
+        state.rate = observed if state.rate is None else _RATE_SMOOTHING * observed + (1 - _RATE_SMOOTHING) * state.rate
+        if state.rate <= 0:
+            return self._clamp(state.interval * 2)
+        return self._clamp(self.target_messages / state.rate)
+
+    def _run(self, state: _ChatState) -> None:
+        started_at = time.time()
+        inserted = 0
+        try:
+            inserted = int(self._run_chat(state.chat_id, state.cancel) or 0)
+        except Exception as e:
+            logger.exception(f"Chat run failed: chat_id={state.chat_id} error={e}")
+        finally:
+            with self._cond:
+                state.running = False
+                self._idle_workers += 1
+                if state.removed:
+                    self._chats.pop(state.chat_id, None)
+                else:
+                    state.interval = self.next_interval(state, inserted, started_at)
+                    state.last_run_at = started_at
+                    state.last_inserted = inserted
+                    state.due = time.time() + state.interval
+                    self._push(state)
+                self._cond.notify_all()
+
+    def _next_ready(self) -> _ChatState | None:
+        while self._heap:
+            due, seq, chat_id = self._heap[0]
+            state = self._chats.get(chat_id)
+            if state is None or state.seq != seq or state.running:
+                heapq.heappop(self._heap)
+                continue
+            if due > time.time() or self._idle_workers <= 0:
+                return None
+            heapq.heappop(self._heap)
+            return state
+        return None
+
+    def _timeout(self) -> float | None:
+        if not self._heap or self._idle_workers <= 0:
+            return None
+        return max(0.0, self._heap[0][0] - time.time())
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                state = self._next_ready()
+                while state is None:
+                    self._cond.wait(self._timeout())
+                    state = self._next_ready()
+                state.running = True
+                state.cancel.clear()
+                self._idle_workers -= 1
+            self._executor.submit(self._run, state)
+
+    def start(self) -> bool:
+        with self._cond:
+            if self._executor is not None:
+                return False
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chat-worker")
+        threading.Thread(target=self._dispatch, name="chat-scheduler", daemon=True).start()
+        return True
+
+    def snapshot(self) -> list[dict]:
+        now = time.time()
+        with self._cond:
+            return [
+                {
+                    "chat_id": state.chat_id,
+                    "running": state.running,
+                    "cancelling": state.running and state.cancel.is_set(),
+                    "interval_seconds": round(state.interval),
+                    "due_in_seconds": max(0, round(state.due - now)),
+                    "messages_per_hour": round(state.rate * 3600, 2) if state.rate is not None else None,
+                    "last_inserted": state.last_inserted,
+                }
+                for state in sorted(self._chats.values(), key=lambda s: s.due)
+                if not state.removed
+            ]
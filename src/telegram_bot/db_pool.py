@@ -0,0 +1,97 @@
+"""Thread pools the async route handlers hand their blocking work to.
+
+The handlers are ``async def`` and run on the event loop, so the loop keeps
+serving static files and downloads while queries run. Their sqlite and tdl
+work goes to one of a few dedicated pools instead of Starlette's shared
+threadpool, each sized per endpoint class:
+
+- ``read_pool``: message pages, stats and the chat list (``DB_READ_THREADS``),
+- ``search_pool``: full-text searches, which can take seconds (``DB_SEARCH_THREADS``),
+- ``admin_pool``: writes, raw SQL and short tdl calls (``DB_ADMIN_THREADS``),
+- ``download_pool``: media downloads, which hold a thread for the whole tdl
+  run (``DB_DOWNLOAD_THREADS``), so they cannot starve ``admin_pool``.
+
+Every pool bounds its queue: once ``threads * DB_POOL_QUEUE_FACTOR`` calls are
+waiting or running, ``run`` raises ``PoolBusy`` instead of queueing more.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from threading import Lock
+from typing import Callable
+
+DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", "8"))
+DB_SEARCH_THREADS = int(os.getenv("DB_SEARCH_THREADS", "2"))
+DB_ADMIN_THREADS = int(os.getenv("DB_ADMIN_THREADS", "4"))
+DB_DOWNLOAD_THREADS = int(os.getenv("DB_DOWNLOAD_THREADS", "2"))
+DB_POOL_QUEUE_FACTOR = int(os.getenv("DB_POOL_QUEUE_FACTOR", "16"))
+
+
+class PoolBusy(RuntimeError):
+    """Raised when a pool's queue is full."""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} pool is busy")
+        self.name = name
+
+
+class DbPool:
+    def __init__(self, name: str, threads: int, max_pending: int | None = None):
+        self.name = name
+        self.threads = max(1, threads)
+        self.max_pending = max_pending if max_pending is not None else self.threads * DB_POOL_QUEUE_FACTOR
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=f"db-{name}")
+        self._lock = Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run ``fn`` on the pool and await its result."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusy(self.name)
+            self._pending += 1
+        try:
+            future = self._executor.submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self._done(None)
+            raise
+        # Counted until the call itself finishes: a cancelled waiter (e.g. a
+        # client that disconnected) leaves its query running on the pool.
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"threads": self.threads, "pending": self._pending, "max_pending": self.max_pending, "rejected": self.rejected}
+
+
+def offload(pool: DbPool):
+    """Turn a blocking route function into an ``async def`` handler that runs it on ``pool``.
+
+    FastAPI reads the parameters of the wrapped function, so the route signature is unchanged.
+    """
+
+    def decorate(fn: Callable):
+        @wraps(fn)
+        async def handler(*args, **kwargs):
+            return await pool.run(fn, *args, **kwargs)
+
+        return handler
+
+    return decorate
+
+
+read_pool = DbPool("read", DB_READ_THREADS)
+search_pool = DbPool("search", DB_SEARCH_THREADS)
+admin_pool = DbPool("admin", DB_ADMIN_THREADS)
+download_pool = DbPool("download", DB_DOWNLOAD_THREADS)
@@ -1,16 +1,137 @@
 import json
+import os
 import re
 import sqlite3
+import threading
 import time
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
+from typing import Iterable
 
 from .paths import DATA_DIR
 
 APP_DB_PATH = DATA_DIR / "app.db"
 
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "trigram").strip().lower()
+_SEARCH_TOKENIZERS = {
+    "trigram": "trigram",
+    "unicode61": "unicode61 remove_diacritics 2",
+}
+_FTS5_AVAILABLE: bool | None = None
+# Chats up to this many messages are searched by walking their own rows and
+# probing the index hits, instead of walking every chat's hits.
+SEARCH_CHAT_SCAN_MAX_ROWS = int(os.getenv("SEARCH_CHAT_SCAN_MAX_ROWS", "20000"))
+
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "30"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_POOL_MAX_IDLE_PER_THREAD = int(os.getenv("SQLITE_POOL_MAX_IDLE_PER_THREAD", "4"))
+
 
 class AppConnection(sqlite3.Connection):
     chat_id: str | None = None
+    _pool: "_ConnectionPool | None" = None
+
+    def close(self):
+        # Pooled connections go back to their pool instead of being closed.
+        pool = self._pool
+        if pool is None:
+            super().close()
+            return
+        pool.release(self)
+
+
+class _ConnectionPool:
+    """Process-wide connections to one database file.
+
+    Readers get a connection from a per-thread idle list, so a handler thread
+    reuses the same few connections for its whole life. Batch writes go
+    through the single writer connection, serialized by ``writer_lock``.
+    The schema is created and migrated once, when the pool is created.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.writer_lock = threading.RLock()
+        self._local = threading.local()
+        self._writer: AppConnection | None = None
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        init_db(conn)
+        self.release(conn)
+
+    def _connect(self, check_same_thread: bool = True) -> AppConnection:
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=AppConnection,
+            timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+            check_same_thread=check_same_thread,
+        )
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA cache_size={-int(SQLITE_CACHE_SIZE_KB)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn._pool = self
+        return conn
+
+    def acquire(self) -> AppConnection:
+        idle = getattr(self._local, "idle", None)
+        if idle:
+            return idle.pop()
+        return self._connect()
+
+    def release(self, conn: AppConnection) -> None:
+        if conn is self._writer:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            conn.chat_id = ""
+        except sqlite3.ProgrammingError:
+            return
+        idle = getattr(self._local, "idle", None)
+        if idle is None:
+            idle = self._local.idle = []
+        if len(idle) < SQLITE_POOL_MAX_IDLE_PER_THREAD and conn not in idle:
+            idle.append(conn)
+        else:
+            sqlite3.Connection.close(conn)
+
+    @contextmanager
+    def writer(self, chat_id: str = "", row_factory=None):
+        with self.writer_lock:
+            if self._writer is None:
+                self._writer = self._connect(check_same_thread=False)
+            conn = self._writer
+            conn.chat_id = str(chat_id or "")
+            conn.row_factory = row_factory
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.chat_id = ""
+                conn.row_factory = None
+
+
+_pools: dict[str, _ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool() -> _ConnectionPool:
+    db_path = get_app_db_path()
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = _pools[db_path] = _ConnectionPool(db_path)
+    return pool
 
 
 def get_app_db_path() -> str:
@@ -27,6 +148,10 @@ def _conn_chat_scope(conn: sqlite3.Connection) -> str:
 
 
 def init_db(conn):
+    # messages_fts (see _init_search_index) points at the implicit rowid of
+    # this table. Without an INTEGER PRIMARY KEY a VACUUM may renumber those
+    # rowids and leave the index matching the wrong rows: run
+    # scripts/rebuild_search_index.py after every VACUUM.
     conn.execute(
         '''
         CREATE TABLE IF NOT EXISTS messages(
@@ -96,6 +221,52 @@ def init_db(conn):
         )
     '''
     )
+    stats_existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='chat_stats'"
+    ).fetchone()
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS chat_stats(
+            chat_id TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            with_replies INTEGER NOT NULL DEFAULT 0,
+            with_reactions INTEGER NOT NULL DEFAULT 0,
+            min_msg_id INTEGER,
+            max_msg_id INTEGER,
+            min_timestamp INTEGER,
+            max_timestamp INTEGER,
+            updated_at INTEGER NOT NULL DEFAULT 0
+        )
+    '''
+    )
+    reactions_existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='message_reactions'"
+    ).fetchone()
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS message_reactions(
+            chat_id TEXT NOT NULL,
+            msg_id INTEGER NOT NULL,
+            emoticon TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(chat_id, msg_id, emoticon)
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS reaction_totals(
+            chat_id TEXT NOT NULL,
+            emoticon TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0,
+            listed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(chat_id, emoticon)
+        )
+    '''
+    )
     conn.execute(
         '''
         CREATE TABLE IF NOT EXISTS og_cache(
@@ -105,6 +276,39 @@ def init_db(conn):
         )
     '''
     )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS og_queue(
+            chat_id TEXT NOT NULL,
+            msg_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL DEFAULT 0,
+            enqueued_at INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(chat_id, msg_id)
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions(
+            chat_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS link_status(
+            provider TEXT NOT NULL,
+            link TEXT NOT NULL,
+            stale INTEGER,
+            checked_at INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(provider, link)
+        )
+    '''
+    )
 
     try:
         cols = {row[1] for row in conn.execute("PRAGMA table_info(messages)").fetchall()}
@@ -122,21 +326,235 @@ def init_db(conn):
     except Exception:
         pass
 
+    # Tables from before zero and repeated reaction entries were tracked need a rebuild.
+    if "total" not in {row[1] for row in conn.execute("PRAGMA table_info(message_reactions)")}:
+        conn.execute("ALTER TABLE message_reactions ADD COLUMN total INTEGER NOT NULL DEFAULT 0")
+        reactions_existed = None
+    if "listed" not in {row[1] for row in conn.execute("PRAGMA table_info(reaction_totals)")}:
+        conn.execute("ALTER TABLE reaction_totals ADD COLUMN listed INTEGER NOT NULL DEFAULT 0")
+        reactions_existed = None
+
     conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_ts_id ON messages(chat_id, timestamp, msg_id)')
     conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_reply_to_msg_id ON messages(chat_id, reply_to_msg_id)')
     conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_reply_to_top_id ON messages(chat_id, reply_to_top_id)')
     conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_msg ON messages(chat_id, msg)')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_messages_chat_replies_num '
+        'ON messages(chat_id, replies_num, COALESCE(timestamp, 0), msg_id) WHERE replies_num > 0'
+    )
     conn.execute('CREATE INDEX IF NOT EXISTS idx_scope_items_chat_id ON search_scope_items(chat_id)')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_message_reactions_rank '
+        'ON message_reactions(chat_id, emoticon, count DESC, timestamp DESC, msg_id DESC)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_og_queue_due ON og_queue(next_attempt_at, enqueued_at)')
+    _init_search_index(conn)
+    if not stats_existed:
+        conn.execute(f"INSERT OR REPLACE INTO chat_stats {_CHAT_STATS_SELECT} GROUP BY chat_id", (int(time.time()),))
+    if not reactions_existed:
+        rebuild_message_reactions(conn, commit=False)
+    conn.commit()
+
+
+def search_engine() -> str:
+    """Return the effective search engine for this SQLite build.
+
+    ``trigram`` (the default) keeps substring semantics, which CJK text needs
+    because it has no spaces between words. ``unicode61`` indexes whole words
+    and matches keyword prefixes. ``like`` disables the index entirely.
+    """
+    engine = SEARCH_ENGINE if SEARCH_ENGINE in ("trigram", "unicode61", "like") else "trigram"
+    if engine == "like":
+        return engine
+    if not _fts5_available():
+        return "like"
+    if engine == "trigram" and sqlite3.sqlite_version_info < (3, 34, 0):
+        return "unicode61"
+    return engine
+
+
+def _fts5_available() -> bool:
+    global _FTS5_AVAILABLE
+    if _FTS5_AVAILABLE is None:
+        probe = sqlite3.connect(":memory:")
+        try:
+            probe.execute("CREATE VIRTUAL TABLE probe USING fts5(x)")
+            _FTS5_AVAILABLE = True
+        except sqlite3.OperationalError:
+            _FTS5_AVAILABLE = False
+        finally:
+            probe.close()
+    return _FTS5_AVAILABLE
+
+
+def _drop_search_index(conn):
+    for trigger in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS messages_fts")
+
+
+def _init_search_index(conn):
+    # External-content FTS5 index over messages, keyed by the messages rowid.
+    # That rowid is not stable across VACUUM (see init_db); rebuild_search_index
+    # re-derives the index. Switching engines recreates the index and backfills
+    # it from the rows.
+    engine = search_engine()
+    row = conn.execute("SELECT value FROM meta WHERE chat_id='' AND key='search_engine'").fetchone()
+    current = row[0] if row else None
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='messages_fts'"
+    ).fetchone()
+    if engine == "like":
+        if existed or current != engine:
+            _drop_search_index(conn)
+            conn.execute("INSERT OR REPLACE INTO meta(chat_id, key, value) VALUES('', 'search_engine', ?)", (engine,))
+        return
+
+    rebuild = not existed or current != engine
+    if rebuild:
+        _drop_search_index(conn)
+    conn.execute(
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            msg, msg_file_name, date,
+            content='messages',
+            content_rowid='rowid',
+            tokenize='{_SEARCH_TOKENIZERS[engine]}'
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, msg, msg_file_name, date)
+            VALUES (new.rowid, new.msg, new.msg_file_name, new.date);
+        END
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, msg, msg_file_name, date)
+            VALUES ('delete', old.rowid, old.msg, old.msg_file_name, old.date);
+        END
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF msg, msg_file_name, date ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, msg, msg_file_name, date)
+            VALUES ('delete', old.rowid, old.msg, old.msg_file_name, old.date);
+            INSERT INTO messages_fts(rowid, msg, msg_file_name, date)
+            VALUES (new.rowid, new.msg, new.msg_file_name, new.date);
+        END
+    '''
+    )
+    if rebuild:
+        conn.execute("INSERT OR REPLACE INTO meta(chat_id, key, value) VALUES('', 'search_engine', ?)", (engine,))
+        rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn) -> None:
+    """Rebuild the full-text index from the messages table.
+
+    Needed once for databases created before the index existed, and after a
+    VACUUM since that may renumber the messages rowids the index points at.
+    """
+    if search_engine() == "like":
+        return
+    conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
     conn.commit()
 
 
+def _split_search_keywords(query: str) -> list[tuple[str, bool]]:
+    keywords: list[tuple[str, bool]] = []
+    for kw in (query or "").strip().lower().split():
+        neg = kw.startswith("-")
+        kw = (kw[1:] if neg else kw).strip()
+        if kw:
+            keywords.append((kw, neg))
+    return keywords
+
+
+def _fts_phrase(keyword: str, engine: str) -> str | None:
+    """Return the MATCH phrase for ``keyword``, or None when the index cannot serve it."""
+    if engine == "trigram":
+        # The trigram tokenizer cannot match anything shorter than 3 characters.
+        if len(keyword) < 3:
+            return None
+        return '"' + keyword.replace('"', '""') + '"'
+    if engine == "unicode61":
+        if not re.search(r"\w", keyword):
+            return None
+        return '"' + keyword.replace('"', '""') + '"*'
+    return None
+
+
+def _like_fields(alias: str, extra_fields: tuple[str, ...] = ()) -> str:
+    fields = (f"{alias}.date", f"{alias}.msg", f"{alias}.msg_file_name", *extra_fields)
+    return " OR ".join(f"LOWER(COALESCE({field}, '')) LIKE ?" for field in fields)
+
+
+def build_message_search(query: str, alias: str = "m", chat_rows: int | None = None) -> tuple[str, str, list]:
+    """Translate a search box query into SQL against the full-text index.
+
+    Returns ``(join_sql, where_sql, params)``. ``join_sql`` must be placed
+    before ``messages {alias}`` in the FROM clause so the planner drives the
+    query from the index; ``where_sql`` is either empty or starts with ``AND``.
+    Keywords prefixed with ``-`` exclude matching messages. Keywords the index
+    cannot serve fall back to LIKE on the rows the index already narrowed.
+
+    The index covers every chat, so a MATCH visits the hits of all of them.
+    Pass the searched chat's message count as ``chat_rows``: a chat up to
+    ``SEARCH_CHAT_SCAN_MAX_ROWS`` messages is then walked by its own rows
+    (``join_sql`` is empty). With trigram, whose matches are LIKE substrings
+    anyway, its rows are matched with LIKE; otherwise the index hits are only
+    collected as rowids and probed, never joined.
+    """
+    engine = search_engine()
+    scan_chat = chat_rows is not None and chat_rows <= SEARCH_CHAT_SCAN_MAX_ROWS
+    positive: list[str] = []
+    negative: list[str] = []
+    like_conditions: list[str] = []
+    params: list = []
+    like_fields = _like_fields(alias)
+    for kw, neg in _split_search_keywords(query):
+        phrase = None if scan_chat and engine == "trigram" else _fts_phrase(kw, engine)
+        if phrase is None:
+            like_conditions.append(f"NOT ({like_fields})" if neg else f"({like_fields})")
+            params.extend([f"%{kw}%"] * 3)
+            continue
+        (negative if neg else positive).append(phrase)
+
+    join_sql = ""
+    where_parts: list[str] = []
+    match_params: list = []
+    if positive:
+        expression = "(" + " AND ".join(positive) + ")"
+        for phrase in negative:
+            expression += f" NOT {phrase}"
+        if scan_chat:
+            where_parts.append(f"{alias}.rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+        else:
+            join_sql = "messages_fts CROSS JOIN"
+            where_parts.append(f"messages_fts MATCH ? AND {alias}.rowid = messages_fts.rowid")
+        match_params.append(expression)
+    elif negative:
+        where_parts.append(
+            f"{alias}.rowid NOT IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"
+        )
+        match_params.append(" OR ".join(negative))
+
+    where_parts.extend(like_conditions)
+    where_sql = "".join(f" AND {part}" for part in where_parts)
+    return join_sql, where_sql, [*match_params, *params]
+
+
 def get_app_connection(row_factory=None, chat_id: str | None = None):
-    db_path = get_app_db_path()
-    conn = sqlite3.connect(db_path, factory=AppConnection)
+    conn = _get_pool().acquire()
     conn.chat_id = str(chat_id or "")
     if row_factory:
         conn.row_factory = row_factory
-    init_db(conn)
     return conn
 
 
@@ -144,6 +562,16 @@ def get_connection(chat_id, row_factory=None):
     return get_app_connection(row_factory=row_factory, chat_id=str(chat_id or ""))
 
 
+def write_connection(chat_id: str | None = None, row_factory=None):
+    """Hold the process-wide writer connection for a batch of writes.
+
+    Use as ``with write_connection(chat_id) as conn:``; the batch is committed
+    on exit and rolled back on error. Other writers in this process wait for
+    the lock instead of contending on SQLite's busy handler.
+    """
+    return _get_pool().writer(str(chat_id or ""), row_factory)
+
+
 def upsert_chat(conn, chat_item: dict):
     now = int(time.time())
     chat_id = str(chat_item.get("id") or chat_item.get("chat_id") or "").strip()
@@ -181,6 +609,7 @@ def upsert_chat(conn, chat_item: dict):
             now,
         ),
     )
+    bump_data_version(conn, GLOBAL_DATA_VERSION)
     conn.commit()
     return get_chat(conn, chat_id)
 
@@ -196,6 +625,41 @@ def get_chat(conn, chat_id: str):
     return _normalize_chat(dict(zip(cols, row)))
 
 
+# data_versions key bumped by changes that are not about one chat's messages
+# (the chat list itself, all-chat rebuilds).
+GLOBAL_DATA_VERSION = ""
+
+
+def bump_data_version(conn, *chat_ids: str) -> None:
+    """Advance the change counter of each chat; read endpoints derive their ETags from it."""
+    conn.executemany(
+        '''
+        INSERT INTO data_versions(chat_id, version) VALUES(?, 1)
+        ON CONFLICT(chat_id) DO UPDATE SET version = version + 1
+        ''',
+        [(chat_id,) for chat_id in dict.fromkeys(str(chat_id) for chat_id in chat_ids)],
+    )
+
+
+def get_data_versions(conn, chat_ids: Iterable[str]) -> dict[str, int]:
+    """Current change counters of ``chat_ids`` (0 for chats never changed)."""
+    chat_ids = list(dict.fromkeys(str(chat_id) for chat_id in chat_ids))
+    versions = dict.fromkeys(chat_ids, 0)
+    if chat_ids:
+        placeholders = ",".join(["?"] * len(chat_ids))
+        for chat_id, version in conn.execute(
+            f"SELECT chat_id, version FROM data_versions WHERE chat_id IN ({placeholders})", chat_ids
+        ):
+            versions[chat_id] = int(version)
+    return versions
+
+
+def get_chat_updated_at(conn, chat_id: str) -> int | None:
+    """updated_at of one chat row, or None when the chat does not exist."""
+    row = conn.execute("SELECT updated_at FROM chats WHERE id=?", (str(chat_id),)).fetchone()
+    return int(row[0]) if row else None
+
+
 def _normalize_chat(item: dict) -> dict:
     item = dict(item)
     for key in ("download_files", "download_images_only", "all_messages", "raw_messages", "refresh_reactions"):
@@ -222,9 +686,16 @@ def delete_chat(conn, chat_id: str) -> bool:
     conn.execute("DELETE FROM search_scope_items WHERE chat_id=?", (chat_id,))
     conn.execute("DELETE FROM messages WHERE chat_id=?", (chat_id,))
     conn.execute("DELETE FROM meta WHERE chat_id=?", (chat_id,))
+    conn.execute("DELETE FROM chat_stats WHERE chat_id=?", (chat_id,))
+    conn.execute("DELETE FROM message_reactions WHERE chat_id=?", (chat_id,))
+    conn.execute("DELETE FROM reaction_totals WHERE chat_id=?", (chat_id,))
+    conn.execute("DELETE FROM og_queue WHERE chat_id=?", (chat_id,))
     conn.execute("DELETE FROM chats WHERE id=?", (chat_id,))
+    deleted = (conn.total_changes - before) > 0
+    if deleted:
+        bump_data_version(conn, chat_id, GLOBAL_DATA_VERSION)
     conn.commit()
-    return (conn.total_changes - before) > 0
+    return deleted
 
 
 def upsert_search_scope(conn, name: str, chat_ids: list[str], scope_id: int | None = None) -> dict:
@@ -302,23 +773,19 @@ def search_messages_global(conn, query: str, chat_ids: list[str] | None = None,
             params.extend(chat_ids)
 
     if query:
-        keywords = [kw for kw in query.split() if kw]
-        fields_or = " OR ".join([
-            "LOWER(COALESCE(m.date, '')) LIKE ?",
-            "LOWER(COALESCE(m.msg, '')) LIKE ?",
-            "LOWER(COALESCE(m.msg_file_name, '')) LIKE ?",
-            "LOWER(COALESCE(c.remark, '')) LIKE ?",
-            "LOWER(COALESCE(c.username, '')) LIKE ?",
-        ])
-        for kw in keywords:
-            neg = kw.startswith("-")
-            kw = kw[1:] if neg else kw
-            kw = kw.strip().lower()
-            if not kw:
-                continue
+        engine = search_engine()
+        chat_fields = "LOWER(COALESCE(c.remark, '')) LIKE ? OR LOWER(COALESCE(c.username, '')) LIKE ?"
+        for kw, neg in _split_search_keywords(query):
             pattern = f"%{kw}%"
+            phrase = _fts_phrase(kw, engine)
+            if phrase is None:
+                fields_or = _like_fields("m", ("c.remark", "c.username"))
+                kw_params = [pattern] * 5
+            else:
+                fields_or = f"m.rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?) OR {chat_fields}"
+                kw_params = [phrase, pattern, pattern]
             where_parts.append((f"NOT ({fields_or})" if neg else f"({fields_or})"))
-            params.extend([pattern] * 5)
+            params.extend(kw_params)
 
     where_sql = f"WHERE {' AND '.join(where_parts)}" if where_parts else ""
     count_sql = f"SELECT COUNT(*) FROM messages m LEFT JOIN chats c ON c.id = m.chat_id {where_sql}"
@@ -343,64 +810,604 @@ def search_messages_global(conn, query: str, chat_ids: list[str] | None = None,
     return {"total": total, "offset": offset, "messages": messages}
 
 
-def save_messages(conn, chat_id, messages):
-    insert_sql = '''
-        INSERT OR IGNORE INTO messages(
-            chat_id, msg_id, date, timestamp,
-            msg_file_name, user, sender_id, is_self, msg,
-            ori_height, ori_width, og_info, reactions, replies_num, msg_files, reply_to_msg_id, reply_to_top_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''
+_INSERT_MESSAGE_SQL = '''
+    INSERT OR IGNORE INTO messages(
+        chat_id, msg_id, date, timestamp,
+        msg_file_name, user, sender_id, is_self, msg,
+        ori_height, ori_width, og_info, reactions, replies_num, msg_files, reply_to_msg_id, reply_to_top_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
 
-    data = []
-    for m in messages:
-        og_info = json.dumps(m.get('og_info'), ensure_ascii=False) if m.get('og_info') else None
-        reactions = json.dumps(m.get('reactions'), ensure_ascii=False) if m.get('reactions') else None
-        msg_files = json.dumps(m.get('msg_files'), ensure_ascii=False) if m.get('msg_files') else None
-        try:
-            replies_num = int(m.get("replies_num") or 0)
-        except Exception:
-            replies_num = 0
-        try:
-            reply_to_msg_id = int(m.get("reply_to_msg_id") or 0)
-        except Exception:
-            reply_to_msg_id = 0
-        try:
-            reply_to_top_id = int(m.get("reply_to_top_id") or 0)
-        except Exception:
-            reply_to_top_id = 0
-        try:
-            is_self = int(m.get("is_self") or 0)
-        except Exception:
-            is_self = 0
 
-        data.append((
+def _int_or_zero(value) -> int:
+    if type(value) is int:
+        return value
+    try:
+        return int(value or 0)
+    except Exception:
+        return 0
+
+
+def _json_or_none(value) -> str | None:
+    # Empty dicts/lists are stored as NULL, so most rows never reach json.dumps.
+    return json.dumps(value, ensure_ascii=False) if value else None
+
+
+def message_row(chat_id: str, m: dict) -> tuple:
+    """The INSERT parameter tuple of one parsed message, in messages column order."""
+    return (
+        chat_id,
+        m["msg_id"],
+        m["date"],
+        m["timestamp"],
+        m["msg_file_name"],
+        m["user"],
+        m.get("sender_id"),
+        _int_or_zero(m.get("is_self")),
+        m["msg"],
+        m["ori_height"],
+        m["ori_width"],
+        _json_or_none(m.get("og_info")),
+        _json_or_none(m.get("reactions")),
+        _int_or_zero(m.get("replies_num")),
+        _json_or_none(m.get("msg_files")),
+        _int_or_zero(m.get("reply_to_msg_id")),
+        _int_or_zero(m.get("reply_to_top_id")),
+    )
+
+
+# Columns an upsert refreshes on stored messages, with their message_row index.
+_UPSERT_COLUMNS = (("msg", 8), ("reactions", 12), ("replies_num", 13), ("og_info", 11))
+
+
+def _stored_message_values(conn, chat_id: str, msg_ids: list[int]) -> dict[int, tuple]:
+    # msg_id -> (msg, reactions, replies_num, og_info, timestamp, msg_file_name, msg_files)
+    found: dict[int, tuple] = {}
+    msg_ids = list(dict.fromkeys(int(mid) for mid in msg_ids))
+    for i in range(0, len(msg_ids), _ID_CHUNK_SIZE):
+        chunk = msg_ids[i : i + _ID_CHUNK_SIZE]
+        placeholders = ",".join(["?"] * len(chunk))
+        for row in conn.execute(
+            f'''
+            SELECT msg_id, msg, reactions, replies_num, og_info, timestamp, msg_file_name, msg_files
+            FROM messages WHERE chat_id=? AND msg_id IN ({placeholders})
+            ''',
+            (chat_id, *chunk),
+        ):
+            found[int(row[0])] = tuple(row[1:])
+    return found
+
+
+def _update_changed_messages(conn, chat_id: str, rows: list[tuple], stored: dict[int, tuple]) -> int:
+    """Write the upsert columns that differ from the stored copy; returns how many messages changed."""
+    latest = {int(row[1]): row for row in rows}
+    updates: dict[tuple[str, ...], list[tuple]] = {}
+    with_replies = with_reactions = 0
+    reaction_items = []
+    og_items = []
+    for msg_id, row in latest.items():
+        old = stored[msg_id]
+        changed = tuple(
+            column
+            for pos, (column, index) in enumerate(_UPSERT_COLUMNS)
+            # og info only ever arrives from the enricher; an export carries None.
+            if row[index] != old[pos] and not (column == "og_info" and row[index] is None)
+        )
+        if not changed:
+            continue
+        updates.setdefault(changed, []).append(
+            tuple(row[index] for column, index in _UPSERT_COLUMNS if column in changed) + (chat_id, msg_id)
+        )
+        if "replies_num" in changed:
+            with_replies += int((row[13] or 0) > 0) - int((old[2] or 0) > 0)
+        if "reactions" in changed:
+            with_reactions += int(row[12] is not None) - int(old[1] is not None)
+            reaction_items.append((msg_id, old[4], row[12]))
+        if "msg" in changed and not old[3] and "og_info" not in changed:
+            url = _og_url(old[5], row[8], None, old[6])
+            if url:
+                og_items.append((msg_id, url))
+
+    for columns, params in updates.items():
+        assignments = ", ".join(f"{column}=?" for column in columns)
+        conn.executemany(f"UPDATE messages SET {assignments} WHERE chat_id=? AND msg_id=?", params)
+    if with_replies or with_reactions:
+        _add_chat_stats(conn, chat_id, with_replies=with_replies, with_reactions=with_reactions)
+    _replace_message_reactions(conn, chat_id, reaction_items)
+    _enqueue_og(conn, chat_id, og_items)
+    return sum(len(params) for params in updates.values())
+
+
+def _insert_message_rows(conn, chat_id: str, rows: list[tuple], upsert: bool = False) -> tuple[int, int]:
+    """Insert new rows; with ``upsert`` also refresh changed columns of stored ones.
+
+    Returns ``(inserted, updated)``.
+    """
+    if upsert:
+        stored = _stored_message_values(conn, chat_id, [row[1] for row in rows])
+        existing = set(stored)
+    else:
+        existing = _existing_msg_ids(conn, chat_id, [row[1] for row in rows])
+    # INSERT OR IGNORE keeps the first copy of a msg_id, so only rows whose id
+    # is neither stored yet nor repeated earlier in the batch count as new.
+    seen: set[int] = set()
+    new_rows = []
+    for row in rows:
+        msg_id = int(row[1])
+        if msg_id in existing or msg_id in seen:
+            continue
+        seen.add(msg_id)
+        new_rows.append(row)
+
+    updated = 0
+    if upsert and existing:
+        updated = _update_changed_messages(conn, chat_id, [row for row in rows if int(row[1]) in existing], stored)
+
+    # rowcount, unlike total_changes, leaves out rows written by the search triggers.
+    inserted = max(0, conn.executemany(_INSERT_MESSAGE_SQL, new_rows).rowcount) if new_rows else 0
+    if new_rows:
+        _add_chat_stats(
+            conn,
             chat_id,
-            m["msg_id"],
-            m["date"],
-            m["timestamp"],
-            m["msg_file_name"],
-            m["user"],
-            m.get("sender_id"),
-            is_self,
-            m["msg"],
-            m["ori_height"],
-            m["ori_width"],
-            og_info,
-            reactions,
-            replies_num,
-            msg_files,
-            reply_to_msg_id,
-            reply_to_top_id,
-        ))
+            total=len(new_rows),
+            with_replies=sum(1 for row in new_rows if row[13] > 0),
+            with_reactions=sum(1 for row in new_rows if row[12] is not None),
+            msg_ids=list(seen),
+            timestamps=[row[3] for row in new_rows if row[3] is not None],
+        )
+        _replace_message_reactions(
+            conn,
+            chat_id,
+            [(int(row[1]), row[3], row[12]) for row in new_rows if row[12] is not None],
+            replace=False,
+        )
+        og_links = [(int(row[1]), _og_link(row)) for row in new_rows]
+        _enqueue_og(conn, chat_id, [(msg_id, url) for msg_id, url in og_links if url])
+    if inserted or updated:
+        bump_data_version(conn, chat_id)
+    return inserted, updated
 
-    before = conn.total_changes
-    conn.executemany(insert_sql, data)
-    inserted = conn.total_changes - before
+
+def save_messages(conn, chat_id, messages, upsert: bool = False):
+    """Store parsed messages; returns how many were new.
+
+    With ``upsert`` the text, reactions, reply count and og info of messages
+    that are already stored are refreshed too, column by column.
+    """
+    inserted, _ = _insert_message_rows(conn, chat_id, [message_row(chat_id, m) for m in messages], upsert=upsert)
     conn.commit()
     return inserted
 
 
+def ingest_message_rows(
+    chat_id: str,
+    rows: Iterable[tuple],
+    chunk_size: int = 5000,
+    logger=None,
+    upsert: bool = False,
+) -> int:
+    """Insert ``message_row`` tuples from an iterator, one writer transaction per chunk.
+
+    Each chunk is committed on its own, so readers see progress and a failure
+    only loses the chunk in flight. ``upsert`` is passed on to save_messages'
+    row path. Returns the number of new messages.
+    """
+    chunk_size = max(1, int(chunk_size))
+    rows = iter(rows)
+    inserted = updated = total = 0
+    while True:
+        started = time.perf_counter()
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        with write_connection(chat_id) as conn:
+            chunk_inserted, chunk_updated = _insert_message_rows(conn, chat_id, chunk, upsert=upsert)
+        inserted += chunk_inserted
+        updated += chunk_updated
+        total += len(chunk)
+        if logger is not None:
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            logger.info(
+                f"Ingest chunk: rows={len(chunk)} new={chunk_inserted} updated={chunk_updated} total={total} "
+                f"rate={len(chunk) / elapsed:.0f} rows/s"
+            )
+    if logger is not None and upsert:
+        logger.info(f"Updated {updated} stored messages")
+    return inserted
+
+
+def _og_link(row: tuple) -> str | None:
+    return _og_url(row[4], row[8], row[11], row[14])
+
+
+def _og_url(msg_file_name, msg, og_info, msg_files) -> str | None:
+    # Only text messages without media and without og info yet get a preview.
+    if og_info or msg_file_name or msg_files or not msg:
+        return None
+    links = re.findall(r'(https?://\S+)', msg)
+    return links[0] if links else None
+
+
+def _enqueue_og(conn, chat_id: str, items: list[tuple[int, str]]) -> None:
+    if not items:
+        return
+    now = int(time.time())
+    conn.executemany(
+        "INSERT OR IGNORE INTO og_queue(chat_id, msg_id, url, attempts, next_attempt_at, enqueued_at) VALUES(?, ?, ?, 0, ?, ?)",
+        [(chat_id, msg_id, url, now, now) for msg_id, url in items],
+    )
+
+
+def claim_og_queue(conn, limit: int = 100) -> list[tuple[str, int, str, int]]:
+    """Return up to ``limit`` due og_queue entries as (chat_id, msg_id, url, attempts)."""
+    return [
+        (str(row[0]), int(row[1]), str(row[2]), int(row[3]))
+        for row in conn.execute(
+            '''
+            SELECT chat_id, msg_id, url, attempts FROM og_queue
+            WHERE next_attempt_at <= ?
+            ORDER BY next_attempt_at, enqueued_at
+            LIMIT ?
+            ''',
+            (int(time.time()), max(1, int(limit))),
+        ).fetchall()
+    ]
+
+
+def complete_og_queue(conn, results: list[tuple[str, int, dict | None, int | None, int | None]]) -> int:
+    """Store (chat_id, msg_id, og_info, ori_width, ori_height) results and drop their queue entries."""
+    if not results:
+        return 0
+    updated = conn.executemany(
+        "UPDATE messages SET og_info=?, ori_width=?, ori_height=? WHERE chat_id=? AND msg_id=?",
+        [
+            (json.dumps(og_info, ensure_ascii=False) if og_info else None, ori_width, ori_height, chat_id, msg_id)
+            for chat_id, msg_id, og_info, ori_width, ori_height in results
+        ],
+    ).rowcount
+    conn.executemany(
+        "DELETE FROM og_queue WHERE chat_id=? AND msg_id=?",
+        [(chat_id, msg_id) for chat_id, msg_id, *_ in results],
+    )
+    if updated:
+        bump_data_version(conn, *(chat_id for chat_id, *_ in results))
+    conn.commit()
+    return updated
+
+
+def defer_og_queue(conn, keys: list[tuple[str, int]], delay_seconds: int, max_attempts: int) -> None:
+    """Push failed entries back with exponential backoff, dropping those out of attempts."""
+    if not keys:
+        return
+    now = int(time.time())
+    conn.executemany(
+        '''
+        UPDATE og_queue
+        SET attempts = attempts + 1,
+            next_attempt_at = ? + ? * (1 << MIN(attempts, 10))
+        WHERE chat_id=? AND msg_id=?
+        ''',
+        [(now, int(delay_seconds), chat_id, msg_id) for chat_id, msg_id in keys],
+    )
+    conn.execute("DELETE FROM og_queue WHERE attempts >= ?", (int(max_attempts),))
+    conn.commit()
+
+
+def og_queue_size(conn) -> int:
+    return int(conn.execute("SELECT COUNT(*) FROM og_queue").fetchone()[0])
+
+
+_CHAT_STATS_SELECT = '''
+    SELECT
+        chat_id,
+        COUNT(*),
+        COUNT(CASE WHEN replies_num > 0 THEN 1 END),
+        COUNT(reactions),
+        MIN(msg_id),
+        MAX(msg_id),
+        MIN(timestamp),
+        MAX(timestamp),
+        ?
+    FROM messages
+'''
+_CHAT_STATS_COLUMNS = (
+    "chat_id", "total", "with_replies", "with_reactions",
+    "min_msg_id", "max_msg_id", "min_timestamp", "max_timestamp", "updated_at",
+)
+_ID_CHUNK_SIZE = 500
+
+
+def _existing_msg_ids(conn, chat_id: str, msg_ids: list[int]) -> set[int]:
+    found: set[int] = set()
+    msg_ids = list(dict.fromkeys(int(mid) for mid in msg_ids))
+    for i in range(0, len(msg_ids), _ID_CHUNK_SIZE):
+        chunk = msg_ids[i : i + _ID_CHUNK_SIZE]
+        placeholders = ",".join(["?"] * len(chunk))
+        rows = conn.execute(
+            f"SELECT msg_id FROM messages WHERE chat_id=? AND msg_id IN ({placeholders})",
+            (chat_id, *chunk),
+        ).fetchall()
+        found.update(int(row[0]) for row in rows)
+    return found
+
+
+def _add_chat_stats(
+    conn,
+    chat_id: str,
+    total: int = 0,
+    with_replies: int = 0,
+    with_reactions: int = 0,
+    msg_ids: list[int] | None = None,
+    timestamps: list[int] | None = None,
+) -> None:
+    # Upsert a delta into chat_stats; min/max only ever widen here, shrinking
+    # after deletes is handled by _refresh_chat_stats_bounds.
+    msg_ids = msg_ids or []
+    timestamps = timestamps or []
+    conn.execute(
+        '''
+        INSERT INTO chat_stats(
+            chat_id, total, with_replies, with_reactions,
+            min_msg_id, max_msg_id, min_timestamp, max_timestamp, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            total = total + excluded.total,
+            with_replies = with_replies + excluded.with_replies,
+            with_reactions = with_reactions + excluded.with_reactions,
+            min_msg_id = MIN(COALESCE(min_msg_id, excluded.min_msg_id), COALESCE(excluded.min_msg_id, min_msg_id)),
+            max_msg_id = MAX(COALESCE(max_msg_id, excluded.max_msg_id), COALESCE(excluded.max_msg_id, max_msg_id)),
+            min_timestamp = MIN(COALESCE(min_timestamp, excluded.min_timestamp), COALESCE(excluded.min_timestamp, min_timestamp)),
+            max_timestamp = MAX(COALESCE(max_timestamp, excluded.max_timestamp), COALESCE(excluded.max_timestamp, max_timestamp)),
+            updated_at = excluded.updated_at
+    ''',
+        (
+            chat_id,
+            int(total),
+            int(with_replies),
+            int(with_reactions),
+            min(msg_ids) if msg_ids else None,
+            max(msg_ids) if msg_ids else None,
+            min(timestamps) if timestamps else None,
+            max(timestamps) if timestamps else None,
+            int(time.time()),
+        ),
+    )
+
+
+def _refresh_chat_stats_bounds(conn, chat_id: str) -> None:
+    # Each subquery is a single MIN/MAX over an index prefix, so this stays a
+    # handful of b-tree probes regardless of chat size.
+    conn.execute(
+        '''
+        UPDATE chat_stats SET
+            min_msg_id = (SELECT MIN(msg_id) FROM messages WHERE chat_id=?1),
+            max_msg_id = (SELECT MAX(msg_id) FROM messages WHERE chat_id=?1),
+            min_timestamp = (SELECT MIN(timestamp) FROM messages WHERE chat_id=?1),
+            max_timestamp = (SELECT MAX(timestamp) FROM messages WHERE chat_id=?1)
+        WHERE chat_id=?1
+    ''',
+        (chat_id,),
+    )
+
+
+def get_chat_stats(conn, chat_id: str) -> dict:
+    """Return the materialized counters of a chat (all zero/None when it has no messages)."""
+    row = conn.execute(
+        f"SELECT {', '.join(_CHAT_STATS_COLUMNS)} FROM chat_stats WHERE chat_id=?",
+        (str(chat_id),),
+    ).fetchone()
+    if not row:
+        return {"chat_id": str(chat_id), "total": 0, "with_replies": 0, "with_reactions": 0,
+                "min_msg_id": None, "max_msg_id": None, "min_timestamp": None, "max_timestamp": None,
+                "updated_at": 0}
+    return dict(zip(_CHAT_STATS_COLUMNS, tuple(row)))
+
+
+def rebuild_chat_stats(conn, chat_id: str | None = None) -> list[str]:
+    """Recount chat_stats from messages and return the chat ids whose counters had drifted.
+
+    Rebuilds every chat when ``chat_id`` is None.
+    """
+    compare = ("total", "with_replies", "with_reactions", "min_msg_id", "max_msg_id", "min_timestamp", "max_timestamp")
+    where, params = ("WHERE chat_id=?", (str(chat_id),)) if chat_id is not None else ("", ())
+    stored = {
+        row[0]: dict(zip(_CHAT_STATS_COLUMNS, tuple(row)))
+        for row in conn.execute(f"SELECT {', '.join(_CHAT_STATS_COLUMNS)} FROM chat_stats {where}", params)
+    }
+    fresh = {
+        row[0]: dict(zip(_CHAT_STATS_COLUMNS, tuple(row)))
+        for row in conn.execute(f"{_CHAT_STATS_SELECT} {where} GROUP BY chat_id", (int(time.time()), *params))
+    }
+
+    drifted = []
+    for cid in sorted(set(stored) | set(fresh)):
+        old, new = stored.get(cid), fresh.get(cid)
+        if old is None or new is None or any(old[k] != new[k] for k in compare):
+            drifted.append(cid)
+
+    conn.execute(f"DELETE FROM chat_stats {where}", params)
+    conn.executemany(
+        f"INSERT INTO chat_stats({', '.join(_CHAT_STATS_COLUMNS)}) VALUES ({', '.join(['?'] * len(_CHAT_STATS_COLUMNS))})",
+        [tuple(row[k] for k in _CHAT_STATS_COLUMNS) for row in fresh.values()],
+    )
+    if drifted:
+        bump_data_version(conn, *drifted)
+    conn.commit()
+    return drifted
+
+
+def delete_messages(conn, chat_id: str, msg_ids: list[int]) -> int:
+    """Delete messages of a chat by msg_id, keeping chat_stats in step."""
+    msg_ids = list(dict.fromkeys(int(mid) for mid in msg_ids))
+    if not msg_ids:
+        return 0
+
+    deleted = with_replies = with_reactions = 0
+    for i in range(0, len(msg_ids), _ID_CHUNK_SIZE):
+        chunk = msg_ids[i : i + _ID_CHUNK_SIZE]
+        placeholders = ",".join(["?"] * len(chunk))
+        where = f"chat_id=? AND msg_id IN ({placeholders})"
+        row = conn.execute(
+            f"SELECT COUNT(*), COUNT(CASE WHEN replies_num > 0 THEN 1 END), COUNT(reactions) FROM messages WHERE {where}",
+            (chat_id, *chunk),
+        ).fetchone()
+        conn.execute(f"DELETE FROM messages WHERE {where}", (chat_id, *chunk))
+        conn.execute(f"DELETE FROM og_queue WHERE {where}", (chat_id, *chunk))
+        _replace_message_reactions(conn, chat_id, [(mid, None, None) for mid in chunk])
+        deleted += int(row[0])
+        with_replies += int(row[1])
+        with_reactions += int(row[2])
+
+    if deleted:
+        _add_chat_stats(conn, chat_id, total=-deleted, with_replies=-with_replies, with_reactions=-with_reactions)
+        _refresh_chat_stats_bounds(conn, chat_id)
+        bump_data_version(conn, chat_id)
+    conn.commit()
+    return deleted
+
+
+def _parse_reactions_blob(blob):
+    if not blob:
+        return None
+    if isinstance(blob, dict):
+        return blob
+    try:
+        return json.loads(blob)
+    except Exception:
+        return None
+
+
+def _iter_reaction_emoticon_counts(reactions_obj):
+    if not isinstance(reactions_obj, dict):
+        return
+    results = reactions_obj.get("Results") or []
+    if not isinstance(results, list):
+        return
+
+    for entry in results:
+        if not isinstance(entry, dict):
+            continue
+        reaction = entry.get("Reaction") or {}
+        if not isinstance(reaction, dict):
+            continue
+        emoticon = reaction.get("Emoticon")
+        if not emoticon:
+            continue
+
+        count = entry.get("Count", 0)
+        try:
+            count = int(count)
+        except Exception:
+            count = 0
+        yield emoticon, max(count, 0)
+
+
+def _reaction_counts(reactions) -> dict[str, tuple[int, int]]:
+    """emoticon -> (ranking count, total) for every emoticon the reactions list.
+
+    A message is ranked by the first entry of an emoticon, while the chat
+    totals add up every entry, zero counts and repeats included.
+    """
+    counts: dict[str, tuple[int, int]] = {}
+    for emoticon, count in _iter_reaction_emoticon_counts(_parse_reactions_blob(reactions)):
+        first, total = counts.get(emoticon, (count, 0))
+        counts[emoticon] = (first, total + count)
+    return counts
+
+
+def _replace_message_reactions(conn, chat_id: str, items: list[tuple[int, int | None, object]], replace: bool = True) -> None:
+    """Sync message_reactions and reaction_totals for ``(msg_id, timestamp, reactions)`` items.
+
+    A None reactions value only removes the message's rows. Pass replace=False
+    when the messages are known to be new, which skips reading old rows.
+    """
+    if not items:
+        return
+    # emoticon -> [total, ranked messages, listing messages]
+    deltas: dict[str, list[int]] = {}
+
+    if replace:
+        msg_ids = list(dict.fromkeys(int(item[0]) for item in items))
+        for i in range(0, len(msg_ids), _ID_CHUNK_SIZE):
+            chunk = msg_ids[i : i + _ID_CHUNK_SIZE]
+            placeholders = ",".join(["?"] * len(chunk))
+            where = f"chat_id=? AND msg_id IN ({placeholders})"
+            for emoticon, count, total in conn.execute(
+                f"SELECT emoticon, count, total FROM message_reactions WHERE {where}", (chat_id, *chunk)
+            ):
+                delta = deltas.setdefault(emoticon, [0, 0, 0])
+                delta[0] -= int(total)
+                delta[1] -= int(count) > 0
+                delta[2] -= 1
+            conn.execute(f"DELETE FROM message_reactions WHERE {where}", (chat_id, *chunk))
+
+    rows = []
+    latest = {int(item[0]): item for item in items}
+    for msg_id, timestamp, reactions in latest.values():
+        for emoticon, (count, total) in _reaction_counts(reactions).items():
+            rows.append((chat_id, msg_id, emoticon, count, int(timestamp or 0), total))
+            delta = deltas.setdefault(emoticon, [0, 0, 0])
+            delta[0] += total
+            delta[1] += count > 0
+            delta[2] += 1
+    if rows:
+        conn.executemany(
+            "INSERT OR REPLACE INTO message_reactions(chat_id, msg_id, emoticon, count, timestamp, total) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    changed = [(chat_id, emoticon, *delta) for emoticon, delta in deltas.items() if any(delta)]
+    if changed:
+        conn.executemany(
+            '''
+            INSERT INTO reaction_totals(chat_id, emoticon, total, messages, listed) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, emoticon) DO UPDATE SET
+                total = total + excluded.total,
+                messages = messages + excluded.messages,
+                listed = listed + excluded.listed
+        ''',
+            changed,
+        )
+        conn.execute("DELETE FROM reaction_totals WHERE chat_id=? AND listed <= 0", (chat_id,))
+
+
+def rebuild_message_reactions(conn, chat_id: str | None = None, commit: bool = True) -> int:
+    """Re-derive message_reactions and reaction_totals from the messages' reactions JSON.
+
+    Rebuilds every chat when ``chat_id`` is None and returns the number of
+    reaction rows written.
+    """
+    where, params = ("WHERE chat_id=?", (str(chat_id),)) if chat_id is not None else ("", ())
+    conn.execute(f"DELETE FROM message_reactions {where}", params)
+    conn.execute(f"DELETE FROM reaction_totals {where}", params)
+
+    and_where = "AND chat_id=?" if chat_id is not None else ""
+    rows = []
+    for cid, msg_id, timestamp, reactions in conn.execute(
+        f"SELECT chat_id, msg_id, timestamp, reactions FROM messages WHERE reactions IS NOT NULL {and_where}",
+        params,
+    ).fetchall():
+        for emoticon, (count, total) in _reaction_counts(reactions).items():
+            rows.append((cid, int(msg_id), emoticon, count, int(timestamp or 0), total))
+    conn.executemany(
+        "INSERT INTO message_reactions(chat_id, msg_id, emoticon, count, timestamp, total) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.execute(
+        f'''
+        INSERT INTO reaction_totals(chat_id, emoticon, total, messages, listed)
+        SELECT chat_id, emoticon, SUM(total), SUM(count > 0), COUNT(*) FROM message_reactions {where}
+        GROUP BY chat_id, emoticon
+    ''',
+        params,
+    )
+    bump_data_version(conn, str(chat_id) if chat_id is not None else GLOBAL_DATA_VERSION)
+    if commit:
+        conn.commit()
+    return len(rows)
+
+
 def _meta_get(conn, key: str):
     chat_scope = _conn_chat_scope(conn)
     row = conn.execute("SELECT value FROM meta WHERE chat_id=? AND key=?", (chat_scope, key)).fetchone()
@@ -457,6 +1464,83 @@ def set_og_cache(conn: sqlite3.Connection, url: str, value: dict | None) -> None
     conn.commit()
 
 
+def get_og_cache_many(conn: sqlite3.Connection, urls: list[str]) -> dict[str, dict]:
+    """Batch form of get_og_cache; urls without a cache entry are left out of the result."""
+    found: dict[str, dict] = {}
+    urls = list(dict.fromkeys(str(url or '').strip() for url in urls))
+    for i in range(0, len(urls), _ID_CHUNK_SIZE):
+        chunk = urls[i : i + _ID_CHUNK_SIZE]
+        placeholders = ",".join(["?"] * len(chunk))
+        for url, raw in conn.execute(f"SELECT url, value FROM og_cache WHERE url IN ({placeholders})", chunk):
+            try:
+                found[url] = json.loads(raw) if raw else {}
+            except Exception:
+                found[url] = {}
+    return found
+
+
+def set_og_cache_many(conn: sqlite3.Connection, values: dict[str, dict | None]) -> None:
+    now = int(time.time())
+    conn.executemany(
+        "INSERT OR REPLACE INTO og_cache(url, value, updated_at) VALUES(?, ?, ?)",
+        [(str(url or '').strip(), json.dumps(value or {}, ensure_ascii=False), now) for url, value in values.items()],
+    )
+    conn.commit()
+
+
+def get_link_status_many(
+    conn: sqlite3.Connection,
+    items: list[tuple[str, str]],
+    alive_ttl: int,
+    stale_ttl: int,
+) -> dict[tuple[str, str], bool]:
+    """Return the cached stale flag of (provider, link) pairs still within their TTL.
+
+    Alive results expire after ``alive_ttl`` seconds and stale ones after
+    ``stale_ttl``; expired, failed and unknown pairs are left out.
+    """
+    items = list(dict.fromkeys(items))
+    now = int(time.time())
+    found: dict[tuple[str, str], bool] = {}
+    for i in range(0, len(items), _ID_CHUNK_SIZE):
+        chunk = items[i : i + _ID_CHUNK_SIZE]
+        placeholders = ",".join(["(?, ?)"] * len(chunk))
+        rows = conn.execute(
+            f'''
+            SELECT provider, link, stale FROM link_status
+            WHERE (provider, link) IN (VALUES {placeholders})
+              AND stale IS NOT NULL
+              AND checked_at >= ? - CASE WHEN stale THEN ? ELSE ? END
+            ''',
+            (*[value for item in chunk for value in item], now, int(stale_ttl), int(alive_ttl)),
+        ).fetchall()
+        found.update({(str(row[0]), str(row[1])): bool(row[2]) for row in rows})
+    return found
+
+
+def set_link_status_many(conn: sqlite3.Connection, results: dict[tuple[str, str], bool | None]) -> None:
+    """Record check results; None marks a failed check and only bumps error_count."""
+    now = int(time.time())
+    checked = [(provider, link, int(stale), now) for (provider, link), stale in results.items() if stale is not None]
+    failed = [(provider, link) for (provider, link), stale in results.items() if stale is None]
+    conn.executemany(
+        '''
+        INSERT INTO link_status(provider, link, stale, checked_at, error_count) VALUES(?, ?, ?, ?, 0)
+        ON CONFLICT(provider, link) DO UPDATE SET
+            stale=excluded.stale, checked_at=excluded.checked_at, error_count=0
+        ''',
+        checked,
+    )
+    conn.executemany(
+        '''
+        INSERT INTO link_status(provider, link, stale, checked_at, error_count) VALUES(?, ?, NULL, 0, 1)
+        ON CONFLICT(provider, link) DO UPDATE SET error_count=error_count + 1
+        ''',
+        failed,
+    )
+    conn.commit()
+
+
 def get_last_export_time(conn):
     return _meta_get(conn, 'last_export_time')
 
@@ -465,6 +1549,14 @@ def set_last_export_time(conn, value):
     _meta_set(conn, 'last_export_time', value)
 
 
+def get_reactions_sweep_time(conn):
+    return _meta_get(conn, 'reactions_sweep_time')
+
+
+def set_reactions_sweep_time(conn, value):
+    _meta_set(conn, 'reactions_sweep_time', value)
+
+
 def get_exported_time(conn):
     return _meta_get(conn, 'exported_time')
 
@@ -517,13 +1609,38 @@ def update_reactions(conn, chat_id: str, reactions_by_msg_id: list[tuple[int, di
             return None
         return json.dumps(reactions_obj, ensure_ascii=False)
 
-    update_sql = "UPDATE messages SET reactions=? WHERE chat_id=? AND msg_id=?"
-    data = [(_normalize(obj), chat_id, int(msg_id)) for msg_id, obj in reactions_by_msg_id if msg_id is not None]
-    if not data:
+    # Unchanged reactions are skipped, so a refresh that finds nothing new
+    # leaves the chat's data_version (and its ETags) alone.
+    update_sql = "UPDATE messages SET reactions=? WHERE chat_id=? AND msg_id=? AND reactions IS NOT ?"
+    final_reactions = {int(msg_id): _normalize(obj) for msg_id, obj in reactions_by_msg_id if msg_id is not None}
+    if not final_reactions:
         return 0
 
-    before = conn.total_changes
-    conn.executemany(update_sql, data)
-    changed = conn.total_changes - before
+    stored: dict[int, str | None] = {}
+    timestamps: dict[int, int] = {}
+    msg_ids = list(final_reactions)
+    for i in range(0, len(msg_ids), _ID_CHUNK_SIZE):
+        chunk = msg_ids[i : i + _ID_CHUNK_SIZE]
+        placeholders = ",".join(["?"] * len(chunk))
+        for mid, reactions, timestamp in conn.execute(
+            f"SELECT msg_id, reactions, timestamp FROM messages WHERE chat_id=? AND msg_id IN ({placeholders})",
+            (chat_id, *chunk),
+        ):
+            stored[int(mid)] = reactions
+            timestamps[int(mid)] = timestamp
+
+    changed_ids = [mid for mid, reactions in stored.items() if reactions != final_reactions[mid]]
+    if not changed_ids:
+        return 0
+    changed = conn.executemany(update_sql, [(final_reactions[mid], chat_id, mid, final_reactions[mid]) for mid in changed_ids]).rowcount
+    # Compare stored vs incoming NULL-ness so with_reactions moves by the net delta.
+    delta = sum(int(final_reactions[mid] is not None) - int(stored[mid] is not None) for mid in changed_ids)
+    if delta:
+        _add_chat_stats(conn, chat_id, with_reactions=delta)
+    _replace_message_reactions(
+        conn, chat_id, [(mid, timestamps[mid], final_reactions[mid]) for mid in changed_ids]
+    )
+    if changed:
+        bump_data_version(conn, chat_id)
     conn.commit()
     return changed
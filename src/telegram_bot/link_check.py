@@ -0,0 +1,195 @@
+"""Concurrent stale checks for cloud-drive share links.
+
+Every provider (Baidu, Quark, Ali, Xunlei) gets its own token-bucket rate
+limiter and concurrency cap, so checks for different providers overlap while
+each provider is still queried at a polite pace. Limits are read from
+``LINK_CHECK_<PROVIDER>_RATE`` (checks per second) and
+``LINK_CHECK_<PROVIDER>_CONCURRENCY``.
+
+Results are kept in the link_status table for ``LINK_STATUS_ALIVE_TTL_SECONDS``
+(alive links) or ``LINK_STATUS_STALE_TTL_SECONDS`` (stale links), so ingest and
+the cleanup worker only go to the network for unknown or expired links.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from bdpan import BaiduPanClient, BaiduPanConfig
+
+from .db_utils import get_app_connection, get_link_status_many, set_link_status_many, write_connection
+from .message_utils import is_ali_link_stale, is_quark_link_stale
+from .project_logger import get_logger
+from .xunlei_cipher import is_xunlei_link_stale
+
+PROVIDERS = ("baidu", "quark", "ali", "xunlei")
+
+LINK_STATUS_ALIVE_TTL_SECONDS = int(os.getenv("LINK_STATUS_ALIVE_TTL_SECONDS", str(24 * 3600)))
+LINK_STATUS_STALE_TTL_SECONDS = int(os.getenv("LINK_STATUS_STALE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+_DEFAULT_LIMITS = {
+    "baidu": (2.0, 2),
+    "quark": (2.0, 2),
+    "ali": (2.0, 2),
+    # Every Xunlei check also registers a device and solves a captcha.
+    "xunlei": (1.0, 1),
+}
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class _ProviderLimiter:
+    def __init__(self, rate: float, concurrency: int):
+        self.bucket = _TokenBucket(rate, concurrency)
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+
+
+def _provider_limits(provider: str) -> tuple[float, int]:
+    rate, concurrency = _DEFAULT_LIMITS[provider]
+    key = provider.upper()
+    rate = float(os.getenv(f"LINK_CHECK_{key}_RATE", str(rate)))
+    concurrency = int(os.getenv(f"LINK_CHECK_{key}_CONCURRENCY", str(concurrency)))
+    return rate, max(1, concurrency)
+
+
+_limiters = {provider: _ProviderLimiter(*_provider_limits(provider)) for provider in PROVIDERS}
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+_bdpan: BaiduPanClient | None = None
+_bdpan_lock = threading.Lock()
+
+
+def _get_executor(provider: str) -> ThreadPoolExecutor:
+    # One pool per provider, so a long queue for one provider never holds up
+    # the threads another provider could be using.
+    with _executors_lock:
+        executor = _executors.get(provider)
+        if executor is None:
+            executor = _executors[provider] = ThreadPoolExecutor(
+                max_workers=_provider_limits(provider)[1],
+                thread_name_prefix=f"link-check-{provider}",
+            )
+        return executor
+
+
+def get_bdpan_client() -> BaiduPanClient:
+    """Return the process-wide Baidu client (its HTTP sessions are per thread)."""
+    global _bdpan
+    with _bdpan_lock:
+        if _bdpan is None:
+            _bdpan = BaiduPanClient(config=BaiduPanConfig(cookie_file="auth/cookies.txt"))
+        return _bdpan
+
+
+def link_provider(link: str, providers: Iterable[str] = PROVIDERS, *, bdpan=None) -> str | None:
+    """Return the provider of a supported share link, or None."""
+    if not link:
+        return None
+    providers = set(providers)
+
+    if "baidu" in providers:
+        try:
+            if (bdpan or get_bdpan_client()).is_share_link(link):
+                return "baidu"
+        except Exception:
+            pass
+
+    if "quark" in providers and link.startswith("https://pan.quark.cn/s/"):
+        return "quark"
+
+    if "ali" in providers and (
+        link.startswith("https://www.alipan.com/s/") or link.startswith("https://www.aliyundrive.com/s/")
+    ):
+        return "ali"
+
+    if "xunlei" in providers and link.startswith("https://pan.xunlei.com/s/"):
+        return "xunlei"
+
+    return None
+
+
+def check_link(provider: str, link: str) -> bool:
+    """Return whether ``link`` is stale, waiting for the provider's rate limiter."""
+    limiter = _limiters[provider]
+    with limiter.slots:
+        limiter.bucket.acquire()
+        if provider == "baidu":
+            return bool(get_bdpan_client().is_link_stale(link))
+        if provider == "quark":
+            return bool(is_quark_link_stale(link))
+        if provider == "ali":
+            return bool(is_ali_link_stale(link))
+        if provider == "xunlei":
+            return bool(is_xunlei_link_stale(link))
+    return False
+
+
+def _check_link_safe(provider: str, link: str) -> bool | None:
+    try:
+        return check_link(provider, link)
+    except Exception as e:
+        get_logger().exception(f"link check failed: provider={provider} link={link} error={e}")
+        return None
+
+
+def cached_link_status(items: Iterable[tuple[str, str]]) -> dict[tuple[str, str], bool]:
+    """Return the stale flags of the pairs whose link_status entry is still fresh."""
+    conn = get_app_connection()
+    try:
+        return get_link_status_many(conn, list(items), LINK_STATUS_ALIVE_TTL_SECONDS, LINK_STATUS_STALE_TTL_SECONDS)
+    finally:
+        conn.close()
+
+
+def record_link_status(results: dict[tuple[str, str], bool | None]) -> None:
+    if results:
+        with write_connection() as writer:
+            set_link_status_many(writer, results)
+
+
+def check_links(items: Iterable[tuple[str, str]]) -> dict[tuple[str, str], bool | None]:
+    """Check many (provider, link) pairs concurrently.
+
+    Repeated pairs are checked once and fresh link_status entries are used as
+    is. The result maps each pair to whether it is stale, or None when the
+    check failed.
+    """
+    items = list(dict.fromkeys(items))
+    if not items:
+        return {}
+    results: dict[tuple[str, str], bool | None] = dict(cached_link_status(items))
+    futures = {
+        item: _get_executor(item[0]).submit(_check_link_safe, *item)
+        for item in items
+        if item not in results
+    }
+    checked = {item: future.result() for item, future in futures.items()}
+    record_link_status(checked)
+    results.update(checked)
+    return results
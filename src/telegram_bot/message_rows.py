@@ -0,0 +1,197 @@
+"""Shared SELECT and row decoding for the message endpoints.
+
+Every message endpoint returns messages together with the message they reply
+to. ``select_messages_sql`` builds that query (the message columns followed by
+the same columns of the replied-to message, in ``MESSAGE_COLUMNS`` order) and
+``MessageDecoder`` turns its rows into response dicts by column position.
+A decoder built with a ``fields`` subset leaves the other columns out and
+does not parse their JSON.
+
+With ``raw_json`` the stored og_info/reactions/msg_files text is not parsed at
+all: it is wrapped as raw JSON and ``dumps_json`` splices it into the output
+unchanged. The query turns malformed JSON text into NULL, as json.loads
+failures used to. orjson is used when installed (its Fragment type when available),
+the standard json module otherwise.
+"""
+
+from __future__ import annotations
+
+import json
+from operator import itemgetter
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+MESSAGE_COLUMNS = (
+    "chat_id",
+    "msg_id",
+    "date",
+    "timestamp",
+    "msg_file_name",
+    "user",
+    "sender_id",
+    "is_self",
+    "msg",
+    "ori_height",
+    "ori_width",
+    "og_info",
+    "reactions",
+    "replies_num",
+    "msg_files",
+    "reply_to_msg_id",
+    "reply_to_top_id",
+)
+JSON_COLUMNS = frozenset(("og_info", "reactions", "msg_files"))
+# Always returned: the client keys messages on them.
+_REQUIRED_COLUMNS = ("chat_id", "msg_id")
+_INT_COLUMNS = ("replies_num", "reply_to_top_id", "is_self")
+
+_WIDTH = len(MESSAGE_COLUMNS)
+_COLUMN_INDEX = {name: index for index, name in enumerate(MESSAGE_COLUMNS)}
+_REPLY_MSG_ID = _WIDTH + _COLUMN_INDEX["msg_id"]
+_SENDER_ID = _COLUMN_INDEX["sender_id"]
+_IS_SELF = _COLUMN_INDEX["is_self"]
+
+
+
+def _column_sql(alias: str, name: str) -> str:
+    # Malformed stored JSON (e.g. written by /execute_sql) reads as NULL, so raw
+    # passthrough never splices invalid text into a page.
+    if name in JSON_COLUMNS:
+        return f"CASE WHEN json_valid({alias}.{name}) THEN {alias}.{name} END"
+    return f"{alias}.{name}"
+
+
+_PROJECTION = ",\n    ".join([_column_sql("m", name) for name in MESSAGE_COLUMNS] + [_column_sql("r", name) for name in MESSAGE_COLUMNS])
+_REPLY_JOIN = """LEFT JOIN messages r
+    ON r.chat_id = m.chat_id AND r.msg_id = (
+        CASE
+            WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
+            ELSE COALESCE(m.reply_to_top_id, 0)
+        END
+    )"""
+
+
+def select_messages_sql(where_sql: str, order_sql: str = "", page_sql: str = "", from_sql: str = "messages m") -> str:
+    """SELECT messages ``m`` joined with their replied-to message ``r``.
+
+    ``from_sql`` may prepend joins (e.g. the search index) before ``messages m``.
+    """
+    return f"SELECT\n    {_PROJECTION}\nFROM {from_sql}\n{_REPLY_JOIN}\nWHERE {where_sql}\n{order_sql}\n{page_sql}"
+
+
+def parse_fields(fields: str | None) -> frozenset[str] | None:
+    """Parse a comma-separated ``fields`` query parameter; None means all columns."""
+    if not fields:
+        return None
+    wanted = {name.strip() for name in fields.split(",")} & set(MESSAGE_COLUMNS)
+    return frozenset(wanted.union(_REQUIRED_COLUMNS))
+
+
+def _int_or_zero(value) -> int:
+    if type(value) is int:
+        return value
+    try:
+        return int(value or 0)
+    except Exception:
+        return 0
+
+
+class RawJSON:
+    """Already-encoded JSON text, written out as is by dumps_json."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+_Fragment = getattr(orjson, "Fragment", None)
+# select_messages_sql only returns JSON column text that json_valid() accepts.
+_raw = _Fragment or RawJSON
+
+
+def _dumps_plain(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _dumps_spliced(obj) -> bytes:
+    if isinstance(obj, RawJSON):
+        return obj.text.encode("utf-8")
+    if isinstance(obj, list):
+        return b"[" + b",".join(_dumps_spliced(value) for value in obj) + b"]"
+    if isinstance(obj, dict):
+        # Plain values go through one encoder call; raw and nested values are appended after it.
+        plain, special = {}, []
+        for key, value in obj.items():
+            if isinstance(value, (RawJSON, list, dict)):
+                special.append((key, value))
+            else:
+                plain[key] = value
+        encoded = _dumps_plain(plain)
+        if not special:
+            return encoded
+        parts = [_dumps_plain(str(key)) + b":" + _dumps_spliced(value) for key, value in special]
+        return encoded[:-1] + (b"," if plain else b"") + b",".join(parts) + b"}"
+    return _dumps_plain(obj)
+
+
+def dumps_json(obj) -> bytes:
+    """Serialize a response payload, splicing RawJSON values in without re-encoding."""
+    if _Fragment is not None:
+        return orjson.dumps(obj)
+    return _dumps_spliced(obj)
+
+
+def _loads_or_none(value):
+    try:
+        return json.loads(value)
+    except Exception:
+        return None
+
+
+class MessageDecoder:
+    """Decode ``select_messages_sql`` rows (tuples or sqlite3.Row) into message dicts."""
+
+    __slots__ = ("names", "_getter", "_reply_getter", "_json", "_ints", "_sender", "_user", "_decode_json")
+
+    def __init__(self, fields: frozenset[str] | None = None, raw_json: bool = False):
+        self.names = tuple(name for name in MESSAGE_COLUMNS if fields is None or name in fields)
+        indexes = [_COLUMN_INDEX[name] for name in self.names]
+        self._getter = itemgetter(*indexes)
+        self._reply_getter = itemgetter(*(_WIDTH + index for index in indexes))
+        self._json = tuple(name for name in self.names if name in JSON_COLUMNS)
+        self._ints = tuple(name for name in self.names if name in _INT_COLUMNS)
+        self._sender = "sender_id" in self.names
+        self._user = "user" in self.names
+        self._decode_json = _raw if raw_json else _loads_or_none
+
+    def _build(self, values: tuple, is_self, sender_id) -> dict:
+        item = dict(zip(self.names, values))
+        for name in self._json:
+            if item[name]:
+                item[name] = self._decode_json(item[name])
+        for name in self._ints:
+            item[name] = _int_or_zero(item[name])
+        if self._sender and item["sender_id"] is None:
+            item["sender_id"] = ""
+        if self._user and item["user"] in (None, "") and sender_id:
+            item["user"] = "我" if _int_or_zero(is_self) else sender_id
+        return item
+
+    def decode(self, row) -> dict:
+        """The message of one row, with ``reply_message`` when it replies to a stored message."""
+        item = self._build(self._getter(row), row[_IS_SELF], row[_SENDER_ID])
+        if row[_REPLY_MSG_ID] is not None:
+            item["reply_message"] = self._build(
+                self._reply_getter(row), row[_WIDTH + _IS_SELF], row[_WIDTH + _SENDER_ID]
+            )
+        return item
+
+    def decode_rows(self, rows) -> list[dict]:
+        decode = self.decode
+        return [decode(row) for row in rows]
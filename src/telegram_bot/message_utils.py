@@ -2,19 +2,102 @@
 
 import json
 from datetime import datetime
-from typing import List, Dict, Any
-from bdpan import BaiduPanClient, BaiduPanConfig
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator
 import re
 
-from .xunlei_cipher import is_xunlei_link_stale
 from .http_client import post as http_post
-from .db_utils import get_me_id as _get_me_id_from_db
+from .db_utils import get_me_id as _get_me_id_from_db, message_row
 
 def load_json(file_path: str) -> dict:
     """Load JSON data from a file."""
     with open(file_path, "r", encoding="utf-8") as infile:
         return json.load(infile)
 
+_JSON_WHITESPACE = " \t\r\n"
+
+class _JsonStream:
+    """Minimal pull reader that decodes one JSON value at a time from a text file."""
+
+    def __init__(self, infile, chunk_size: int):
+        self._infile = infile
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._infile.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _JSON_WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"Malformed JSON: expected one of {chars!r}, got {ch or 'EOF'!r}")
+        self._pos += 1
+        return ch
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # The value may simply be cut off at the end of the buffer.
+                if self._fill():
+                    continue
+                raise
+            if end == len(self._buf) and self._fill():
+                # A number ending exactly at the buffer edge may continue.
+                continue
+            self._pos = end
+            return obj
+
+def iter_json_array(file_path: str, key: str = "messages", chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Yield the items of the top-level ``key`` array of a JSON object file.
+
+    Only the current item and one read-ahead chunk are held in memory, so a
+    tdl export of any size is consumed with a flat memory profile.
+    """
+    with open(file_path, "r", encoding="utf-8") as infile:
+        stream = _JsonStream(infile, chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            name = stream.value()
+            stream.expect(":")
+            if name == key and stream.peek() == "[":
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        yield stream.value()
+                        if stream.expect(",]") == "]":
+                            break
+            else:
+                stream.value()
+            if stream.expect(",}") == "}":
+                return
+
 def load_me_id() -> str:
     """Load the user's own Telegram ID from the app database."""
     try:
@@ -82,165 +165,173 @@ def is_ali_link_stale(link: str) -> bool:
         print(f"Error checking ali link: {e}")
     return False
 
-def parse_messages(chat_id: str, raw_messages: List[dict], tz, remark: str | None = None) -> List[Dict[str, Any]]:
+def _parse_raw_message(chat_id: str, raw_message: dict, tz, me_id: str) -> tuple[Dict[str, Any], Any]:
+    msg_text = raw_message.get("text", "")
+    msg_id = raw_message.get("id", None)
+    msg_file = raw_message.get("file", "")
+    msg_file_name = f'downloads/{chat_id}/{chat_id}_{msg_id}_{msg_file}' if msg_file else ""
+    og_info = raw_message.get("og_info")  # may be injected later
+    timestamp = raw_message.get("date", 0)
+    date = convert_timestamp_to_date(timestamp, tz)
+    raw_data = raw_message.get("raw", {}) or {}
+    from_id = raw_data.get("FromID") or {}
+    user_id = from_id.get('UserID', '') if isinstance(from_id, dict) else ''
+    reply_to_msg_id = (raw_data.get('ReplyTo') or {}).get('ReplyToMsgID', 0)
+    reply_to_top_id = (raw_data.get('ReplyTo') or {}).get('ReplyToTopID', 0)
+    try:
+        reply_to_msg_id = int(reply_to_msg_id or 0)
+    except Exception:
+        reply_to_msg_id = 0
+    try:
+        reply_to_top_id = int(reply_to_top_id or 0)
+    except Exception:
+        reply_to_top_id = 0
+
+    replies_num = raw_data.get('Replies')
+    if isinstance(replies_num, dict):
+        replies_num = replies_num.get('Replies', 0)
+    try:
+        replies_num = int(replies_num or 0)
+    except Exception:
+        replies_num = 0
+    reactions = raw_data.get('Reactions') or {}
+    out_flag = raw_data.get('Out')
+    if out_flag is None:
+        out_flag = raw_data.get('out')
+    try:
+        is_self = 1 if bool(out_flag) or (user_id and user_id == me_id) else 0
+    except Exception:
+        is_self = 1 if (user_id and user_id == me_id) else 0
+    sender_id = str(user_id or '')
+    user = '我' if is_self else sender_id
+
+    message = {
+        'date': date,
+        'timestamp': timestamp,
+        'msg_id': msg_id,
+        'msg_file_name': msg_file_name,
+        'msg_files': [],
+        'user': user,
+        'sender_id': sender_id,
+        'is_self': is_self,
+        'msg': msg_text,
+        'reply_to_msg_id': reply_to_msg_id,
+        'reply_to_top_id': reply_to_top_id,
+        'replies_num': replies_num,
+        'reactions': reactions,
+        'ori_height': raw_message.get('ori_height'),
+        'ori_width': raw_message.get('ori_width'),
+        'og_info': og_info
+    }
+    return message, raw_data.get('GroupedID', '')
+
+def _merge_group(group_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if len(group_messages) == 1:
+        # Most messages are not albums; same result as the general path below.
+        main_msg = group_messages[0]
+        if main_msg['msg_file_name']:
+            main_msg['msg_files'].append(main_msg['msg_file_name'])
+            main_msg['msg_file_name'] = ''
+        return main_msg
+    main_msg = next((m for m in group_messages if m.get('msg')), group_messages[0])
+    for msg in group_messages:
+        if msg['msg_id'] != main_msg['msg_id'] and msg['msg_file_name']:
+            main_msg['msg_files'].append(msg['msg_file_name'])
+    if main_msg['msg_file_name']:
+        main_msg['msg_files'].append(main_msg['msg_file_name'])
+        main_msg['msg_file_name'] = ''
+    return main_msg
+
+def iter_parse_messages(
+    chat_id: str,
+    raw_messages: Iterable[dict],
+    tz,
+    remark: str | None = None,
+    batch_size: int = 500,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Filter and parse raw messages in batches of about ``batch_size``.
+
+    Album parts (same GroupedID) are merged even when they straddle a batch
+    boundary: the trailing group is held back until the next batch shows
+    whether it continues.
+    """
     from .project_logger import get_logger
     logger = get_logger(remark or chat_id)
 
-    messages = []
-    group_messages = []
+    me_id = load_me_id()
+    group_messages: List[Dict[str, Any]] = []
     last_group_id = None
-    filtered_messages = filter_messages(raw_messages)
-    logger.info(f'{len(raw_messages)} messages before filtering, {len(filtered_messages)} after filtering')
+    total_raw = total_kept = 0
+    raw_iter = iter(raw_messages)
+    while True:
+        chunk = list(islice(raw_iter, max(1, batch_size)))
+        if not chunk:
+            break
+        filtered_messages = filter_messages(chunk)
+        total_raw += len(chunk)
+        total_kept += len(filtered_messages)
 
-    me_id = load_me_id()
-    for raw_message in filtered_messages:
-        msg_text = raw_message.get("text", "")
-        msg_id = raw_message.get("id", None)
-        msg_file = raw_message.get("file", "")
-        msg_file_name = f'downloads/{chat_id}/{chat_id}_{msg_id}_{msg_file}' if msg_file else ""
-        og_info = raw_message.get("og_info")  # may be injected later
-        timestamp = raw_message.get("date", 0)
-        date = convert_timestamp_to_date(timestamp, tz)
-        raw_data = raw_message.get("raw", {}) or {}
-        from_id = raw_data.get("FromID") or {}
-        user_id = from_id.get('UserID', '') if isinstance(from_id, dict) else ''
-        reply_to_msg_id = (raw_data.get('ReplyTo') or {}).get('ReplyToMsgID', 0)
-        reply_to_top_id = (raw_data.get('ReplyTo') or {}).get('ReplyToTopID', 0)
-        try:
-            reply_to_msg_id = int(reply_to_msg_id or 0)
-        except Exception:
-            reply_to_msg_id = 0
-        try:
-            reply_to_top_id = int(reply_to_top_id or 0)
-        except Exception:
-            reply_to_top_id = 0
-
-        replies_num = raw_data.get('Replies')
-        if isinstance(replies_num, dict):
-            replies_num = replies_num.get('Replies', 0)
-        try:
-            replies_num = int(replies_num or 0)
-        except Exception:
-            replies_num = 0
-        reactions = raw_data.get('Reactions') or {}
-        out_flag = raw_data.get('Out')
-        if out_flag is None:
-            out_flag = raw_data.get('out')
-        try:
-            is_self = 1 if bool(out_flag) or (user_id and user_id == me_id) else 0
-        except Exception:
-            is_self = 1 if (user_id and user_id == me_id) else 0
-        sender_id = str(user_id or '')
-        user = '我' if is_self else sender_id
-
-        message = {
-            'date': date,
-            'timestamp': timestamp,
-            'msg_id': msg_id,
-            'msg_file_name': msg_file_name,
-            'msg_files': [],
-            'user': user,
-            'sender_id': sender_id,
-            'is_self': is_self,
-            'msg': msg_text,
-            'reply_to_msg_id': reply_to_msg_id,
-            'reply_to_top_id': reply_to_top_id,
-            'replies_num': replies_num,
-            'reactions': reactions,
-            'ori_height': raw_message.get('ori_height'),
-            'ori_width': raw_message.get('ori_width'),
-            'og_info': og_info
-        }
-        group_id = raw_data.get('GroupedID', '')
-
-        if group_id and (group_id == last_group_id or last_group_id is None):
-            group_messages.append(message)
-            last_group_id = group_id
-        else:
-            if group_messages:
-                main_msg = next((m for m in group_messages if m.get('msg')), group_messages[0])
-                for msg in group_messages:
-                    if msg['msg_id'] != main_msg['msg_id'] and msg['msg_file_name']:
-                        main_msg['msg_files'].append(msg['msg_file_name'])
-                if main_msg['msg_file_name']:
-                    main_msg['msg_files'].append(main_msg['msg_file_name'])
-                    main_msg['msg_file_name'] = ''
-                messages.append(main_msg)
-            group_messages = [message]
-            last_group_id = group_id
+        messages = []
+        for raw_message in filtered_messages:
+            message, group_id = _parse_raw_message(chat_id, raw_message, tz, me_id)
+            if group_id and (group_id == last_group_id or last_group_id is None):
+                group_messages.append(message)
+                last_group_id = group_id
+            else:
+                if group_messages:
+                    messages.append(_merge_group(group_messages))
+                group_messages = [message]
+                last_group_id = group_id
+        if messages:
+            yield messages
 
     if group_messages:
-        main_msg = next((m for m in group_messages if m.get('msg')), group_messages[0])
-        for msg in group_messages:
-            if msg['msg_id'] != main_msg['msg_id'] and msg['msg_file_name']:
-                main_msg['msg_files'].append(msg['msg_file_name'])
-        if main_msg['msg_file_name']:
-            main_msg['msg_files'].append(main_msg['msg_file_name'])
-            main_msg['msg_file_name'] = ''
-        messages.append(main_msg)
+        yield [_merge_group(group_messages)]
+    logger.info(f'{total_raw} messages before filtering, {total_kept} after filtering')
 
+def iter_message_rows(
+    chat_id: str,
+    raw_messages: Iterable[dict],
+    tz,
+    remark: str | None = None,
+    batch_size: int = 500,
+) -> Iterator[tuple]:
+    """Parse raw messages straight into db_utils.message_row tuples, in export order."""
+    for messages in iter_parse_messages(chat_id, raw_messages, tz, remark, batch_size=batch_size):
+        for message in messages:
+            yield message_row(chat_id, message)
+
+def parse_messages(chat_id: str, raw_messages: List[dict], tz, remark: str | None = None) -> List[Dict[str, Any]]:
+    messages = []
+    for batch in iter_parse_messages(chat_id, raw_messages, tz, remark, batch_size=max(1, len(raw_messages))):
+        messages.extend(batch)
     return sorted(messages, key=lambda x: x['date'])
 
+_LINK_RE = re.compile(r'(https?://\S+)')
+
 def filter_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Filter messages"""
-    filtered_messages = []
-    
-    bdpan = BaiduPanClient(
-        config=BaiduPanConfig(
-            cookie_file='auth/cookies.txt',
-        )
-    )
-    
+    """Drop messages whose Baidu/Quark/Ali/Xunlei share links are all stale.
+
+    The share links of the whole batch are deduplicated and checked
+    concurrently through link_check. A link whose check fails counts as alive.
+    """
+    from .link_check import check_links, link_provider
+
+    share_links_by_msg = []
     for msg in messages:
-        msg_text = msg.get('text', '') or ''
-        links = re.findall(r'(https?://\S+)', msg_text)
-        if not links:
-            filtered_messages.append(msg)
-            continue
-        
-        has_share_link = False
-        has_others_link = False
-        is_stale = True
-        
+        text = msg.get('text', '') or ''
+        links = _LINK_RE.findall(text) if 'http' in text else []
+        share_links = []
         for link in links:
-            # filter stale pan baidu link messages
-            if bdpan.is_share_link(link):
-                has_share_link = True
-                if not bdpan.is_link_stale(link):
-                    is_stale = False
-                    break
-                
-            # filter stale quark links
-            elif link.startswith('https://pan.quark.cn'):
-                has_share_link = True
-                if not is_quark_link_stale(link):
-                    is_stale = False
-                    break
-            
-            # filter stale ali links
-            elif link.startswith('https://www.alipan.com'):
-                has_share_link = True
-                if not is_ali_link_stale(link):
-                    is_stale = False
-                    break
-            
-            # filter stale xunlei links
-            elif link.startswith('https://pan.xunlei.com'):
-                has_share_link = True
-                if not is_xunlei_link_stale(link):
-                    is_stale = False
-                    break
-            
-            else:
-                has_others_link = True
-        
-        if has_share_link:
-            if not is_stale:
-                filtered_messages.append(msg)
-        
-        elif has_others_link:
-            filtered_messages.append(msg)
-                  
-            
-    return filtered_messages
+            provider = link_provider(link)
+            if provider:
+                share_links.append((provider, link))
+        share_links_by_msg.append(share_links)
+
+    stale = check_links(item for share_links in share_links_by_msg for item in share_links)
+    return [
+        msg
+        for msg, share_links in zip(messages, share_links_by_msg)
+        if not share_links or any(stale[item] is not True for item in share_links)
+    ]
     
@@ -4,6 +4,8 @@ from __future__ import annotations
 
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import md5
 from pathlib import Path
 from urllib.parse import urlparse
@@ -16,7 +18,17 @@ from telegram_bot.http_client import get as http_get
 from telegram_bot.project_logger import get_logger
 from telegram_bot.update_messages import download
 from telegram_bot.paths import BASE_DIR, ensure_runtime_dirs
-from telegram_bot.db_utils import get_app_connection, get_og_cache, set_og_cache
+from telegram_bot.db_utils import (
+    claim_og_queue,
+    complete_og_queue,
+    defer_og_queue,
+    get_app_connection,
+    get_og_cache,
+    get_og_cache_many,
+    set_og_cache,
+    set_og_cache_many,
+    write_connection,
+)
 
 ensure_runtime_dirs()
 
@@ -67,6 +79,93 @@ def calculate_size(file_path: str, og_width: int | None, og_height: int | None)
         original_height = int(og_height)
     return original_width, original_height
 
+OG_FETCH_CONCURRENCY = int(os.getenv("OG_FETCH_CONCURRENCY", "8"))
+OG_FETCH_PER_HOST = int(os.getenv("OG_FETCH_PER_HOST", "2"))
+
+_og_executor: ThreadPoolExecutor | None = None
+_og_executor_lock = threading.Lock()
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def _get_og_executor() -> ThreadPoolExecutor:
+    # One pool for the whole process, so concurrent chat workers share the cap.
+    global _og_executor
+    with _og_executor_lock:
+        if _og_executor is None:
+            _og_executor = ThreadPoolExecutor(max_workers=max(1, OG_FETCH_CONCURRENCY), thread_name_prefix="og-fetch")
+        return _og_executor
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = (urlparse(url).hostname or "").lower()
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(max(1, OG_FETCH_PER_HOST))
+        return slot
+
+
+def fetch_open_graph_info(url: str) -> dict:
+    """Fetch and parse the Open Graph tags of ``url`` without touching the cache.
+
+    Returns ``{}`` when the page cannot be used, which is what gets cached as a
+    negative entry.
+    """
+    try:
+        headers = {
+            'User-Agent': r"Mozilla/5.0 (Linux; Android 6.0.1; Nexus 5X Build/MMB29P) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2272.96 Mobile Safari/537.36 TelegramBot (like TwitterBot)"
+        }
+        response = http_get(url, timeout=5, headers=headers)
+        if response.status_code != 200:
+            return {}
+
+        parsed_url = urlparse(url)
+        domain_parts = parsed_url.netloc.split(':')[0].split('.')
+        domain = domain_parts[-2] if len(domain_parts) >= 2 else domain_parts[0]
+        if domain.lower() == 'b23':
+            domain = 'bilibili'
+        soup = BeautifulSoup(response.text, 'html.parser')
+        if domain.lower() == 'tiktok':
+            data_script = soup.find('script', {'id': '__UNIVERSAL_DATA_FOR_REHYDRATION__'})
+            if data_script:
+                json_data = json.loads(data_script.get_text()) if data_script and data_script.get_text() else {}
+                json_data = json_data.get('__DEFAULT_SCOPE__', {})
+                video_detail = json_data.get('webapp.video-detail', {})
+                cover = video_detail.get('itemInfo', {}).get('itemStruct', {}).get('video', {}).get('cover')
+                share_meta = video_detail.get('shareMeta', {})
+                return {
+                    'title': share_meta.get('title'),
+                    'image': cover,
+                    'description': share_meta.get('desc'),
+                    'site_name': domain.capitalize(),
+                    'width': None,
+                    'height': None,
+                    'url': url,
+                }
+        og_title = soup.find('meta', property='og:title')
+        og_image = soup.find('meta', property='og:image')
+        og_description = soup.find('meta', property='og:description')
+        og_site_name = soup.find('meta', property='og:site_name')
+        og_width = soup.find('meta', property='og:image:width') or soup.find('meta', property='og:width')
+        og_height = soup.find('meta', property='og:image:height') or soup.find('meta', property='og:height')
+        og_url = soup.find('meta', property='og:url')
+
+        return {
+            'title': og_title['content'] if isinstance(og_title, Tag) and 'content' in og_title.attrs else None,
+            'image': og_image['content'] if isinstance(og_image, Tag) and 'content' in og_image.attrs else None,
+            'description': og_description.get('content') if isinstance(og_description, Tag) else None,
+            'site_name': og_site_name['content'] if isinstance(og_site_name, Tag) and 'content' in og_site_name.attrs else domain.capitalize(),
+            'width': og_width['content'] if isinstance(og_width, Tag) and 'content' in og_width.attrs else None,
+            'height': og_height['content'] if isinstance(og_height, Tag) and 'content' in og_height.attrs else None,
+            'url': og_url['content'] if isinstance(og_url, Tag) and 'content' in og_url.attrs else None,
+        }
+    except httpx.HTTPError as e:
+        logger = get_logger()
+        logger.exception(f'error og:{e}')
+        return {}
+
+
 def get_open_graph_info(url: str, chat_id: str | None = None) -> dict | None:
     conn = get_app_connection()
     try:
@@ -75,64 +174,151 @@ def get_open_graph_info(url: str, chat_id: str | None = None) -> dict | None:
             return cached
         if cached == {}:
             return None
-        try:
-            headers = {
-                'User-Agent': r"Mozilla/5.0 (Linux; Android 6.0.1; Nexus 5X Build/MMB29P) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2272.96 Mobile Safari/537.36 TelegramBot (like TwitterBot)"
-            }
-            response = http_get(url, timeout=5, headers=headers)
-            if response.status_code != 200:
-                set_og_cache(conn, url, {})
-                return None
-
-            parsed_url = urlparse(url)
-            domain_parts = parsed_url.netloc.split(':')[0].split('.')
-            domain = domain_parts[-2] if len(domain_parts) >= 2 else domain_parts[0]
-            if domain.lower() == 'b23':
-                domain = 'bilibili'
-            soup = BeautifulSoup(response.text, 'html.parser')
-            if domain.lower() == 'tiktok':
-                data_script = soup.find('script', {'id': '__UNIVERSAL_DATA_FOR_REHYDRATION__'})
-                if data_script:
-                    json_data = json.loads(data_script.get_text()) if data_script and data_script.get_text() else {}
-                    json_data = json_data.get('__DEFAULT_SCOPE__', {})
-                    video_detail = json_data.get('webapp.video-detail', {})
-                    cover = video_detail.get('itemInfo', {}).get('itemStruct', {}).get('video', {}).get('cover')
-                    share_meta = video_detail.get('shareMeta', {})
-                    og_info = {
-                        'title': share_meta.get('title'),
-                        'image': cover,
-                        'description': share_meta.get('desc'),
-                        'site_name': domain.capitalize(),
-                        'width': None,
-                        'height': None,
-                        'url': url,
-                    }
-                    set_og_cache(conn, url, og_info)
-                    return og_info
-            og_title = soup.find('meta', property='og:title')
-            og_image = soup.find('meta', property='og:image')
-            og_description = soup.find('meta', property='og:description')
-            og_site_name = soup.find('meta', property='og:site_name')
-            og_width = soup.find('meta', property='og:image:width') or soup.find('meta', property='og:width')
-            og_height = soup.find('meta', property='og:image:height') or soup.find('meta', property='og:height')
-            og_url = soup.find('meta', property='og:url')
-
-            og_info = {
-                'title': og_title['content'] if isinstance(og_title, Tag) and 'content' in og_title.attrs else None,
-                'image': og_image['content'] if isinstance(og_image, Tag) and 'content' in og_image.attrs else None,
-                'description': og_description.get('content') if isinstance(og_description, Tag) else None,
-                'site_name': og_site_name['content'] if isinstance(og_site_name, Tag) and 'content' in og_site_name.attrs else domain.capitalize(),
-                'width': og_width['content'] if isinstance(og_width, Tag) and 'content' in og_width.attrs else None,
-                'height': og_height['content'] if isinstance(og_height, Tag) and 'content' in og_height.attrs else None,
-                'url': og_url['content'] if isinstance(og_url, Tag) and 'content' in og_url.attrs else None,
-            }
-            set_og_cache(conn, url, og_info)
-            return og_info
-        except httpx.HTTPError as e:
-            logger = get_logger()
-            logger.exception(f'error og:{e}')
-            set_og_cache(conn, url, {})
-            return None
+        og_info = fetch_open_graph_info(url)
+        set_og_cache(conn, url, og_info)
+        return og_info or None
     finally:
         conn.close()
-
+
+
+def _fetch_with_host_slot(url: str) -> dict:
+    with _host_slot(url):
+        return fetch_open_graph_info(url)
+
+
+def get_open_graph_info_many(urls: list[str]) -> dict[str, dict | None]:
+    """Resolve Open Graph info for many urls at once.
+
+    Urls are deduplicated and looked up in og_cache in one pass. Misses are
+    fetched on the shared pool (OG_FETCH_CONCURRENCY threads, at most
+    OG_FETCH_PER_HOST per host), and the new entries are written back in one
+    transaction. Unusable pages and failed fetches map to None, like
+    get_open_graph_info.
+    """
+    results, failed = _resolve_open_graph_info_many(urls)
+    return {**results, **dict.fromkeys(failed)}
+
+
+def _resolve_open_graph_info_many(urls: list[str]) -> tuple[dict[str, dict | None], set[str]]:
+    """get_open_graph_info_many, with the urls whose fetch raised returned apart."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    failed: set[str] = set()
+    if not urls:
+        return {}, failed
+
+    conn = get_app_connection()
+    try:
+        cached = get_og_cache_many(conn, urls)
+    finally:
+        conn.close()
+
+    results: dict[str, dict | None] = {url: (cached[url] or None) for url in urls if url in cached}
+    misses = [url for url in urls if url not in cached]
+    if not misses:
+        return results, failed
+
+    executor = _get_og_executor()
+    futures = {url: executor.submit(_fetch_with_host_slot, url) for url in misses}
+    fetched: dict[str, dict] = {}
+    for url, future in futures.items():
+        try:
+            fetched[url] = future.result()
+        except Exception as e:
+            # Not cached, so the url is retried the next time it shows up.
+            get_logger().exception(f'error og:{url} {e}')
+            failed.add(url)
+            continue
+        results[url] = fetched[url] or None
+
+    if fetched:
+        with write_connection() as writer:
+            set_og_cache_many(writer, fetched)
+    return results, failed
+
+
+OG_QUEUE_BATCH_SIZE = int(os.getenv("OG_QUEUE_BATCH_SIZE", "100"))
+OG_QUEUE_POLL_SECONDS = float(os.getenv("OG_QUEUE_POLL_SECONDS", "5"))
+OG_QUEUE_RETRY_SECONDS = int(os.getenv("OG_QUEUE_RETRY_SECONDS", "60"))
+OG_QUEUE_MAX_ATTEMPTS = int(os.getenv("OG_QUEUE_MAX_ATTEMPTS", "5"))
+
+_og_enricher_wake = threading.Event()
+_og_enricher_started = False
+_og_enricher_lock = threading.Lock()
+
+
+def drain_og_queue(batch_size: int | None = None) -> int:
+    """Fill og_info and display sizes for queued link messages.
+
+    save_messages stores link messages with og_info NULL and queues their first
+    url; this resolves the due entries batch by batch and returns how many
+    messages were updated. Entries whose url could not be fetched, or whose
+    whole batch failed, are retried later with backoff.
+    """
+    batch_size = max(1, int(batch_size or OG_QUEUE_BATCH_SIZE))
+    updated = 0
+    while True:
+        conn = get_app_connection()
+        try:
+            entries = claim_og_queue(conn, batch_size)
+        finally:
+            conn.close()
+        if not entries:
+            return updated
+
+        try:
+            og_by_url, failed = _resolve_open_graph_info_many([url for _, _, url, _ in entries])
+        except Exception as e:
+            get_logger().exception(f'error og queue: {e}')
+            with write_connection() as writer:
+                defer_og_queue(
+                    writer,
+                    [(chat_id, msg_id) for chat_id, msg_id, _, _ in entries],
+                    OG_QUEUE_RETRY_SECONDS,
+                    OG_QUEUE_MAX_ATTEMPTS,
+                )
+            return updated
+
+        retry = [(chat_id, msg_id) for chat_id, msg_id, url, _ in entries if url in failed]
+        results = []
+        for chat_id, msg_id, url, _ in entries:
+            if url in failed:
+                continue
+            og_info = og_by_url.get(url)
+            og_width = og_info.get('width') if og_info else None
+            og_height = og_info.get('height') if og_info else None
+            try:
+                ori_width, ori_height = calculate_size("", og_width, og_height)
+            except (TypeError, ValueError):
+                ori_width, ori_height = 0, 0
+            results.append((chat_id, msg_id, og_info, ori_width, ori_height))
+        with write_connection() as writer:
+            updated += complete_og_queue(writer, results)
+            defer_og_queue(writer, retry, OG_QUEUE_RETRY_SECONDS, OG_QUEUE_MAX_ATTEMPTS)
+        if len(retry) == len(entries):
+            # Only deferred entries left in this batch; wait for their backoff.
+            return updated
+
+
+def wake_og_enricher() -> None:
+    _og_enricher_wake.set()
+
+
+def start_og_enricher() -> bool:
+    """Start the background thread that drains og_queue; returns False if already running."""
+    global _og_enricher_started
+    with _og_enricher_lock:
+        if _og_enricher_started:
+            return False
+        _og_enricher_started = True
+
+    def worker():
+        while True:
+            try:
+                drain_og_queue()
+            except Exception as e:
+                get_logger().exception(f'error og queue: {e}')
+            _og_enricher_wake.wait(OG_QUEUE_POLL_SECONDS)
+            _og_enricher_wake.clear()
+
+    threading.Thread(target=worker, name="og-enricher", daemon=True).start()
+    return True
@@ -0,0 +1,93 @@
+"""Bounded in-process cache of serialized read responses.
+
+Entries are keyed by request path and query and remember the ETag they were
+built under. The ETag already folds in the chat's data_version, so an entry
+whose ETag no longer matches the request is stale: it is dropped on lookup.
+``invalidate`` drops a chat's entries eagerly once an export committed rows.
+The cache is bounded by the total size of the stored bodies and evicts the
+least recently used entries first.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger bodies are served but not cached, so one huge page cannot flush the cache.
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    chat_id: str | None
+    body: bytes
+    media_type: str | None
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def get(self, key: str, etag: str) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.etag != etag:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: CachedResponse) -> bool:
+        if len(entry.body) > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, chat_id: str | None = None) -> int:
+        """Drop the entries of ``chat_id`` (all entries when None); returns how many."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if chat_id is None or entry.chat_id == chat_id]
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,128 @@
+"""Streaming capture of tdl output with parsed download progress.
+
+tdl redraws its progress bars many times a second, so a long ``tdl dl`` can
+print megabytes. TdlOutput reads stdout/stderr line by line on reader threads,
+keeps only the last ``TDL_OUTPUT_TAIL_LINES`` lines of each, and folds progress
+lines such as::
+
+    chat(123):456 -> photo.jpg ... 42.10% [####....] [1.20 MB in 2s; ~ETA: 3s; 600.00 KB/s]
+
+into counters (files done, bytes, rate) that can be read while tdl runs.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import deque
+
+TDL_OUTPUT_TAIL_LINES = int(os.getenv("TDL_OUTPUT_TAIL_LINES", "200"))
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)%")
+_SIZE_RE = re.compile(r"\[\s*(\d+(?:\.\d+)?)\s*([KMGT]?i?B)\s+in\b")
+_RATE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([KMGT]?i?B)/s")
+_UNITS = {"B": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+# Finished files remembered so a redrawn final line is not counted twice.
+_DONE_MEMORY = 4096
+
+
+def _to_bytes(value: str, unit: str) -> int:
+    return int(float(value) * _UNITS.get(unit[0].upper(), 1))
+
+
+class TdlProgress:
+    """Counters folded from tdl progress lines; safe to read from other threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._active: dict[str, tuple[int, int]] = {}
+        self._done: set[str] = set()
+        self._done_order: deque[str] = deque()
+        self.files_done = 0
+        self.bytes_done = 0
+        self.lines = 0
+        self.last_line = ""
+
+    def feed(self, line: str) -> None:
+        line = _ANSI_RE.sub("", line).strip()
+        if not line:
+            return
+        with self._lock:
+            self.lines += 1
+            self.last_line = line[:300]
+            percents = _PERCENT_RE.findall(line)
+            finished = "done!" in line.lower() or (bool(percents) and float(percents[-1]) >= 100)
+            if "->" not in line or not (percents or finished):
+                return
+            key = line.split("->", 1)[1].split("...", 1)[0].strip() or line.split("->", 1)[0]
+            if key in self._done:
+                return
+            size = _SIZE_RE.search(line)
+            rate = _RATE_RE.search(line)
+            size_bytes = _to_bytes(*size.groups()) if size else self._active.get(key, (0, 0))[0]
+            rate_bytes = _to_bytes(*rate.groups()) if rate else 0
+            if finished:
+                self._active.pop(key, None)
+                self.files_done += 1
+                self.bytes_done += size_bytes
+                self._done.add(key)
+                self._done_order.append(key)
+                if len(self._done_order) > _DONE_MEMORY:
+                    self._done.discard(self._done_order.popleft())
+            else:
+                self._active[key] = (size_bytes, rate_bytes)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-6)
+            in_flight = sum(size for size, _ in self._active.values())
+            return {
+                "files_done": self.files_done,
+                "files_active": len(self._active),
+                "bytes_done": self.bytes_done + in_flight,
+                "rate_bytes_per_second": sum(rate for _, rate in self._active.values()),
+                "avg_bytes_per_second": int((self.bytes_done + in_flight) / elapsed),
+                "lines": self.lines,
+                "last_line": self.last_line,
+                "elapsed_seconds": round(elapsed, 1),
+            }
+
+
+class TdlOutput:
+    """Drains a process' stdout/stderr on reader threads into bounded tails."""
+
+    def __init__(self, tail_lines: int | None = None):
+        maxlen = max(1, int(tail_lines or TDL_OUTPUT_TAIL_LINES))
+        self.stdout: deque[str] = deque(maxlen=maxlen)
+        self.stderr: deque[str] = deque(maxlen=maxlen)
+        self.progress = TdlProgress()
+        self._threads: list[threading.Thread] = []
+
+    def _drain(self, stream, tail: deque[str]) -> None:
+        # Text-mode pipes use universal newlines, so tdl's \r redraws arrive as lines.
+        try:
+            for line in iter(stream.readline, ""):
+                line = line.rstrip("\n")
+                tail.append(line)
+                self.progress.feed(line)
+        except (OSError, ValueError):
+            pass
+
+    def attach(self, proc) -> None:
+        for stream, tail in ((proc.stdout, self.stdout), (proc.stderr, self.stderr)):
+            if stream is None:
+                continue
+            thread = threading.Thread(target=self._drain, args=(stream, tail), name="tdl-output", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self, timeout: float | None = None) -> None:
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def text(self, tail: deque[str]) -> str:
+        return "\n".join(list(tail))
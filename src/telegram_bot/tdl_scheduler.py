@@ -0,0 +1,159 @@
+"""Admission control for tdl subprocesses.
+
+tdl jobs fall into three classes, in priority order:
+
+* ``interactive`` - downloads a user clicked in the UI,
+* ``export`` - incremental ``tdl chat export`` runs of the chat workers,
+* ``download`` - bulk ``tdl dl`` runs (export media, redownloads).
+
+Each class has its own concurrency limit (``TDL_MAX_<CLASS>``) under a global
+one (``TDL_MAX_CONCURRENT``). When a slot frees up the highest-priority waiter
+that fits goes first, so an export never waits behind a long bulk download.
+The global limit defaults to the sum of the class limits, so an interactive
+download starts right away even while an export and a bulk download run.
+
+The old single lock existed because all tdl processes share one session
+storage. Running several at once assumes the installed tdl accepts concurrent
+processes on that storage; this has not been verified against every tdl
+version or ``--storage`` backend. If a second process fails to open the
+session, set ``TDL_MAX_CONCURRENT=1``: runs are then serialized as before,
+still in priority order.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count
+
+JOB_CLASSES = ("interactive", "export", "download")
+
+_DEFAULT_CLASS_LIMITS = {"interactive": 1, "export": 1, "download": 1}
+
+
+def _env_limit(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+class TdlScheduler:
+    def __init__(self, class_limits: dict[str, int] | None = None, max_concurrent: int | None = None):
+        limits = dict(_DEFAULT_CLASS_LIMITS)
+        limits.update(class_limits or {})
+        self.class_limits = {job_class: max(1, int(limits[job_class])) for job_class in JOB_CLASSES}
+        self.max_concurrent = max(1, int(max_concurrent or sum(self.class_limits.values())))
+        self._cond = threading.Condition()
+        self._seq = count()
+        self._waiting: list[tuple[int, int, str]] = []
+        self._running = {job_class: 0 for job_class in JOB_CLASSES}
+        self._stats = {
+            job_class: {"started": 0, "finished": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+            for job_class in JOB_CLASSES
+        }
+        self._enqueued_at: dict[int, float] = {}
+        self._jobs: dict[int, dict] = {}
+
+    def _can_start(self, job_class: str) -> bool:
+        return (
+            self._running[job_class] < self.class_limits[job_class]
+            and sum(self._running.values()) < self.max_concurrent
+        )
+
+    def _is_next(self, ticket: tuple[int, int, str]) -> bool:
+        # The best-ranked waiter that could start now; waiters of a full class
+        # do not hold back lower classes.
+        for waiting in sorted(self._waiting):
+            if self._can_start(waiting[2]):
+                return waiting == ticket
+        return False
+
+    @contextmanager
+    def slot(self, job_class: str, label: str = "", chat_id: str | None = None):
+        """Hold a tdl slot of ``job_class`` for the duration of the block.
+
+        Yields the job's entry in ``stats()["jobs"]``; a ``progress`` object with
+        a ``snapshot()`` method may be attached to it while the job runs.
+        """
+        if job_class not in self.class_limits:
+            raise ValueError(f"unknown tdl job class: {job_class}")
+        ticket = (JOB_CLASSES.index(job_class), next(self._seq), job_class)
+        with self._cond:
+            self._waiting.append(ticket)
+            self._enqueued_at[ticket[1]] = time.monotonic()
+            try:
+                self._cond.wait_for(lambda: self._is_next(ticket))
+            finally:
+                self._waiting.remove(ticket)
+                waited = time.monotonic() - self._enqueued_at.pop(ticket[1])
+            self._running[job_class] += 1
+            stats = self._stats[job_class]
+            stats["started"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+            job = self._jobs[ticket[1]] = {
+                "job_class": job_class,
+                "label": label,
+                "chat_id": str(chat_id) if chat_id is not None else None,
+                "started_at": int(time.time()),
+                "waited_seconds": round(waited, 3),
+            }
+            # Another waiter may fit in the slots that are still free.
+            self._cond.notify_all()
+        try:
+            yield job
+        finally:
+            with self._cond:
+                self._jobs.pop(ticket[1], None)
+                self._running[job_class] -= 1
+                self._stats[job_class]["finished"] += 1
+                self._cond.notify_all()
+
+    def jobs(self, chat_id: str | None = None) -> list[dict]:
+        """Running jobs (optionally of one chat) with their progress snapshot."""
+        with self._cond:
+            jobs = [dict(job) for job in self._jobs.values()]
+        result = []
+        for job in jobs:
+            if chat_id is not None and job["chat_id"] != str(chat_id):
+                continue
+            progress = job.pop("progress", None)
+            if progress is not None:
+                job["progress"] = progress.snapshot()
+            result.append(job)
+        return result
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        jobs = self.jobs()
+        with self._cond:
+            classes = {}
+            for job_class in JOB_CLASSES:
+                stats = self._stats[job_class]
+                queued = [seq for _, seq, waiting_class in self._waiting if waiting_class == job_class]
+                classes[job_class] = {
+                    "limit": self.class_limits[job_class],
+                    "running": self._running[job_class],
+                    "queued": len(queued),
+                    "oldest_wait_seconds": round(max((now - self._enqueued_at[seq] for seq in queued), default=0.0), 3),
+                    "started": stats["started"],
+                    "finished": stats["finished"],
+                    "avg_wait_seconds": round(stats["wait_seconds_total"] / stats["started"], 3) if stats["started"] else 0.0,
+                    "max_wait_seconds": round(stats["wait_seconds_max"], 3),
+                }
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": sum(self._running.values()),
+                "queued": len(self._waiting),
+                "classes": classes,
+                "jobs": jobs,
+            }
+
+
+scheduler = TdlScheduler(
+    {job_class: _env_limit(f"TDL_MAX_{job_class.upper()}", limit) for job_class, limit in _DEFAULT_CLASS_LIMITS.items()},
+    _env_limit("TDL_MAX_CONCURRENT", sum(_DEFAULT_CLASS_LIMITS.values())),
+)
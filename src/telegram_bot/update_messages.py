@@ -3,35 +3,98 @@ import subprocess
 import signal
 from .project_logger import get_logger
 import time
-import json
 import uuid
 import urllib.parse
-import threading
-from .db_utils import get_last_export_time, set_exported_time, update_reactions
+from .db_utils import (
+    get_last_export_time,
+    get_reactions_sweep_time,
+    set_exported_time,
+    set_reactions_sweep_time,
+    update_reactions,
+    write_connection,
+)
 from .http_client import download_file
+from .message_utils import iter_json_array
 from .paths import BASE_DIR, ensure_runtime_dirs
+from .tdl_progress import TdlOutput
+from .tdl_scheduler import scheduler as tdl_scheduler
 
-tdl_lock = threading.Lock()
 ensure_runtime_dirs()
 
 IMAGE_EXTENSIONS = "jpg,jpeg,png,webp,gif"
 
 TDL_CHAT_EXPORT_TIMEOUT_SECONDS = int(os.getenv("TDL_CHAT_EXPORT_TIMEOUT_SECONDS", "240"))
 TDL_DL_TIMEOUT_SECONDS = int(os.getenv("TDL_DL_TIMEOUT_SECONDS", "600"))
+# Incremental exports reach this far back before the last export, so edits,
+# reactions and reply counts of recent messages are picked up (0 disables).
+EXPORT_OVERLAP_SECONDS = int(os.getenv("EXPORT_OVERLAP_SECONDS", str(24 * 3600)))
+# Reaction refresh: export the last N seconds (or, if set, the last N messages)
+# and sweep the whole history only every REACTION_FULL_SWEEP_SECONDS (0 disables sweeps).
+REACTION_REFRESH_WINDOW_SECONDS = int(os.getenv("REACTION_REFRESH_WINDOW_SECONDS", str(7 * 24 * 3600)))
+REACTION_REFRESH_LAST_MESSAGES = int(os.getenv("REACTION_REFRESH_LAST_MESSAGES", "0"))
+REACTION_FULL_SWEEP_SECONDS = int(os.getenv("REACTION_FULL_SWEEP_SECONDS", str(7 * 24 * 3600)))
+REACTION_REFRESH_CHUNK_SIZE = int(os.getenv("REACTION_REFRESH_CHUNK_SIZE", "5000"))
+# Return code reported for a tdl run stopped through its cancel event.
+TDL_CANCELLED_RETURNCODE = 130
+# How often a running tdl process checks its cancel event.
+_CANCEL_POLL_SECONDS = 1.0
+
+def _tail_lines(text: str | None, max_lines: int = 80) -> str:
+    if not text:
+        return ""
+    lines = text.splitlines()
+    if len(lines) <= max_lines:
+        return text.strip()
+    return ("\n".join(lines[-max_lines:])).strip()
+
+
+def _terminate_process(proc) -> None:
+    try:
+        if os.name == "nt":
+            proc.terminate()
+        else:
+            os.killpg(proc.pid, signal.SIGTERM)
+    except Exception:
+        pass
 
-# def _tail_lines(text: str | None, max_lines: int = 80) -> str:
-#     if not text:
-#         return ""
-#     lines = text.splitlines()
-#     if len(lines) <= max_lines:
-#         return text.strip()
-#     return ("\n".join(lines[-max_lines:])).strip()
+    try:
+        proc.wait(timeout=10)
+    except Exception:
+        try:
+            if os.name == "nt":
+                proc.kill()
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except Exception:
+            pass
 
 
-def _run_tdl_command(command: list[str], logger, label: str, *, timeout_seconds: int | None = None):
+def _run_tdl_command(
+    command: list[str],
+    logger,
+    label: str,
+    *,
+    timeout_seconds: int | None = None,
+    job_class: str = "export",
+    chat_id: str | None = None,
+    cancel=None,
+):
+    """
+    Run a tdl command once tdl_scheduler admits it under ``job_class``.
+
+    Output is streamed into bounded tails (see tdl_progress) and the parsed
+    progress is visible through tdl_scheduler.jobs() while tdl runs. The
+    returned CompletedProcess carries only those tails. Setting the optional
+    ``cancel`` event terminates tdl; the run then returns TDL_CANCELLED_RETURNCODE.
+    """
     logger.info(f"{label}: Running command: {' '.join(command)}")
     timeout_seconds = int(timeout_seconds) if timeout_seconds is not None else None
-    with tdl_lock:
+    with tdl_scheduler.slot(job_class, label=label, chat_id=chat_id) as job:
+        if cancel is not None and cancel.is_set():
+            logger.info(f"{label}: cancelled before start")
+            return subprocess.CompletedProcess(command, TDL_CANCELLED_RETURNCODE, "", "[CANCELLED]")
+        output = TdlOutput()
+        job["progress"] = output.progress
         try:
             popen_kwargs: dict[str, object] = {
                 "args": command,
@@ -47,40 +110,42 @@ def _run_tdl_command(command: list[str], logger, label: str, *, timeout_seconds:
                 popen_kwargs["start_new_session"] = True
 
             proc = subprocess.Popen(**popen_kwargs)  # type: ignore[arg-type]
-            stdout, stderr = "", ""
-            try:
-                stdout, stderr = proc.communicate(timeout=timeout_seconds)
-            except subprocess.TimeoutExpired:
-                logger.error(f"{label}: tdl timeout after {timeout_seconds}s; terminating process.")
-                try:
-                    if os.name == "nt":
-                        proc.terminate()
-                    else:
-                        os.killpg(proc.pid, signal.SIGTERM)
-                except Exception:
-                    pass
-
+            output.attach(proc)
+            deadline = time.monotonic() + timeout_seconds if timeout_seconds is not None else None
+            returncode = None
+            while returncode is None:
+                wait_seconds = _CANCEL_POLL_SECONDS if cancel is not None else None
+                if deadline is not None:
+                    remaining = max(0.0, deadline - time.monotonic())
+                    wait_seconds = remaining if wait_seconds is None else min(wait_seconds, remaining)
                 try:
-                    proc.wait(timeout=10)
-                except Exception:
-                    try:
-                        if os.name == "nt":
-                            proc.kill()
-                        else:
-                            os.killpg(proc.pid, signal.SIGKILL)
-                    except Exception:
-                        pass
-
-                try:
-                    stdout2, stderr2 = proc.communicate(timeout=2)
-                except Exception:
-                    stdout2, stderr2 = "", ""
-
-                stdout = (stdout or "") + (stdout2 or "")
-                stderr = (stderr or "") + (stderr2 or "") + f"\n[TIMEOUT after {timeout_seconds}s]"
-                return subprocess.CompletedProcess(command, 124, stdout, stderr)
-
-            return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
+                    returncode = proc.wait(timeout=wait_seconds)
+                except subprocess.TimeoutExpired:
+                    if cancel is not None and cancel.is_set():
+                        logger.info(f"{label}: cancelled; terminating process.")
+                        _terminate_process(proc)
+                        output.join(timeout=2)
+                        output.stderr.append("[CANCELLED]")
+                        return subprocess.CompletedProcess(
+                            command, TDL_CANCELLED_RETURNCODE, output.text(output.stdout), output.text(output.stderr)
+                        )
+                    if deadline is not None and time.monotonic() >= deadline:
+                        logger.error(f"{label}: tdl timeout after {timeout_seconds}s; terminating process.")
+                        _terminate_process(proc)
+                        output.join(timeout=2)
+                        output.stderr.append(f"[TIMEOUT after {timeout_seconds}s]")
+                        return subprocess.CompletedProcess(command, 124, output.text(output.stdout), output.text(output.stderr))
+
+            output.join(timeout=5)
+            progress = output.progress.snapshot()
+            if progress["files_done"]:
+                logger.info(
+                    f"{label}: files={progress['files_done']} bytes={progress['bytes_done']} "
+                    f"avg_rate={progress['avg_bytes_per_second']}B/s"
+                )
+            if returncode != 0:
+                logger.error(f"{label}: returncode={returncode}; stderr (tail):\n{_tail_lines(output.text(output.stderr), 20)}")
+            return subprocess.CompletedProcess(command, returncode, output.text(output.stdout), output.text(output.stderr))
         except FileNotFoundError as e:
             logger.error(f"{label}: tdl not found: {e}")
             raise
@@ -88,33 +153,27 @@ def _run_tdl_command(command: list[str], logger, label: str, *, timeout_seconds:
             logger.exception(f"{label}: Failed to run command: {e}")
             raise
 
-    # stdout_tail = _tail_lines(result.stdout)
-    # stderr_tail = _tail_lines(result.stderr)
-
-    # logger.info(f"{label}: returncode={result.returncode}")
-    # if stdout_tail:
-    #     logger.info(f"{label}: stdout (tail):\n{stdout_tail}")
-    # if stderr_tail:
-    #     # Many CLIs write progress / warnings to stderr even on success.
-    #     if result.returncode == 0:
-    #         logger.info(f"{label}: stderr (tail):\n{stderr_tail}")
-    #     else:
-    #         logger.error(f"{label}: stderr (tail):\n{stderr_tail}")
-
-    return result
 
+def export_chat(their_id, msg_json_temp_path, conn, is_download=True, is_all=True, is_raw=True, download_images_only=False, remark=None, cancel=None) -> bool:
+    """
+    Export new messages into msg_json_temp_path (and download their files).
 
-def export_chat(their_id, msg_json_path, msg_json_temp_path, conn, is_download=True, is_all=True, is_raw=True, download_images_only=False, remark=None):
+    Returns True when the export succeeded; the caller streams the file from there.
+    A set ``cancel`` event stops tdl and skips the download step.
+    """
     logger = get_logger(remark or their_id)
     logger.info("Starting chat export...")
     last_export_time = get_last_export_time(conn)
     current_time = str(int(time.time()))
+    window_start = int(last_export_time or 0)
+    if window_start > 0:
+        window_start = max(0, window_start - max(0, EXPORT_OVERLAP_SECONDS))
     command = [
         'tdl', 'chat', 'export',
         '-c', str(their_id),
         '--with-content',
         '-o', msg_json_temp_path,
-        '-i', f'{last_export_time},{current_time}'
+        '-i', f'{window_start},{current_time}'
     ]
     if is_raw:
         command.append('--raw')
@@ -122,13 +181,17 @@ def export_chat(their_id, msg_json_path, msg_json_temp_path, conn, is_download=T
         command.append('--all')
 
 
-    result = _run_tdl_command(command, logger, label="tdl chat export", timeout_seconds=TDL_CHAT_EXPORT_TIMEOUT_SECONDS)
+    result = _run_tdl_command(command, logger, label="tdl chat export", timeout_seconds=TDL_CHAT_EXPORT_TIMEOUT_SECONDS, chat_id=their_id, cancel=cancel)
     
+    if result.returncode == TDL_CANCELLED_RETURNCODE:
+        logger.info("Chat export cancelled.")
+        return False
+
     if result.returncode == 0:
         logger.info("Chat export successful.")
 
         # Download chat files using tdl dl command
-        if is_download:
+        if is_download and not (cancel is not None and cancel.is_set()):
             logger.info("Downloading files...")
             download_path = str(BASE_DIR / 'downloads' / str(their_id))
             os.makedirs(download_path, exist_ok=True)
@@ -149,44 +212,46 @@ def export_chat(their_id, msg_json_path, msg_json_temp_path, conn, is_download=T
             ]
             if download_images_only:
                 download_command.extend(['-i', IMAGE_EXTENSIONS])
-            download_result = _run_tdl_command(download_command, logger, label="tdl dl", timeout_seconds=TDL_DL_TIMEOUT_SECONDS)
-            if download_result.returncode != 0:
+            download_result = _run_tdl_command(download_command, logger, label="tdl dl", timeout_seconds=TDL_DL_TIMEOUT_SECONDS, job_class="download", chat_id=their_id, cancel=cancel)
+            if download_result.returncode == TDL_CANCELLED_RETURNCODE:
+                logger.info("Download cancelled; the next export resumes it with --continue.")
+            elif download_result.returncode != 0:
                 logger.error("Error downloading files (see tdl dl stdout/stderr above).")
             else:
                 logger.info("Download finished (see tdl dl stdout/stderr above).")
 
-        # Load existing messages if the file exists
-        if os.path.exists(msg_json_path):
-            with open(msg_json_path, 'r', encoding='utf-8') as file:
-                existing_data = json.load(file)
-        else:
-            existing_data = {"id": their_id, "messages": []}
-
-        # Load new messages from the temporary exported file
-        with open(msg_json_temp_path, 'r', encoding='utf-8') as file:
-            new_data = json.load(file)
+        # Save the current time as the last export time
+        set_exported_time(conn, current_time)
+        return True
 
-        # Append new messages to the existing messages
-        existing_data['messages'].extend(new_data['messages'])
+    logger.error("Error exporting chat (see tdl chat export stdout/stderr above).")
+    return False
 
-        # Save the combined messages back to the file
-        with open(msg_json_path, 'w', encoding='utf-8') as file:
-            json.dump(existing_data, file, ensure_ascii=False, indent=4)
 
-        # Save the current time as the last export time
-        set_exported_time(conn, current_time)
-    else:
-        logger.error("Error exporting chat (see tdl chat export stdout/stderr above).")
+def _reaction_refresh_range(conn, now: int) -> tuple[list[str], bool]:
+    """tdl export arguments for this reaction refresh, and whether it is a full sweep."""
+    last_sweep = int(get_reactions_sweep_time(conn) or 0)
+    if REACTION_FULL_SWEEP_SECONDS > 0 and now - last_sweep >= REACTION_FULL_SWEEP_SECONDS:
+        return ["-i", f"0,{now}"], True
+    if REACTION_REFRESH_LAST_MESSAGES > 0:
+        return ["-T", "last", "-i", str(REACTION_REFRESH_LAST_MESSAGES)], False
+    return ["-i", f"{max(0, now - REACTION_REFRESH_WINDOW_SECONDS)},{now}"], False
 
 
-def refresh_chat_reactions(their_id: str, msg_json_temp_path: str, conn, remark: str | None = None) -> int:
+def refresh_chat_reactions(their_id: str, msg_json_temp_path: str, conn, remark: str | None = None, cancel=None) -> int:
     """
-    Export full chat history and refresh reactions for existing DB messages.
+    Export recent chat history and refresh reactions for existing DB messages.
+
+    Normally only the last REACTION_REFRESH_WINDOW_SECONDS (or the last
+    REACTION_REFRESH_LAST_MESSAGES messages) are exported; every
+    REACTION_FULL_SWEEP_SECONDS the whole history is. The export is streamed
+    and applied REACTION_REFRESH_CHUNK_SIZE messages per write.
 
     This does NOT touch the DB export cursor (meta.exported_time/last_export_time).
     """
     logger = get_logger(remark or their_id)
-    current_time = str(int(time.time()))
+    now = int(time.time())
+    export_range, full_sweep = _reaction_refresh_range(conn, now)
 
     command = [
         "tdl",
@@ -197,32 +262,47 @@ def refresh_chat_reactions(their_id: str, msg_json_temp_path: str, conn, remark:
         "--with-content",
         "-o",
         msg_json_temp_path,
-        "-i",
-        f"0,{current_time}",
+        *export_range,
         "--raw",
         "--all",
     ]
 
-    result = _run_tdl_command(command, logger, label="tdl chat export (refresh reactions)", timeout_seconds=TDL_CHAT_EXPORT_TIMEOUT_SECONDS)
+    label = "tdl chat export (refresh reactions, full sweep)" if full_sweep else "tdl chat export (refresh reactions)"
+    result = _run_tdl_command(command, logger, label=label, timeout_seconds=TDL_CHAT_EXPORT_TIMEOUT_SECONDS, chat_id=their_id, cancel=cancel)
+    if result.returncode == TDL_CANCELLED_RETURNCODE:
+        logger.info("Refresh reactions cancelled.")
+        return 0
     if result.returncode != 0:
         logger.error("Refresh reactions export failed (see stdout/stderr above).")
         return 0
 
     try:
-        with open(msg_json_temp_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        raw_messages = data.get("messages", [])
+        changed = seen = 0
         updates: list[tuple[int, dict | None]] = []
-        for msg in raw_messages:
+
+        def flush() -> int:
+            with write_connection(their_id) as writer:
+                return update_reactions(writer, str(their_id), updates)
+
+        for msg in iter_json_array(msg_json_temp_path, "messages"):
             msg_id = msg.get("id")
-            raw = msg.get("raw") or {}
-            reactions_obj = raw.get("Reactions")
             if msg_id is None:
                 continue
+            raw = msg.get("raw") or {}
+            reactions_obj = raw.get("Reactions")
             updates.append((int(msg_id), reactions_obj if isinstance(reactions_obj, dict) else None))
-
-        changed = update_reactions(conn, str(their_id), updates)
-        logger.info(f"Refreshed reactions: updated_rows={changed}")
+            seen += 1
+            if len(updates) >= REACTION_REFRESH_CHUNK_SIZE:
+                if cancel is not None and cancel.is_set():
+                    logger.info("Refresh reactions cancelled.")
+                    return changed
+                changed += flush()
+                updates = []
+        if updates:
+            changed += flush()
+        if full_sweep:
+            set_reactions_sweep_time(conn, now)
+        logger.info(f"Refreshed reactions: messages={seen} updated_rows={changed} full_sweep={full_sweep}")
         return changed
     except Exception as e:
         logger.exception(f"Refresh reactions failed to parse/apply: {e}")
@@ -277,7 +357,14 @@ def redownload_chat_files(their_id, download_images_only=False, remark=None):
         '--raw',
         '--all',
     ]
-    export_result = _run_tdl_command(export_command, logger, label="tdl chat export (redownload)", timeout_seconds=TDL_CHAT_EXPORT_TIMEOUT_SECONDS)
+    export_result = _run_tdl_command(
+        export_command,
+        logger,
+        label="tdl chat export (redownload)",
+        timeout_seconds=TDL_CHAT_EXPORT_TIMEOUT_SECONDS,
+        job_class="download",
+        chat_id=their_id,
+    )
     if export_result.returncode != 0:
         logger.error("Redownload export failed (see stdout/stderr above).")
         return False
@@ -299,7 +386,14 @@ def redownload_chat_files(their_id, download_images_only=False, remark=None):
     if download_images_only:
         download_command.extend(['-i', IMAGE_EXTENSIONS])
 
-    download_result = _run_tdl_command(download_command, logger, label="tdl dl (redownload)", timeout_seconds=TDL_DL_TIMEOUT_SECONDS)
+    download_result = _run_tdl_command(
+        download_command,
+        logger,
+        label="tdl dl (redownload)",
+        timeout_seconds=TDL_DL_TIMEOUT_SECONDS,
+        job_class="download",
+        chat_id=their_id,
+    )
     try:
         if os.path.exists(msg_json_temp_path):
             os.remove(msg_json_temp_path)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import random
@@ -10,33 +11,54 @@ import subprocess
 import time
 import uuid
 from pathlib import Path
+from urllib.parse import unquote
 from threading import Event, Lock, Thread
 
-from bdpan import BaiduPanClient, BaiduPanConfig
+from bdpan import BaiduPanClient
 from fastapi import FastAPI, Query, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
 from telegram_bot.archiver import handle
+from telegram_bot.chat_scheduler import ChatScheduler
+from telegram_bot.db_pool import PoolBusy, admin_pool, download_pool, offload, read_pool, search_pool
 from telegram_bot.db_utils import (
+    build_message_search,
     delete_chat as delete_chat_record,
+    delete_messages,
     get_app_connection,
     get_chat,
+    GLOBAL_DATA_VERSION,
+    get_chat_stats,
+    get_chat_updated_at,
+    get_data_versions,
     get_connection,
     get_db_path,
     list_chats_db,
     list_search_scopes,
+    rebuild_chat_stats,
+    rebuild_message_reactions,
     search_messages_global,
     upsert_chat,
     upsert_search_scope,
 )
-from telegram_bot.message_utils import is_ali_link_stale, is_quark_link_stale
+from telegram_bot.message_rows import MessageDecoder, dumps_json, parse_fields, select_messages_sql
+from telegram_bot.link_check import (
+    PROVIDERS,
+    cached_link_status,
+    check_link,
+    get_bdpan_client,
+    link_provider,
+    record_link_status,
+)
+from telegram_bot.og_utils import start_og_enricher
 from telegram_bot.paths import BASE_DIR, DOWNLOADS_DIR, STATIC_DIR, TEMPLATES_DIR, ensure_runtime_dirs
 from telegram_bot.project_logger import get_logger
+from telegram_bot.response_cache import CachedResponse, ResponseCache
+from telegram_bot.tdl_scheduler import scheduler as tdl_scheduler
 from telegram_bot.update_messages import TDL_DL_TIMEOUT_SECONDS, _run_tdl_command, redownload_chat_files
-from telegram_bot.xunlei_cipher import is_xunlei_link_stale
 
 ensure_runtime_dirs()
 
@@ -49,10 +71,11 @@ CHATS_FILE = str(BASE_DIR / "chats.json")
 
 _workers_started = False
 _workers_start_lock = Lock()
-_chat_worker_stop_events: dict[str, Event] = {}
 
 _cleanup_global_lock = Lock()
 
+response_cache = ResponseCache()
+
 _cleanup_links_jobs: dict[str, dict] = {}
 _cleanup_links_jobs_lock = Lock()
 
@@ -60,7 +83,7 @@ _CLEANUP_LINKS_MIN_INTERVAL_SECONDS = 0.7
 _CLEANUP_LINKS_JITTER_SECONDS = 0.4
 _CLEANUP_LINKS_PROGRESS_FLUSH_EVERY = 10
 
-_CLEANUP_SUPPORTED_PROVIDERS = ("baidu", "quark", "ali", "xunlei")
+_CLEANUP_SUPPORTED_PROVIDERS = PROVIDERS
 
 _download_missing_images_jobs: dict[str, dict] = {}
 _download_missing_images_jobs_lock = Lock()
@@ -143,9 +166,66 @@ def save_chats(chats: list[dict]) -> None:
             upsert_chat(conn, chat)
     finally:
         conn.close()
+    # updated_at has one-second resolution; drop cached configs outright.
+    with _chat_configs_lock:
+        for chat in chats:
+            _chat_configs.pop(str(chat.get("id") or ""), None)
+
+
+# chat_id -> (updated_at, config) as last read by the chat workers.
+_chat_configs: dict[str, tuple[int, dict]] = {}
+_chat_configs_lock = Lock()
+
+
+def _chat_config(chat_id: str) -> dict | None:
+    """The chat's config row, re-read only when its updated_at changed."""
+    conn = get_app_connection(row_factory=sqlite3.Row)
+    try:
+        updated_at = get_chat_updated_at(conn, chat_id)
+        if updated_at is None:
+            with _chat_configs_lock:
+                _chat_configs.pop(chat_id, None)
+            return None
+        with _chat_configs_lock:
+            cached = _chat_configs.get(chat_id)
+        if cached is not None and cached[0] == updated_at:
+            return cached[1]
+        chat = get_chat(conn, chat_id)
+    finally:
+        conn.close()
+    if chat is None:
+        return None
+    with _chat_configs_lock:
+        _chat_configs[chat_id] = (updated_at, chat)
+    return chat
 
 
-def start_chat_worker(chat: dict, interval: int = 1800) -> None:
+def _run_chat_export(chat_id: str, cancel: Event) -> int:
+    latest = _chat_config(chat_id)
+    if latest is None:
+        logger.info(f"Worker {chat_id} stopped (chat no longer configured)")
+        chat_scheduler.remove(chat_id)
+        return 0
+    inserted = handle(
+        chat_id,
+        is_download=bool(latest.get("download_files", True)),
+        is_all=bool(latest.get("all_messages", True)),
+        is_raw=bool(latest.get("raw_messages", True)),
+        remark=latest.get("remark") or chat_id,
+        download_images_only=bool(latest.get("download_images_only", False)),
+        refresh_reactions=bool(latest.get("refresh_reactions", False)),
+        cancel=cancel,
+    )
+    # Edits and reaction refreshes only bump the data_version; those entries drop on their next lookup.
+    if inserted:
+        response_cache.invalidate(chat_id)
+    return inserted
+
+
+chat_scheduler = ChatScheduler(_run_chat_export)
+
+
+def start_chat_worker(chat: dict) -> None:
     chat_id = str(chat.get("id") or "").strip()
     if not chat_id:
         return
@@ -156,36 +236,10 @@ def start_chat_worker(chat: dict, interval: int = 1800) -> None:
         logger.info(f"Worker {remark} will not start (workers not started)")
         return
 
-    existing = _chat_worker_stop_events.get(chat_id)
-    if existing and not existing.is_set():
+    if not chat_scheduler.add(chat_id):
         logger.info(f"Worker {remark} already running")
         return
-
-    stop_event = Event()
-    _chat_worker_stop_events[chat_id] = stop_event
-
-    def get_latest_chat_config() -> dict:
-        chats = load_chats()
-        latest = next((c for c in chats if str(c.get("id")) == chat_id), None)
-        return latest if isinstance(latest, dict) else chat
-
-    def worker():
-        while not stop_event.is_set():
-            latest = get_latest_chat_config()
-            latest_remark = latest.get("remark") or remark
-            handle(
-                chat_id,
-                is_download=bool(latest.get("download_files", True)),
-                is_all=bool(latest.get("all_messages", True)),
-                is_raw=bool(latest.get("raw_messages", True)),
-                remark=latest_remark,
-                download_images_only=bool(latest.get("download_images_only", False)),
-                refresh_reactions=bool(latest.get("refresh_reactions", False)),
-            )
-            stop_event.wait(interval)
-
     logger.info(f"Worker {remark} will start")
-    Thread(target=worker, daemon=True).start()
 
 
 def start_saved_chat_workers() -> bool:
@@ -194,6 +248,8 @@ def start_saved_chat_workers() -> bool:
         if _workers_started:
             return False
         _workers_started = True
+        start_og_enricher()
+        chat_scheduler.start()
         for chat in load_chats():
             if chat.get("id"):
                 start_chat_worker(chat)
@@ -271,93 +327,50 @@ def get_db(chat_id: str):
     return conn
 
 
-def row_to_message(row):
-    item = dict(row)
-    if item.get("og_info"):
-        try:
-            item["og_info"] = json.loads(item["og_info"])
-        except Exception:
-            item["og_info"] = None
-    if item.get("msg_files"):
-        try:
-            item["msg_files"] = json.loads(item["msg_files"])
-        except Exception:
-            item["msg_files"] = None
-    if item.get("reactions"):
-        try:
-            item["reactions"] = json.loads(item["reactions"])
-        except Exception:
-            item["reactions"] = None
-    if item.get("replies_num") is None:
-        item["replies_num"] = 0
-    try:
-        item["replies_num"] = int(item["replies_num"] or 0)
-    except Exception:
-        item["replies_num"] = 0
-    if item.get("reply_to_top_id") is None:
-        item["reply_to_top_id"] = 0
-    try:
-        item["reply_to_top_id"] = int(item["reply_to_top_id"] or 0)
-    except Exception:
-        item["reply_to_top_id"] = 0
-    if item.get("is_self") is None:
-        item["is_self"] = 0
-    try:
-        item["is_self"] = int(item.get("is_self") or 0)
-    except Exception:
-        item["is_self"] = 0
-    if item.get("sender_id") is None:
-        item["sender_id"] = ""
-    if item.get("user") in (None, "") and item.get("sender_id"):
-        item["user"] = "我" if item["is_self"] else item["sender_id"]
-    return item
+def _json_page(payload) -> Response:
+    """Message endpoint response; stored JSON columns are spliced in without re-encoding."""
+    return Response(content=dumps_json(payload), media_type="application/json")
 
 
-def _parse_reactions_blob(blob):
-    if not blob:
+def _msg_id_cursor(before_msg_id: int | None, after_msg_id: int | None, alias: str = "m") -> tuple[str, list, bool]:
+    """
+    Build the seek condition for a msg_id cursor page.
+
+    Returns (where_sql, params, ascending). With after_msg_id the page is read
+    forwards from the cursor; otherwise it is read backwards from before_msg_id
+    (or from the newest message) and must be reversed by `_keyset_page`.
+    """
+    where_sql = ""
+    params: list = []
+    if before_msg_id is not None:
+        where_sql += f" AND {alias}.msg_id < ?"
+        params.append(int(before_msg_id))
+    if after_msg_id is not None:
+        where_sql += f" AND {alias}.msg_id > ?"
+        params.append(int(after_msg_id))
+    return where_sql, params, after_msg_id is not None
+
+
+def _keyset_page(rows: list, limit: int, ascending: bool = True) -> tuple[list, bool]:
+    """Trim a `limit + 1` fetch to `limit` rows, returned in ascending order."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not ascending:
+        rows = list(reversed(rows))
+    return rows, has_more
+
+
+def _parse_replies_num_cursor(cursor: str) -> tuple[int, int, int] | None:
+    """Parse the opaque `replies_num:timestamp:msg_id` cursor of /messages_by_replies_num."""
+    parts = str(cursor or "").split(":")
+    if len(parts) != 3:
         return None
-    if isinstance(blob, dict):
-        return blob
     try:
-        return json.loads(blob)
-    except Exception:
+        return int(parts[0]), int(parts[1]), int(parts[2])
+    except ValueError:
         return None
 
 
-def _iter_reaction_emoticon_counts(reactions_obj):
-    if not isinstance(reactions_obj, dict):
-        return
-    results = reactions_obj.get("Results") or []
-    if not isinstance(results, list):
-        return
-
-    for entry in results:
-        if not isinstance(entry, dict):
-            continue
-        reaction = entry.get("Reaction") or {}
-        if not isinstance(reaction, dict):
-            continue
-        emoticon = reaction.get("Emoticon")
-        if not emoticon:
-            continue
-
-        count = entry.get("Count", 0)
-        try:
-            count = int(count)
-        except Exception:
-            count = 0
-        yield emoticon, max(count, 0)
-
-
-def _get_reaction_count_for_emoticon(reactions_obj, target_emoticon: str) -> int:
-    if not target_emoticon:
-        return 0
-    for emoticon, count in _iter_reaction_emoticon_counts(reactions_obj):
-        if emoticon == target_emoticon:
-            return count
-    return 0
-
-
 def _cleanup_links_extract_links(text: str) -> list[str]:
     if not text:
         return []
@@ -388,28 +401,7 @@ def _normalize_cleanup_providers(providers: list[str] | None) -> list[str]:
 
 
 def _cleanup_link_provider(link: str, providers: set[str], *, bdpan: BaiduPanClient) -> str | None:
-    if not link:
-        return None
-
-    if "baidu" in providers:
-        try:
-            if bdpan.is_share_link(link):
-                return "baidu"
-        except Exception:
-            pass
-
-    if "quark" in providers and link.startswith("https://pan.quark.cn/s/"):
-        return "quark"
-
-    if "ali" in providers and (
-        link.startswith("https://www.alipan.com/s/") or link.startswith("https://www.aliyundrive.com/s/")
-    ):
-        return "ali"
-
-    if "xunlei" in providers and link.startswith("https://pan.xunlei.com/s/"):
-        return "xunlei"
-
-    return None
+    return link_provider(link, providers, bdpan=bdpan)
 
 
 def _cleanup_stale_links_worker(
@@ -434,7 +426,7 @@ def _cleanup_stale_links_worker(
         return
 
     providers_set = set(providers)
-    bdpan = BaiduPanClient(config=BaiduPanConfig(cookie_file="auth/cookies.txt"))
+    bdpan = get_bdpan_client()
 
     stale_cache: dict[str, bool] = {}
     checked_links_by_provider = {p: 0 for p in _CLEANUP_SUPPORTED_PROVIDERS}
@@ -460,6 +452,12 @@ def _cleanup_stale_links_worker(
         if cache_key in stale_cache:
             return stale_cache[cache_key]
 
+        # Results checked recently by ingest or an earlier job need no request.
+        cached = cached_link_status([(provider, link)]).get((provider, link))
+        if cached is not None:
+            stale_cache[cache_key] = cached
+            return cached
+
         now = time.monotonic()
         wait_seconds = _CLEANUP_LINKS_MIN_INTERVAL_SECONDS - (now - last_call_monotonic)
         if wait_seconds > 0:
@@ -470,20 +468,12 @@ def _cleanup_stale_links_worker(
             checked_links += 1
             checked_links_by_provider[provider] = checked_links_by_provider.get(provider, 0) + 1
 
-            if provider == "baidu":
-                stale = bool(bdpan.is_link_stale(link))
-            elif provider == "quark":
-                stale = bool(is_quark_link_stale(link))
-            elif provider == "ali":
-                stale = bool(is_ali_link_stale(link))
-            elif provider == "xunlei":
-                stale = bool(is_xunlei_link_stale(link))
-            else:
-                stale = False
-
+            stale = check_link(provider, link)
             stale_cache[cache_key] = stale
+            record_link_status({(provider, link): stale})
             return stale
         except Exception as e:
+            record_link_status({(provider, link): None})
             errors += 1
             with _cleanup_links_jobs_lock:
                 job["errors"] = errors
@@ -528,9 +518,7 @@ def _cleanup_stale_links_worker(
         rows = cur.fetchall()
         rows = rows[omit_num:]
 
-        delete_sql = "DELETE FROM messages WHERE chat_id=? AND msg_id=?"
-        deletes_since_commit = 0
-        cur_delete = conn.cursor()
+        pending_deletes: list[int] = []
 
         logger.debug(f"Cleanup worker started: chat_id={chat_id} total_messages={len(rows)}")
         for msg_id, msg in rows:
@@ -602,15 +590,14 @@ def _cleanup_stale_links_worker(
                 continue
 
             try:
-                cur_delete.execute(delete_sql, (chat_id, int(msg_id)))
+                pending_deletes.append(int(msg_id))
                 deleted_messages += 1
-                deletes_since_commit += 1
-                if deletes_since_commit >= 10:
+                if len(pending_deletes) >= 10:
                     logger.debug(f"Cleanup worker committing deletes: chat_id={chat_id}")
-                    conn.commit()
+                    batch, pending_deletes = pending_deletes, []
+                    delete_messages(conn, chat_id, batch)
                     with open("_last_cleanup.txt", "w", encoding="utf-8") as f:
                         f.write(str(omit_num + scanned_messages - deleted_messages))
-                    deletes_since_commit = 0
             except Exception as e:
                 errors += 1
                 with _cleanup_links_jobs_lock:
@@ -622,7 +609,7 @@ def _cleanup_stale_links_worker(
                         f"candidates={candidate_messages} deleted={deleted_messages} checked_links={checked_links} "
                         f"cache={len(stale_cache)} errors={errors}")
 
-        conn.commit()
+        delete_messages(conn, chat_id, pending_deletes)
         conn.close()
 
         if os.path.exists("last_cleanup.txt"):
@@ -663,12 +650,94 @@ def _cleanup_stale_links_worker(
             job["checked_links_by_provider"] = dict(checked_links_by_provider)
 
 
+# GET endpoints whose responses only change with the chat's data_version.
+_VERSIONED_CHAT_PATH = re.compile(
+    r"^/(?:messages|messages_between|replies|reactions_emoticons|messages_by_reaction|messages_by_replies_num|search|chat_stats)"
+    r"/([^/]+)(?:/[^/]+)?$"
+)
+_VERSIONED_GLOBAL_PATHS = {"/chats"}
+
+
+def _versioned_keys(path: str) -> list[str] | None:
+    """data_versions keys a read path depends on, None for unversioned paths."""
+    if path in _VERSIONED_GLOBAL_PATHS:
+        return [GLOBAL_DATA_VERSION]
+    match = _VERSIONED_CHAT_PATH.match(path)
+    if not match:
+        return None
+    return [GLOBAL_DATA_VERSION, unquote(match.group(1))]
+
+
+def _read_data_versions(keys: list[str]) -> dict[str, int]:
+    conn = get_app_connection()
+    try:
+        return get_data_versions(conn, keys)
+    finally:
+        conn.close()
+
+
+def _request_etag(request: Request, keys: list[str], versions: dict[str, int]) -> tuple[str, str]:
+    """(cache key, ETag) of a versioned read."""
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    cache_key = f"{request.url.path}?{query}"
+    key = f"{cache_key}|" + "|".join(str(versions[k]) for k in keys)
+    return cache_key, f'W/"{hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()}"'
+
+
+def _pool_busy_response(exc: PoolBusy) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": "1"})
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+
+@app.exception_handler(PoolBusy)
+async def pool_busy_handler(request: Request, exc: PoolBusy):
+    return _pool_busy_response(exc)
+
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    """Answer repeated reads with 304 while the chat's data_version is unchanged.
+
+    Other clients' identical reads are served from ``response_cache``.
+    """
+    keys = _versioned_keys(request.url.path) if request.method == "GET" else None
+    if keys is None:
+        # Static files, downloads and pages never wait for the read pool.
+        return await call_next(request)
+    try:
+        versions = await read_pool.run(_read_data_versions, keys)
+    except PoolBusy as exc:
+        return _pool_busy_response(exc)
+    cache_key, etag = _request_etag(request, keys, versions)
+    chat_id = keys[1] if len(keys) > 1 else None
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    cached = response_cache.get(cache_key, etag)
+    if cached is not None:
+        return Response(content=cached.body, media_type=cached.media_type, headers=headers)
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    media_type = response.headers.get("content-type")
+    response_cache.put(cache_key, CachedResponse(etag, chat_id, body, media_type))
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
 @app.get("/")
-def index_page(request: Request):
+async def index_page(request: Request):
     return templates.TemplateResponse(request, "index.html", {"request": request})
 
 
 @app.get("/chat/{chat_id}")
+@offload(read_pool)
 def chat_page(chat_id: str, request: Request):
     chats = load_chats()
     chat_username = next((c.get('username') for c in chats if c.get('id') == chat_id), '')
@@ -676,24 +745,38 @@ def chat_page(chat_id: str, request: Request):
 
 
 @app.get("/sw.js")
-def service_worker_file():
+async def service_worker_file():
     sw_path = STATIC_DIR / "sw.js"
     return FileResponse(str(sw_path), media_type="application/javascript", headers={"Service-Worker-Allowed": "/", "Cache-Control": "no-cache"})
 
 
 @app.get("/workers_status")
-def workers_status_route():
-    return {"started": workers_started()}
+async def workers_status_route():
+    return {
+        "started": workers_started(),
+        "chats": chat_scheduler.snapshot(),
+        "response_cache": response_cache.stats(),
+        "db_pools": {pool.name: pool.stats() for pool in (read_pool, search_pool, admin_pool, download_pool)},
+    }
 
 
 @app.post("/start_workers")
+@offload(admin_pool)
 def start_workers_route():
     started = start_saved_chat_workers()
     return {"started": started}
 
 
+@app.get("/tdl_stats")
+async def tdl_stats_route(chat_id: str | None = None):
+    stats = tdl_scheduler.stats()
+    if chat_id:
+        stats["jobs"] = [job for job in stats["jobs"] if job["chat_id"] == chat_id]
+    return stats
+
+
 @app.get("/downloads/{filename:path}")
-def downloads_files(filename: str):
+async def downloads_files(filename: str):
     target = _safe_join(Path(DOWNLOADS_DIR), filename)
     if target is None or not target.is_file():
         return _json_error(404, "Not found")
@@ -701,7 +784,7 @@ def downloads_files(filename: str):
 
 
 @app.get("/chat.css")
-def legacy_chat_css():
+async def legacy_chat_css():
     target = Path(STATIC_DIR) / "chat.css"
     if not target.is_file():
         return _json_error(404, "Not found")
@@ -709,7 +792,7 @@ def legacy_chat_css():
 
 
 @app.get("/chat.js")
-def legacy_chat_js():
+async def legacy_chat_js():
     target = Path(STATIC_DIR) / "chat.js"
     if not target.is_file():
         return _json_error(404, "Not found")
@@ -717,7 +800,7 @@ def legacy_chat_js():
 
 
 @app.get("/resources/{filename:path}")
-def legacy_resources_files(filename: str):
+async def legacy_resources_files(filename: str):
     target = _safe_join(Path(STATIC_DIR) / "resources", filename)
     if target is None or not target.is_file():
         return _json_error(404, "Not found")
@@ -725,7 +808,7 @@ def legacy_resources_files(filename: str):
 
 
 @app.get("/fonts/{filename:path}")
-def legacy_fonts_files(filename: str):
+async def legacy_fonts_files(filename: str):
     target = _safe_join(Path(STATIC_DIR) / "fonts", filename)
     if target is None or not target.is_file():
         return _json_error(404, "Not found")
@@ -733,11 +816,13 @@ def legacy_fonts_files(filename: str):
 
 
 @app.get("/chats")
+@offload(read_pool)
 def list_chats():
     return {"chats": load_chats()}
 
 
 @app.get("/search_scopes")
+@offload(read_pool)
 def get_search_scopes():
     conn = get_app_connection(row_factory=sqlite3.Row)
     try:
@@ -747,6 +832,7 @@ def get_search_scopes():
 
 
 @app.post("/search_scopes")
+@offload(admin_pool)
 def save_search_scope(payload: SearchScopeRequest):
     conn = get_app_connection(row_factory=sqlite3.Row)
     try:
@@ -759,6 +845,7 @@ def save_search_scope(payload: SearchScopeRequest):
 
 
 @app.get("/search_global")
+@offload(search_pool)
 def global_search_messages(
     q: str = Query(""),
     chat_ids: str = Query(""),
@@ -781,6 +868,7 @@ def global_search_messages(
 
 
 @app.post("/update_chat_settings")
+@offload(admin_pool)
 def update_chat_settings(payload: UpdateChatSettingsRequest):
     chat_id = str(payload.chat_id or "").strip()
     if not chat_id:
@@ -803,6 +891,7 @@ def update_chat_settings(payload: UpdateChatSettingsRequest):
 
 
 @app.post("/add_chat")
+@offload(admin_pool)
 def add_chat(payload: AddChatRequest):
     input_chat_id = str(payload.chat_id or "").strip()
     result = find_chat(input_chat_id)
@@ -842,6 +931,7 @@ def add_chat(payload: AddChatRequest):
 
 
 @app.post("/redownload_chat")
+@offload(admin_pool)
 def redownload_chat(payload: RedownloadChatRequest):
     chat_id = str(payload.chat_id or "").strip()
     if not chat_id:
@@ -868,18 +958,19 @@ def redownload_chat(payload: RedownloadChatRequest):
 
 
 @app.post("/cleanup_stale_baidu_links")
-def cleanup_stale_baidu_links(payload: ChatIdRequest):
+async def cleanup_stale_baidu_links(payload: ChatIdRequest):
     # Backward-compatible alias (old UI / clients).
-    return cleanup_stale_links(CleanupLinksRequest(chat_id=payload.chat_id, providers=["baidu"]))
+    return await cleanup_stale_links(CleanupLinksRequest(chat_id=payload.chat_id, providers=["baidu"]))
 
 
 @app.get("/cleanup_stale_baidu_links_status/{chat_id}")
-def cleanup_stale_baidu_links_status(chat_id: str):
+async def cleanup_stale_baidu_links_status(chat_id: str):
     # Backward-compatible alias (old UI / clients).
-    return cleanup_stale_links_status(chat_id)
+    return await cleanup_stale_links_status(chat_id)
 
 
 @app.post("/cleanup_stale_links")
+@offload(admin_pool)
 def cleanup_stale_links(payload: CleanupLinksRequest):
     chat_id = str(payload.chat_id or "").strip()
     if not chat_id:
@@ -935,7 +1026,7 @@ def cleanup_stale_links(payload: CleanupLinksRequest):
 
 
 @app.get("/cleanup_stale_links_status/{chat_id}")
-def cleanup_stale_links_status(chat_id: str):
+async def cleanup_stale_links_status(chat_id: str):
     chat_id = str(chat_id or "").strip()
     if not chat_id:
         return _json_error(400, "chat_id required")
@@ -946,15 +1037,43 @@ def cleanup_stale_links_status(chat_id: str):
     return job
 
 
+@app.post("/start_chat_worker")
+@offload(admin_pool)
+def start_chat_worker_route(payload: ChatIdRequest):
+    chat_id = str(payload.chat_id or "").strip()
+    if not chat_id:
+        return _json_error(400, "chat_id required")
+    chat = _chat_config(chat_id)
+    if chat is None:
+        return _json_error(404, "chat not found")
+    start_chat_worker(chat)
+    return {"started": chat_scheduler.has(chat_id)}
+
+
+@app.post("/stop_chat_worker")
+async def stop_chat_worker(payload: ChatIdRequest):
+    chat_id = str(payload.chat_id or "").strip()
+    if not chat_id:
+        return _json_error(400, "chat_id required")
+    return {"stopped": chat_scheduler.remove(chat_id)}
+
+
+@app.post("/cancel_chat_export")
+async def cancel_chat_export(payload: ChatIdRequest):
+    chat_id = str(payload.chat_id or "").strip()
+    if not chat_id:
+        return _json_error(400, "chat_id required")
+    return {"cancelled": chat_scheduler.cancel(chat_id)}
+
+
 @app.post("/delete_chat")
+@offload(admin_pool)
 def delete_chat(payload: ChatIdRequest):
     chat_id = str(payload.chat_id or "").strip()
     if not chat_id:
         return _json_error(400, "chat_id required")
 
-    stop_event = _chat_worker_stop_events.get(chat_id)
-    if stop_event:
-        stop_event.set()
+    chat_scheduler.remove(chat_id)
 
     chats = load_chats()
     before = len(chats)
@@ -971,8 +1090,7 @@ def delete_chat(payload: ChatIdRequest):
     return {"deleted": deleted or (before != len(load_chats())), "removed_data": removed_data, "removed_downloads": removed_downloads}
 
 
-@app.post("/download_telegram_media")
-def download_telegram_media(payload: DownloadTelegramMediaRequest):
+def _download_telegram_media(payload: DownloadTelegramMediaRequest):
     chat_id = str(payload.chat_id or "").strip()
     expected_url = (str(payload.expected_url).strip() if payload.expected_url is not None else None) or None
 
@@ -1048,7 +1166,14 @@ def download_telegram_media(payload: DownloadTelegramMediaRequest):
         ]
     )
 
-    result = _run_tdl_command(cmd, dl_logger, label="tdl dl (by url)", timeout_seconds=TDL_DL_TIMEOUT_SECONDS)
+    result = _run_tdl_command(
+        cmd,
+        dl_logger,
+        label="tdl dl (by url)",
+        timeout_seconds=TDL_DL_TIMEOUT_SECONDS,
+        job_class="interactive",
+        chat_id=chat_id,
+    )
 
     if result.returncode == 124:
         return JSONResponse(
@@ -1134,7 +1259,13 @@ def download_telegram_media(payload: DownloadTelegramMediaRequest):
     return {"ok": True, "media_urls": media_urls, "downloaded": [p.name for p in new_files], "renamed": renamed}
 
 
+@app.post("/download_telegram_media")
+async def download_telegram_media(payload: DownloadTelegramMediaRequest):
+    return await download_pool.run(_download_telegram_media, payload)
+
+
 @app.post("/download_missing_images")
+@offload(admin_pool)
 def download_missing_images(payload: DownloadMissingImagesRequest):
     chat_id = str(payload.chat_id or "").strip()
     if not chat_id:
@@ -1263,7 +1394,7 @@ def download_missing_images(payload: DownloadMissingImagesRequest):
                     continue
 
                 try:
-                    result = download_telegram_media(
+                    result = _download_telegram_media(
                         DownloadTelegramMediaRequest(
                             chat_id=chat_id,
                             telegram_urls=batch_urls,
@@ -1310,7 +1441,7 @@ def download_missing_images(payload: DownloadMissingImagesRequest):
 
 
 @app.get("/download_missing_images_status/{chat_id}")
-def download_missing_images_status(chat_id: str):
+async def download_missing_images_status(chat_id: str):
     chat_id = str(chat_id or "").strip()
     if not chat_id:
         return _json_error(400, "chat_id required")
@@ -1318,100 +1449,97 @@ def download_missing_images_status(chat_id: str):
     job = _download_missing_images_job_snapshot(chat_id)
     if not job:
         return {"chat_id": chat_id, "status": "idle"}
+    job["tdl_jobs"] = tdl_scheduler.jobs(chat_id)
     return job
 
 
+@app.get("/chat_stats/{chat_id}")
+@offload(read_pool)
+def chat_stats(chat_id: str):
+    conn = get_db(chat_id)
+    if not conn:
+        return _json_error(400, "chat_id required")
+    try:
+        return get_chat_stats(conn, chat_id)
+    finally:
+        conn.close()
+
+
 @app.get("/messages/{chat_id}")
+@offload(read_pool)
 def get_messages(
     chat_id: str,
     offset: int = Query(0),
     limit: int = Query(20),
+    before_msg_id: int | None = Query(None),
+    after_msg_id: int | None = Query(None),
+    latest: bool = Query(False),
+    with_total: bool | None = Query(None),
+    fields: str | None = Query(None),
 ):
+    """
+    Page through a chat in msg_id order.
+
+    Cursor mode (before_msg_id / after_msg_id / latest=true) seeks on the
+    (chat_id, msg_id) primary key and returns `has_more`; the total is only
+    counted when with_total=true. Without a cursor the legacy offset mode is
+    used, where a negative offset counts back from the end.
+
+    Like every message endpoint, it takes an optional comma-separated
+    ``fields`` list; other columns are left out of the messages (chat_id and
+    msg_id are always included).
+    """
+    keyset = before_msg_id is not None or after_msg_id is not None or latest
     conn = get_db(chat_id)
     if not conn:
+        if keyset:
+            return {"total": 0 if with_total else None, "messages": [], "has_more": False}
         return {"total": 0, "offset": 0, "messages": []}
 
     try:
         cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM messages WHERE chat_id=?", (chat_id,))
-        total = cur.fetchone()[0]
-        if offset < 0:
-            offset = max(total + offset, 0)
+        total = None
+        if with_total or (with_total is None and not keyset) or (not keyset and offset < 0):
+            total = get_chat_stats(conn, chat_id)["total"]
 
         limit = max(1, min(int(limit), 200))
+        if keyset:
+            seek_sql, seek_params, ascending = _msg_id_cursor(before_msg_id, after_msg_id)
+            order_sql = "ORDER BY m.msg_id" if ascending else "ORDER BY m.msg_id DESC"
+            page_sql = "LIMIT ?"
+            page_params = (chat_id, *seek_params, limit + 1)
+        else:
+            if offset < 0:
+                offset = max(total + offset, 0)
+            seek_sql = ""
+            order_sql = "ORDER BY m.msg_id"
+            page_sql = "LIMIT ? OFFSET ?"
+            page_params = (chat_id, limit, offset)
+
         cur.execute(
-            """
-            SELECT
-                m.chat_id,
-                m.msg_id,
-                m.date,
-                m.timestamp,
-                m.msg_file_name,
-                m.user,
-                m.sender_id,
-                m.is_self,
-                m.msg,
-                m.ori_height,
-                m.ori_width,
-                m.og_info,
-                m.reactions,
-                m.replies_num,
-                m.msg_files,
-                m.reply_to_msg_id,
-                m.reply_to_top_id,
-                r.chat_id AS r_chat_id,
-                r.msg_id AS r_msg_id,
-                r.date AS r_date,
-                r.timestamp AS r_timestamp,
-                r.msg_file_name AS r_msg_file_name,
-                r.user AS r_user,
-                r.sender_id AS r_sender_id,
-                r.is_self AS r_is_self,
-                r.msg AS r_msg,
-                r.ori_height AS r_ori_height,
-                r.ori_width AS r_ori_width,
-                r.og_info AS r_og_info,
-                r.reactions AS r_reactions,
-                r.replies_num AS r_replies_num,
-                r.msg_files AS r_msg_files,
-                r.reply_to_msg_id AS r_reply_to_msg_id,
-                r.reply_to_top_id AS r_reply_to_top_id
-            FROM messages m
-            LEFT JOIN messages r
-                ON r.chat_id = m.chat_id AND r.msg_id = (
-                    CASE
-                        WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                        ELSE COALESCE(m.reply_to_top_id, 0)
-                    END
-                )
-            WHERE m.chat_id=?
-            ORDER BY m.msg_id
-            LIMIT ? OFFSET ?
-            """,
-            (chat_id, limit, offset),
+            select_messages_sql(f"m.chat_id=?{seek_sql}", order_sql, page_sql),
+            page_params,
         )
         rows = cur.fetchall()
-        messages = []
-        for row in rows:
-            raw = dict(row)
-            item = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
-
-            if raw.get("r_msg_id") is not None:
-                reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-                item["reply_message"] = row_to_message(reply_raw)
-            messages.append(item)
-        return {"total": total, "offset": offset, "messages": messages}
+        if keyset:
+            rows, has_more = _keyset_page(rows, limit, ascending)
+        messages = MessageDecoder(parse_fields(fields), raw_json=True).decode_rows(rows)
+        if keyset:
+            return _json_page({"total": total, "messages": messages, "has_more": has_more})
+        return _json_page({"total": total, "offset": offset, "messages": messages})
     finally:
         conn.close()
 
 
 @app.get("/messages_between/{chat_id}")
+@offload(read_pool)
 def get_messages_between(
     chat_id: str,
     start_msg_id: int = Query(...),
     end_msg_id: int = Query(...),
     direction: str = Query("down"),
     limit: int = Query(20),
+    fields: str | None = Query(None),
 ):
     """
     Fetch context messages between (start_msg_id, end_msg_id), exclusive.
@@ -1442,54 +1570,7 @@ def get_messages_between(
         cur = conn.cursor()
         order_sql = "ORDER BY m.msg_id" if direction == "down" else "ORDER BY m.msg_id DESC"
         cur.execute(
-            f"""
-            SELECT
-                m.chat_id,
-                m.msg_id,
-                m.date,
-                m.timestamp,
-                m.msg_file_name,
-                m.user,
-                m.sender_id,
-                m.is_self,
-                m.msg,
-                m.ori_height,
-                m.ori_width,
-                m.og_info,
-                m.reactions,
-                m.replies_num,
-                m.msg_files,
-                m.reply_to_msg_id,
-                m.reply_to_top_id,
-                r.chat_id AS r_chat_id,
-                r.msg_id AS r_msg_id,
-                r.date AS r_date,
-                r.timestamp AS r_timestamp,
-                r.msg_file_name AS r_msg_file_name,
-                r.user AS r_user,
-                r.sender_id AS r_sender_id,
-                r.is_self AS r_is_self,
-                r.msg AS r_msg,
-                r.ori_height AS r_ori_height,
-                r.ori_width AS r_ori_width,
-                r.og_info AS r_og_info,
-                r.reactions AS r_reactions,
-                r.replies_num AS r_replies_num,
-                r.msg_files AS r_msg_files,
-                r.reply_to_msg_id AS r_reply_to_msg_id,
-                r.reply_to_top_id AS r_reply_to_top_id
-            FROM messages m
-            LEFT JOIN messages r
-                ON r.chat_id = m.chat_id AND r.msg_id = (
-                    CASE
-                        WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                        ELSE COALESCE(m.reply_to_top_id, 0)
-                    END
-                )
-            WHERE m.chat_id=? AND m.msg_id > ? AND m.msg_id < ?
-            {order_sql}
-            LIMIT ?
-            """,
+            select_messages_sql("m.chat_id=? AND m.msg_id > ? AND m.msg_id < ?", order_sql, "LIMIT ?"),
             (chat_id, start_msg_id, end_msg_id, fetch_limit),
         )
         rows = cur.fetchall()
@@ -1498,22 +1579,16 @@ def get_messages_between(
         if direction == "up":
             rows = list(reversed(rows))
 
-        messages = []
-        for row in rows:
-            raw = dict(row)
-            item = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
-            if raw.get("r_msg_id") is not None:
-                reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-                item["reply_message"] = row_to_message(reply_raw)
-            messages.append(item)
-
-        return {"messages": messages, "has_more": has_more}
+        messages = MessageDecoder(parse_fields(fields), raw_json=True).decode_rows(rows)
+
+        return _json_page({"messages": messages, "has_more": has_more})
     finally:
         conn.close()
 
 
 @app.get("/messages/{chat_id}/{msg_id}")
-def get_message(chat_id: str, msg_id: int):
+@offload(read_pool)
+def get_message(chat_id: str, msg_id: int, fields: str | None = Query(None)):
     conn = get_db(chat_id)
     if not conn:
         return _json_error(400, "chat_id required")
@@ -1521,185 +1596,108 @@ def get_message(chat_id: str, msg_id: int):
     try:
         cur = conn.cursor()
         cur.execute(
-            """
-            SELECT
-                m.chat_id,
-                m.msg_id,
-                m.date,
-                m.timestamp,
-                m.msg_file_name,
-                m.user,
-                m.sender_id,
-                m.is_self,
-                m.msg,
-                m.ori_height,
-                m.ori_width,
-                m.og_info,
-                m.reactions,
-                m.replies_num,
-                m.msg_files,
-                m.reply_to_msg_id,
-                m.reply_to_top_id,
-                r.chat_id AS r_chat_id,
-                r.msg_id AS r_msg_id,
-                r.date AS r_date,
-                r.timestamp AS r_timestamp,
-                r.msg_file_name AS r_msg_file_name,
-                r.user AS r_user,
-                r.sender_id AS r_sender_id,
-                r.is_self AS r_is_self,
-                r.msg AS r_msg,
-                r.ori_height AS r_ori_height,
-                r.ori_width AS r_ori_width,
-                r.og_info AS r_og_info,
-                r.reactions AS r_reactions,
-                r.replies_num AS r_replies_num,
-                r.msg_files AS r_msg_files,
-                r.reply_to_msg_id AS r_reply_to_msg_id,
-                r.reply_to_top_id AS r_reply_to_top_id
-            FROM messages m
-            LEFT JOIN messages r
-                ON r.chat_id = m.chat_id AND r.msg_id = (
-                    CASE
-                        WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                        ELSE COALESCE(m.reply_to_top_id, 0)
-                    END
-                )
-            WHERE m.chat_id=? AND m.msg_id=?
-            """,
+            select_messages_sql("m.chat_id=? AND m.msg_id=?"),
             (chat_id, msg_id),
         )
         row = cur.fetchone()
         if not row:
             return {"total": 0, "offset": 0, "messages": []}
 
-        raw = dict(row)
-        message = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
-        if raw.get("r_msg_id") is not None:
-            reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-            message["reply_message"] = row_to_message(reply_raw)
-        return message
+        return _json_page(MessageDecoder(parse_fields(fields), raw_json=True).decode(row))
     finally:
         conn.close()
 
 
 @app.get("/replies/{chat_id}/{msg_id}")
+@offload(read_pool)
 def get_replies(
     chat_id: str,
     msg_id: int,
     offset: int = Query(0),
     limit: int = Query(20),
+    before_msg_id: int | None = Query(None),
+    after_msg_id: int | None = Query(None),
+    latest: bool = Query(False),
+    with_total: bool | None = Query(None),
+    fields: str | None = Query(None),
 ):
+    """Page through the replies of a message; cursors work as in /messages/{chat_id}."""
+    keyset = before_msg_id is not None or after_msg_id is not None or latest
     conn = get_db(chat_id)
     if not conn:
+        if keyset:
+            return {"total": 0 if with_total else None, "messages": [], "has_more": False}
         return {"total": 0, "offset": 0, "messages": []}
 
     msg_id = int(msg_id)
     try:
         cur = conn.cursor()
-        cur.execute(
-            "SELECT COUNT(*) FROM messages WHERE chat_id=? AND (reply_to_msg_id=? OR reply_to_top_id=?)",
-            (chat_id, msg_id, msg_id),
-        )
-        total = int(cur.fetchone()[0])
-        if offset < 0:
-            offset = max(total + offset, 0)
+        total = None
+        if with_total or (with_total is None and not keyset) or (not keyset and offset < 0):
+            cur.execute(
+                "SELECT COUNT(*) FROM messages WHERE chat_id=? AND (reply_to_msg_id=? OR reply_to_top_id=?)",
+                (chat_id, msg_id, msg_id),
+            )
+            total = int(cur.fetchone()[0])
 
-        offset = max(int(offset), 0)
         limit = max(1, min(int(limit), 200))
+        if keyset:
+            seek_sql, seek_params, ascending = _msg_id_cursor(before_msg_id, after_msg_id)
+            order_sql = "ORDER BY m.msg_id" if ascending else "ORDER BY m.msg_id DESC"
+            page_sql = "LIMIT ?"
+            page_params = (chat_id, msg_id, msg_id, *seek_params, limit + 1)
+        else:
+            if offset < 0:
+                offset = max(total + offset, 0)
+            offset = max(int(offset), 0)
+            seek_sql = ""
+            order_sql = "ORDER BY m.msg_id"
+            page_sql = "LIMIT ? OFFSET ?"
+            page_params = (chat_id, msg_id, msg_id, limit, offset)
 
         cur.execute(
-            """
-            SELECT
-                m.chat_id,
-                m.msg_id,
-                m.date,
-                m.timestamp,
-                m.msg_file_name,
-                m.user,
-                m.sender_id,
-                m.is_self,
-                m.msg,
-                m.ori_height,
-                m.ori_width,
-                m.og_info,
-                m.reactions,
-                m.replies_num,
-                m.msg_files,
-                m.reply_to_msg_id,
-                m.reply_to_top_id,
-                r.chat_id AS r_chat_id,
-                r.msg_id AS r_msg_id,
-                r.date AS r_date,
-                r.timestamp AS r_timestamp,
-                r.msg_file_name AS r_msg_file_name,
-                r.user AS r_user,
-                r.sender_id AS r_sender_id,
-                r.is_self AS r_is_self,
-                r.msg AS r_msg,
-                r.ori_height AS r_ori_height,
-                r.ori_width AS r_ori_width,
-                r.og_info AS r_og_info,
-                r.reactions AS r_reactions,
-                r.replies_num AS r_replies_num,
-                r.msg_files AS r_msg_files,
-                r.reply_to_msg_id AS r_reply_to_msg_id,
-                r.reply_to_top_id AS r_reply_to_top_id
-            FROM messages m
-            LEFT JOIN messages r
-                ON r.chat_id = m.chat_id AND r.msg_id = (
-                    CASE
-                        WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                        ELSE COALESCE(m.reply_to_top_id, 0)
-                    END
-                )
-            WHERE m.chat_id=? AND (m.reply_to_msg_id=? OR m.reply_to_top_id=?)
-            ORDER BY m.msg_id
-            LIMIT ? OFFSET ?
-            """,
-            (chat_id, msg_id, msg_id, limit, offset),
+            select_messages_sql(f"m.chat_id=? AND (m.reply_to_msg_id=? OR m.reply_to_top_id=?){seek_sql}", order_sql, page_sql),
+            page_params,
         )
         rows = cur.fetchall()
-        messages = []
-        for row in rows:
-            raw = dict(row)
-            item = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
-            if raw.get("r_msg_id") is not None:
-                reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-                item["reply_message"] = row_to_message(reply_raw)
-            messages.append(item)
-        return {"total": total, "offset": offset, "messages": messages}
+        if keyset:
+            rows, has_more = _keyset_page(rows, limit, ascending)
+        messages = MessageDecoder(parse_fields(fields), raw_json=True).decode_rows(rows)
+        if keyset:
+            return _json_page({"total": total, "messages": messages, "has_more": has_more})
+        return _json_page({"total": total, "offset": offset, "messages": messages})
     finally:
         conn.close()
 
 
 @app.get("/reactions_emoticons/{chat_id}")
+@offload(read_pool)
 def get_reactions_emoticons(chat_id: str):
     conn = get_db(chat_id)
     if not conn:
         return {"emoticons": []}
 
-    totals: dict[str, int] = {}
     try:
         cur = conn.cursor()
-        cur.execute("SELECT reactions FROM messages WHERE chat_id=? AND reactions IS NOT NULL", (chat_id,))
-        for row in cur.fetchall():
-            reactions_obj = _parse_reactions_blob(row["reactions"])
-            for emoticon, count in _iter_reaction_emoticon_counts(reactions_obj):
-                totals[emoticon] = totals.get(emoticon, 0) + count
+        cur.execute(
+            "SELECT emoticon, total FROM reaction_totals WHERE chat_id=? ORDER BY total DESC, emoticon",
+            (chat_id,),
+        )
+        emoticons = [{"emoticon": row["emoticon"], "count": int(row["total"])} for row in cur.fetchall()]
     finally:
         conn.close()
 
-    emoticons = [{"emoticon": e, "count": totals[e]} for e in sorted(totals.keys(), key=lambda k: (-totals[k], k))]
     return {"emoticons": emoticons}
 
 
 @app.get("/messages_by_reaction/{chat_id}")
+@offload(read_pool)
 def get_messages_by_reaction(
     chat_id: str,
     emoticon: str = Query(""),
     offset: int = Query(0),
     limit: int = Query(20),
+    fields: str | None = Query(None),
 ):
     emoticon = (emoticon or "").strip()
     if not emoticon:
@@ -1714,310 +1712,193 @@ def get_messages_by_reaction(
 
     try:
         cur = conn.cursor()
+        cur.execute("SELECT messages FROM reaction_totals WHERE chat_id=? AND emoticon=?", (chat_id, emoticon))
+        row = cur.fetchone()
+        total = int(row["messages"]) if row else 0
+
         cur.execute(
-            "SELECT msg_id, timestamp, reactions FROM messages WHERE chat_id=? AND reactions IS NOT NULL",
-            (chat_id,),
+            """
+            SELECT msg_id, count FROM message_reactions
+            WHERE chat_id=? AND emoticon=? AND count > 0
+            ORDER BY count DESC, timestamp DESC, msg_id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (chat_id, emoticon, limit, offset),
         )
-
-        scored = []
-        for row in cur.fetchall():
-            reactions_obj = _parse_reactions_blob(row["reactions"])
-            count = _get_reaction_count_for_emoticon(reactions_obj, emoticon)
-            if count > 0:
-                scored.append((count, int(row["timestamp"] or 0), int(row["msg_id"])))
-
-        scored.sort(key=lambda t: (-t[0], -t[1], -t[2]))
-        total = len(scored)
-
-        page = scored[offset : offset + limit]
-        msg_ids = [t[2] for t in page]
-        counts_by_msg_id = {t[2]: t[0] for t in page}
+        page = cur.fetchall()
+        msg_ids = [int(r["msg_id"]) for r in page]
+        counts_by_msg_id = {int(r["msg_id"]): int(r["count"]) for r in page}
 
         messages = []
         if msg_ids:
             placeholders = ",".join(["?"] * len(msg_ids))
             cur.execute(
-                f"""
-                SELECT
-                    m.chat_id,
-                    m.msg_id,
-                    m.date,
-                    m.timestamp,
-                    m.msg_file_name,
-                    m.user,
-                    m.msg,
-                    m.ori_height,
-                    m.ori_width,
-                    m.og_info,
-                    m.reactions,
-                    m.replies_num,
-                    m.msg_files,
-                    m.reply_to_msg_id,
-                    m.reply_to_top_id,
-                    r.chat_id AS r_chat_id,
-                    r.msg_id AS r_msg_id,
-                    r.date AS r_date,
-                    r.timestamp AS r_timestamp,
-                    r.msg_file_name AS r_msg_file_name,
-                    r.user AS r_user,
-                    r.msg AS r_msg,
-                    r.ori_height AS r_ori_height,
-                    r.ori_width AS r_ori_width,
-                    r.og_info AS r_og_info,
-                    r.reactions AS r_reactions,
-                    r.replies_num AS r_replies_num,
-                    r.msg_files AS r_msg_files,
-                    r.reply_to_msg_id AS r_reply_to_msg_id,
-                    r.reply_to_top_id AS r_reply_to_top_id
-                FROM messages m
-                LEFT JOIN messages r
-                    ON r.chat_id = m.chat_id AND r.msg_id = (
-                        CASE
-                            WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                            ELSE COALESCE(m.reply_to_top_id, 0)
-                        END
-                    )
-                WHERE m.chat_id=? AND m.msg_id IN ({placeholders})
-                """,
+                select_messages_sql(f"m.chat_id=? AND m.msg_id IN ({placeholders})"),
                 (chat_id, *msg_ids),
             )
-            rows = cur.fetchall()
-            rows_by_id = {int(r["msg_id"]): r for r in rows}
+            decoder = MessageDecoder(parse_fields(fields), raw_json=True)
+            rows_by_id = {int(row[1]): row for row in cur.fetchall()}
 
             for mid in msg_ids:
                 row = rows_by_id.get(int(mid))
                 if not row:
                     continue
 
-                raw = dict(row)
-                item = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
+                item = decoder.decode(row)
                 item["reaction_sort_emoticon"] = emoticon
                 item["reaction_sort_count"] = counts_by_msg_id.get(int(mid), 0)
-                if raw.get("r_msg_id") is not None:
-                    reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-                    item["reply_message"] = row_to_message(reply_raw)
-
                 messages.append(item)
-        return {"total": total, "offset": offset, "messages": messages}
+        return _json_page({"total": total, "offset": offset, "messages": messages})
     finally:
         conn.close()
 
 
 @app.get("/messages_by_replies_num/{chat_id}")
+@offload(read_pool)
 def get_messages_by_replies_num(
     chat_id: str,
     offset: int = Query(0),
     limit: int = Query(20),
+    cursor: str | None = Query(None),
+    with_total: bool | None = Query(None),
+    fields: str | None = Query(None),
 ):
+    """
+    Page through messages that have replies, most replied first.
+
+    Passing cursor (the `next_cursor` of the previous page, or an empty string
+    for the first page) switches to keyset mode, which seeks on the partial
+    idx_messages_chat_replies_num index instead of skipping `offset` rows.
+    """
+    keyset = cursor is not None
     conn = get_db(chat_id)
     if not conn:
+        if keyset:
+            return {"total": 0 if with_total else None, "messages": [], "has_more": False, "next_cursor": None}
         return {"total": 0, "offset": 0, "messages": []}
 
     limit = max(1, min(int(limit), 100))
     try:
         cur = conn.cursor()
-        cur.execute(
-            "SELECT COUNT(*) FROM messages WHERE chat_id=? AND COALESCE(replies_num, 0) > 0",
-            (chat_id,),
-        )
-        total = int(cur.fetchone()[0])
-        if offset < 0:
-            offset = max(total + offset, 0)
-        offset = max(int(offset), 0)
+        total = None
+        if with_total or (with_total is None and not keyset) or (not keyset and offset < 0):
+            total = get_chat_stats(conn, chat_id)["with_replies"]
+
+        if keyset:
+            seek_sql = ""
+            seek_params: tuple = ()
+            if cursor:
+                position = _parse_replies_num_cursor(cursor)
+                if position is None:
+                    return _json_error(400, "invalid cursor")
+                seek_sql = " AND (m.replies_num, COALESCE(m.timestamp, 0), m.msg_id) < (?, ?, ?)"
+                seek_params = position
+            page_sql = "LIMIT ?"
+            page_params = (chat_id, *seek_params, limit + 1)
+        else:
+            if offset < 0:
+                offset = max(total + offset, 0)
+            offset = max(int(offset), 0)
+            seek_sql = ""
+            page_sql = "LIMIT ? OFFSET ?"
+            page_params = (chat_id, limit, offset)
 
         cur.execute(
-            """
-            SELECT
-                m.chat_id,
-                m.msg_id,
-                m.date,
-                m.timestamp,
-                m.msg_file_name,
-                m.user,
-                m.sender_id,
-                m.is_self,
-                m.msg,
-                m.ori_height,
-                m.ori_width,
-                m.og_info,
-                m.reactions,
-                m.replies_num,
-                m.msg_files,
-                m.reply_to_msg_id,
-                m.reply_to_top_id,
-                r.chat_id AS r_chat_id,
-                r.msg_id AS r_msg_id,
-                r.date AS r_date,
-                r.timestamp AS r_timestamp,
-                r.msg_file_name AS r_msg_file_name,
-                r.user AS r_user,
-                r.sender_id AS r_sender_id,
-                r.is_self AS r_is_self,
-                r.msg AS r_msg,
-                r.ori_height AS r_ori_height,
-                r.ori_width AS r_ori_width,
-                r.og_info AS r_og_info,
-                r.reactions AS r_reactions,
-                r.replies_num AS r_replies_num,
-                r.msg_files AS r_msg_files,
-                r.reply_to_msg_id AS r_reply_to_msg_id,
-                r.reply_to_top_id AS r_reply_to_top_id
-            FROM messages m
-            LEFT JOIN messages r
-                ON r.chat_id = m.chat_id AND r.msg_id = (
-                    CASE
-                        WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                        ELSE COALESCE(m.reply_to_top_id, 0)
-                    END
-                )
-            WHERE m.chat_id=? AND COALESCE(m.replies_num, 0) > 0
-            ORDER BY COALESCE(m.replies_num, 0) DESC, m.timestamp DESC, m.msg_id DESC
-            LIMIT ? OFFSET ?
-            """,
-            (chat_id, limit, offset),
+            select_messages_sql(f"m.chat_id=? AND m.replies_num > 0{seek_sql}", "ORDER BY m.replies_num DESC, COALESCE(m.timestamp, 0) DESC, m.msg_id DESC", page_sql),
+            page_params,
         )
         rows = cur.fetchall()
-        messages = []
-        for row in rows:
-            raw = dict(row)
-            item = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
-            if raw.get("r_msg_id") is not None:
-                reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-                item["reply_message"] = row_to_message(reply_raw)
-            messages.append(item)
-
-        return {"total": total, "offset": offset, "messages": messages}
+        if keyset:
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        messages = MessageDecoder(parse_fields(fields), raw_json=True).decode_rows(rows)
+
+        if keyset:
+            next_cursor = None
+            if has_more and rows:
+                last = rows[-1]
+                next_cursor = f"{int(last['replies_num'])}:{int(last['timestamp'] or 0)}:{int(last['msg_id'])}"
+            return _json_page({"total": total, "messages": messages, "has_more": has_more, "next_cursor": next_cursor})
+        return _json_page({"total": total, "offset": offset, "messages": messages})
     finally:
         conn.close()
 
 
 @app.get("/search/{chat_id}")
+@offload(search_pool)
 def search_messages(
     chat_id: str,
     q: str = Query(""),
     offset: int = Query(0),
     limit: int = Query(20),
+    before_msg_id: int | None = Query(None),
+    after_msg_id: int | None = Query(None),
+    latest: bool = Query(False),
+    with_total: bool | None = Query(None),
+    fields: str | None = Query(None),
 ):
+    """Search a chat; cursors work as in /messages/{chat_id}."""
     query = (q or "").strip().lower()
+    keyset = before_msg_id is not None or after_msg_id is not None or latest
     conn = get_db(chat_id)
     if not conn:
+        if keyset:
+            return {"total": 0 if with_total else None, "messages": [], "has_more": False}
         return {"total": 0, "offset": 0, "messages": []}
 
     try:
         cur = conn.cursor()
         if not query:
-            cur.execute("SELECT COUNT(*) FROM messages WHERE chat_id=?", (chat_id,))
-            total = cur.fetchone()[0]
+            if keyset:
+                return {"total": 0 if with_total else None, "messages": [], "has_more": False}
+            total = get_chat_stats(conn, chat_id)["total"]
             if offset < 0:
                 offset = max(total + offset, 0)
             return {"total": total, "offset": offset, "messages": []}
 
-        keywords = query.split()
-        conditions = []
-        params = []
-        fields_or = " OR ".join([
-            "LOWER(m.date) LIKE ?",
-            'LOWER(COALESCE(m.msg, "")) LIKE ?',
-            'LOWER(COALESCE(m.msg_file_name, "")) LIKE ?',
-        ])
-                
-        for kw in keywords:
-            neg = kw.startswith("-")
-            kw = kw[1:] if neg else kw
-            kw = kw.strip().lower()
-            if not kw:
-                continue
-            
-            pattern = f"%{kw}%"
-            if neg:
-                conditions.append(f"NOT ({fields_or})")
-            else:
-                conditions.append(f"({fields_or})")
-            params.extend([pattern, pattern, pattern])
-
-        where_sql = ""
-        if conditions:
-            where_sql = " AND " + " AND ".join(conditions)
-
-        sql_count = f"""
-            SELECT COUNT(*) FROM messages m
-            WHERE m.chat_id=?{where_sql}
-        """
-        cur.execute(sql_count, (chat_id, *params))
-        total = cur.fetchone()[0]
-
-        if offset < 0:
-            offset = max(total + offset, 0)
-        offset = max(int(offset), 0)
-        limit = max(1, min(int(limit), 200))
+        join_sql, where_sql, params = build_message_search(query, chat_rows=get_chat_stats(conn, chat_id)["total"])
 
-        sql_page = f"""
-            SELECT
-                m.chat_id,
-                m.msg_id,
-                m.date,
-                m.timestamp,
-                m.msg_file_name,
-                m.user,
-                m.sender_id,
-                m.is_self,
-                m.msg,
-                m.ori_height,
-                m.ori_width,
-                m.og_info,
-                m.reactions,
-                m.replies_num,
-                m.msg_files,
-                m.reply_to_msg_id,
-                m.reply_to_top_id,
-                r.chat_id AS r_chat_id,
-                r.msg_id AS r_msg_id,
-                r.date AS r_date,
-                r.timestamp AS r_timestamp,
-                r.msg_file_name AS r_msg_file_name,
-                r.user AS r_user,
-                r.sender_id AS r_sender_id,
-                r.is_self AS r_is_self,
-                r.msg AS r_msg,
-                r.ori_height AS r_ori_height,
-                r.ori_width AS r_ori_width,
-                r.og_info AS r_og_info,
-                r.reactions AS r_reactions,
-                r.replies_num AS r_replies_num,
-                r.msg_files AS r_msg_files,
-                r.reply_to_msg_id AS r_reply_to_msg_id,
-                r.reply_to_top_id AS r_reply_to_top_id
-            FROM messages m
-            LEFT JOIN messages r
-                ON r.chat_id = m.chat_id AND r.msg_id = (
-                    CASE
-                        WHEN COALESCE(m.reply_to_msg_id, 0) != 0 THEN m.reply_to_msg_id
-                        ELSE COALESCE(m.reply_to_top_id, 0)
-                    END
-                )
-            WHERE m.chat_id=?{where_sql}
-            ORDER BY m.msg_id
-            LIMIT ? OFFSET ?
-        """
-        cur.execute(sql_page, (chat_id, *params, limit, offset))
-        rows = cur.fetchall()
+        total = None
+        if with_total or (with_total is None and not keyset) or (not keyset and offset < 0):
+            sql_count = f"""
+                SELECT COUNT(*) FROM {join_sql} messages m
+                WHERE m.chat_id=?{where_sql}
+            """
+            cur.execute(sql_count, (chat_id, *params))
+            total = cur.fetchone()[0]
 
-        messages = []
-        for row in rows:
-            raw = dict(row)
-            item = row_to_message({k: v for k, v in raw.items() if not k.startswith("r_")})
+        limit = max(1, min(int(limit), 200))
+        if keyset:
+            seek_sql, seek_params, ascending = _msg_id_cursor(before_msg_id, after_msg_id)
+            order_sql = "ORDER BY m.msg_id" if ascending else "ORDER BY m.msg_id DESC"
+            page_sql = "LIMIT ?"
+            page_params = (chat_id, *params, *seek_params, limit + 1)
+        else:
+            if offset < 0:
+                offset = max(total + offset, 0)
+            offset = max(int(offset), 0)
+            seek_sql = ""
+            order_sql = "ORDER BY m.msg_id"
+            page_sql = "LIMIT ? OFFSET ?"
+            page_params = (chat_id, *params, limit, offset)
+
+        sql_page = select_messages_sql(f"m.chat_id=?{where_sql}{seek_sql}", order_sql, page_sql, from_sql=f"{join_sql} messages m")
+        cur.execute(sql_page, page_params)
+        rows = cur.fetchall()
+        if keyset:
+            rows, has_more = _keyset_page(rows, limit, ascending)
 
-            if raw.get("r_msg_id") is not None:
-                reply_raw = {k[2:]: v for k, v in raw.items() if k.startswith("r_")}
-                item["reply_message"] = row_to_message(reply_raw)
-            messages.append(item)
+        messages = MessageDecoder(parse_fields(fields), raw_json=True).decode_rows(rows)
 
-        return {"total": total, "offset": offset, "messages": messages}
+        if keyset:
+            return _json_page({"total": total, "messages": messages, "has_more": has_more})
+        return _json_page({"total": total, "offset": offset, "messages": messages})
     finally:
         conn.close()
 
 
 @app.post("/execute_sql")
+@offload(admin_pool)
 def execute_sql(payload: ExecuteSqlRequest):
     chat_id = str(payload.chat_id or "").strip()
     sql_str = str(payload.sql_str or "").strip()
@@ -2041,6 +1922,9 @@ def execute_sql(payload: ExecuteSqlRequest):
             return {"results": results}
         affected = cur.rowcount
         conn.commit()
+        # Arbitrary writes can touch any message, so recount instead of guessing a delta.
+        rebuild_chat_stats(conn, chat_id)
+        rebuild_message_reactions(conn, chat_id)
         return {"message": "SQL 执行成功", "affected_rows": affected}
     except sqlite3.Error as e:
         return _json_error(500, str(e))
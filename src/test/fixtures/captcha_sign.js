@@ -0,0 +1,148 @@
+// The JS routine the Xunlei captcha sign was lifted from: T(s) is hex(md5(utf8(s))),
+// blueimp-md5 style. Reference for the tests and scripts/bench_captcha_sign.py.
+function m(input) {
+    var i, output = [];
+    for (output[(input.length >> 2) - 1] = void 0,
+    i = 0; i < output.length; i += 1)
+        output[i] = 0;
+    var e = 8 * input.length;
+    for (i = 0; i < e; i += 8)
+        output[i >> 5] |= (255 & input.charCodeAt(i / 8)) << i % 32;
+    return output
+}
+function o(e, t) {
+    var r = (65535 & e) + (65535 & t);
+    return (e >> 16) + (t >> 16) + (r >> 16) << 16 | 65535 & r
+}
+function c(q, a, b, e, s, t) {
+    return o((r = o(o(a, q), o(e, t))) << (n = s) | r >>> 32 - n, b);
+    var r, n
+}
+function l(a, b, e, t, r, s, n) {
+    return c(b & e | ~b & t, a, b, r, s, n)
+}
+function d(a, b, e, t, r, s, n) {
+    return c(b & t | e & ~t, a, b, r, s, n)
+}
+function f(a, b, e, t, r, s, n) {
+    return c(b ^ e ^ t, a, b, r, s, n)
+}
+function h(a, b, e, t, r, s, n) {
+    return c(e ^ (b | ~t), a, b, r, s, n)
+}
+function _(e, t) {
+    var i, r, n, c, _;
+    e[t >> 5] |= 128 << t % 32,
+    e[14 + (t + 64 >>> 9 << 4)] = t;
+    var a = 1732584193
+        , b = -271733879
+        , v = -1732584194
+        , m = 271733878;
+    for (i = 0; i < e.length; i += 16)
+        r = a,
+        n = b,
+        c = v,
+        _ = m,
+        a = l(a, b, v, m, e[i], 7, -680876936),
+        m = l(m, a, b, v, e[i + 1], 12, -389564586),
+        v = l(v, m, a, b, e[i + 2], 17, 606105819),
+        b = l(b, v, m, a, e[i + 3], 22, -1044525330),
+        a = l(a, b, v, m, e[i + 4], 7, -176418897),
+        m = l(m, a, b, v, e[i + 5], 12, 1200080426),
+        v = l(v, m, a, b, e[i + 6], 17, -1473231341),
+        b = l(b, v, m, a, e[i + 7], 22, -45705983),
+        a = l(a, b, v, m, e[i + 8], 7, 1770035416),
+        m = l(m, a, b, v, e[i + 9], 12, -1958414417),
+        v = l(v, m, a, b, e[i + 10], 17, -42063),
+        b = l(b, v, m, a, e[i + 11], 22, -1990404162),
+        a = l(a, b, v, m, e[i + 12], 7, 1804603682),
+        m = l(m, a, b, v, e[i + 13], 12, -40341101),
+        v = l(v, m, a, b, e[i + 14], 17, -1502002290),
+        a = d(a, b = l(b, v, m, a, e[i + 15], 22, 1236535329), v, m, e[i + 1], 5, -165796510),
+        m = d(m, a, b, v, e[i + 6], 9, -1069501632),
+        v = d(v, m, a, b, e[i + 11], 14, 643717713),
+        b = d(b, v, m, a, e[i], 20, -373897302),
+        a = d(a, b, v, m, e[i + 5], 5, -701558691),
+        m = d(m, a, b, v, e[i + 10], 9, 38016083),
+        v = d(v, m, a, b, e[i + 15], 14, -660478335),
+        b = d(b, v, m, a, e[i + 4], 20, -405537848),
+        a = d(a, b, v, m, e[i + 9], 5, 568446438),
+        m = d(m, a, b, v, e[i + 14], 9, -1019803690),
+        v = d(v, m, a, b, e[i + 3], 14, -187363961),
+        b = d(b, v, m, a, e[i + 8], 20, 1163531501),
+        a = d(a, b, v, m, e[i + 13], 5, -1444681467),
+        m = d(m, a, b, v, e[i + 2], 9, -51403784),
+        v = d(v, m, a, b, e[i + 7], 14, 1735328473),
+        a = f(a, b = d(b, v, m, a, e[i + 12], 20, -1926607734), v, m, e[i + 5], 4, -378558),
+        m = f(m, a, b, v, e[i + 8], 11, -2022574463),
+        v = f(v, m, a, b, e[i + 11], 16, 1839030562),
+        b = f(b, v, m, a, e[i + 14], 23, -35309556),
+        a = f(a, b, v, m, e[i + 1], 4, -1530992060),
+        m = f(m, a, b, v, e[i + 4], 11, 1272893353),
+        v = f(v, m, a, b, e[i + 7], 16, -155497632),
+        b = f(b, v, m, a, e[i + 10], 23, -1094730640),
+        a = f(a, b, v, m, e[i + 13], 4, 681279174),
+        m = f(m, a, b, v, e[i], 11, -358537222),
+        v = f(v, m, a, b, e[i + 3], 16, -722521979),
+        b = f(b, v, m, a, e[i + 6], 23, 76029189),
+        a = f(a, b, v, m, e[i + 9], 4, -640364487),
+        m = f(m, a, b, v, e[i + 12], 11, -421815835),
+        v = f(v, m, a, b, e[i + 15], 16, 530742520),
+        a = h(a, b = f(b, v, m, a, e[i + 2], 23, -995338651), v, m, e[i], 6, -198630844),
+        m = h(m, a, b, v, e[i + 7], 10, 1126891415),
+        v = h(v, m, a, b, e[i + 14], 15, -1416354905),
+        b = h(b, v, m, a, e[i + 5], 21, -57434055),
+        a = h(a, b, v, m, e[i + 12], 6, 1700485571),
+        m = h(m, a, b, v, e[i + 3], 10, -1894986606),
+        v = h(v, m, a, b, e[i + 10], 15, -1051523),
+        b = h(b, v, m, a, e[i + 1], 21, -2054922799),
+        a = h(a, b, v, m, e[i + 8], 6, 1873313359),
+        m = h(m, a, b, v, e[i + 15], 10, -30611744),
+        v = h(v, m, a, b, e[i + 6], 15, -1560198380),
+        b = h(b, v, m, a, e[i + 13], 21, 1309151649),
+        a = h(a, b, v, m, e[i + 4], 6, -145523070),
+        m = h(m, a, b, v, e[i + 11], 10, -1120210379),
+        v = h(v, m, a, b, e[i + 2], 15, 718787259),
+        b = h(b, v, m, a, e[i + 9], 21, -343485551),
+        a = o(a, r),
+        b = o(b, n),
+        v = o(v, c),
+        m = o(m, _);
+    return [a, b, v, m]
+}
+function v(input) {
+    var i, output = "", e = 32 * input.length;
+    for (i = 0; i < e; i += 8)
+        output += String.fromCharCode(input[i >> 5] >>> i % 32 & 255);
+    return output
+}
+function y(input) {
+    var e, i, t = "0123456789abcdef", output = "";
+    for (i = 0; i < input.length; i += 1)
+        e = input.charCodeAt(i),
+        output += t.charAt(e >>> 4 & 15) + t.charAt(15 & e);
+    return output
+}
+function x(e, t) {
+    return function(e, data) {
+        var i, t, r = m(e), n = [], o = [];
+        for (n[15] = o[15] = void 0,
+        r.length > 16 && (r = _(r, 8 * e.length)),
+        i = 0; i < 16; i += 1)
+            n[i] = 909522486 ^ r[i],
+            o[i] = 1549556828 ^ r[i];
+        return t = _(n.concat(m(data)), 512 + 8 * data.length),
+        v(_(o.concat(t), 640))
+    }(E(e), E(t))
+}
+function E(input) {
+    return unescape(encodeURIComponent(input))
+}
+function I(s) {
+    return function(s) {
+        return v(_(m(s), 8 * s.length))
+    }(E(s))
+}
+function T(e, t, r) {
+    return t ? r ? x(t, e) : y(x(t, e)) : r ? I(e) : y(I(e))
+}
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from telegram_bot.chat_scheduler import ChatScheduler
+
+
+def _scheduler(run_chat=lambda chat_id, cancel: 0, workers=1):
+    return ChatScheduler(
+        run_chat,
+        workers=workers,
+        min_interval=60,
+        max_interval=3600,
+        default_interval=600,
+        target_messages=10,
+    )
+
+
+def test_interval_follows_the_message_rate():
+    scheduler = _scheduler()
+    scheduler.add("busy")
+    busy = scheduler._chats["busy"]
+
+    # The first run has no window to measure a rate over.
+    assert scheduler.next_interval(busy, 500, started_at=1000.0) == 600
+    busy.last_run_at = 1000.0
+    # 100 messages in 100s is 1/s; 10 messages per run means a 10s interval, clamped to 60.
+    assert scheduler.next_interval(busy, 100, started_at=1100.0) == 60
+
+    scheduler.add("quiet")
+    quiet = scheduler._chats["quiet"]
+    quiet.last_run_at = 0.0
+    # 10 messages in 1200s: aim for 10 per run.
+    assert scheduler.next_interval(quiet, 10, started_at=1200.0) == 1200
+
+    scheduler.add("silent")
+    silent = scheduler._chats["silent"]
+    silent.last_run_at = 0.0
+    intervals = []
+    for run in range(1, 5):
+        silent.interval = scheduler.next_interval(silent, 0, started_at=run * 600.0)
+        silent.last_run_at = run * 600.0
+        intervals.append(silent.interval)
+    assert intervals == [1200, 2400, 3600, 3600]
+
+
+def test_due_chats_share_the_worker_pool():
+    running, peak, runs = [0], [0], []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def run_chat(chat_id, cancel):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+            runs.append(chat_id)
+            if len(runs) == 4:
+                done.set()
+        return 0
+
+    scheduler = _scheduler(run_chat, workers=2)
+    for chat_id in ("a", "b", "c", "d"):
+        scheduler.add(chat_id)
+    assert not scheduler.add("a")
+    scheduler.start()
+
+    assert done.wait(2)
+    assert sorted(runs) == ["a", "b", "c", "d"]
+    assert peak[0] == 2
+    snapshot = {chat["chat_id"]: chat for chat in scheduler.snapshot()}
+    assert set(snapshot) == {"a", "b", "c", "d"}
+    assert all(chat["due_in_seconds"] > 500 for chat in snapshot.values())
+
+    assert scheduler.remove("a")
+    assert not scheduler.has("a")
+    assert {chat["chat_id"] for chat in scheduler.snapshot()} == {"b", "c", "d"}
+
+
+def test_cancel_stops_the_running_export_but_keeps_the_chat_scheduled():
+    started, finished = threading.Event(), threading.Event()
+    seen = {}
+
+    def run_chat(chat_id, cancel):
+        started.set()
+        seen["cancelled"] = cancel.wait(2)
+        finished.set()
+        return 0
+
+    scheduler = _scheduler(run_chat)
+    scheduler.add("a")
+    assert not scheduler.cancel("a")
+    scheduler.start()
+
+    assert started.wait(2)
+    assert scheduler.cancel("a")
+    assert finished.wait(2)
+    assert seen["cancelled"]
+    deadline = time.monotonic() + 2
+    while scheduler.snapshot()[0]["running"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    assert scheduler.has("a")
+
+
+def test_tdl_command_is_terminated_when_cancelled():
+    import sys
+
+    from telegram_bot import update_messages
+
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.monotonic()
+    result = update_messages._run_tdl_command(
+        [sys.executable, "-c", "import time; time.sleep(30)"],
+        update_messages.get_logger("test"),
+        "fake tdl",
+        timeout_seconds=60,
+        cancel=cancel,
+    )
+    assert result.returncode == update_messages.TDL_CANCELLED_RETURNCODE
+    assert time.monotonic() - started < 10
@@ -0,0 +1,61 @@
+import asyncio
+import inspect
+import threading
+
+import pytest
+
+from telegram_bot.db_pool import DbPool, PoolBusy, offload
+
+
+def test_full_pool_rejects_instead_of_queueing():
+    pool = DbPool("test", threads=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.create_task(pool.run(release.wait, 5))
+        while pool.stats()["pending"] == 0:
+            await asyncio.sleep(0.01)
+        with pytest.raises(PoolBusy):
+            await pool.run(lambda: None)
+        release.set()
+        return await running
+
+    assert asyncio.run(scenario()) is True
+    assert pool.stats() == {"threads": 1, "pending": 0, "max_pending": 1, "rejected": 1}
+
+
+def test_offload_keeps_the_route_signature():
+    pool = DbPool("test", threads=1)
+
+    def route(chat_id: str, limit: int = 20):
+        assert threading.current_thread().name.startswith("db-test")
+        return {"chat_id": chat_id, "limit": limit}
+
+    handler = offload(pool)(route)
+    assert inspect.iscoroutinefunction(handler)
+    assert inspect.signature(handler) == inspect.signature(route)
+    assert asyncio.run(handler("chat-1", limit=5)) == {"chat_id": "chat-1", "limit": 5}
+
+
+def test_cancelled_waiters_keep_counting_until_their_call_finishes():
+    pool = DbPool("test", threads=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        waiter = asyncio.create_task(pool.run(release.wait, 5))
+        while pool.stats()["pending"] == 0:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The call is still running on the pool thread, so the bound holds.
+        assert pool.stats()["pending"] == 1
+        with pytest.raises(PoolBusy):
+            await pool.run(lambda: None)
+        release.set()
+        while pool.stats()["pending"]:
+            await asyncio.sleep(0.01)
+        return await pool.run(lambda: "ok")
+
+    assert asyncio.run(scenario()) == "ok"
@@ -1,3 +1,6 @@
+import threading
+import time
+
 from telegram_bot import message_utils
 
 class _FakeResponse:
@@ -25,3 +28,59 @@ def test_is_ali_link_stale(monkeypatch):
     assert message_utils.is_ali_link_stale("https://www.alipan.com/s/empty_files_no_pwd") is True
     assert message_utils.is_ali_link_stale("https://www.alipan.com/s/ok") is False
         
+
+
+class _FakeBdPan:
+    def is_share_link(self, link: str) -> bool:
+        return link.startswith("https://pan.baidu.com/s/")
+
+
+def test_filter_messages_checks_share_links_once_and_concurrently(tmp_path, monkeypatch):
+    from telegram_bot import db_utils, link_check
+
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    stale_links = {"https://pan.quark.cn/s/dead", "https://pan.baidu.com/s/dead"}
+    calls = []
+    active = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_check(provider, link):
+        with lock:
+            calls.append((provider, link))
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        return link in stale_links
+
+    monkeypatch.setattr(link_check, "_bdpan", _FakeBdPan())
+    monkeypatch.setattr(link_check, "check_link", fake_check)
+
+    messages = [
+        {"id": 1, "text": "plain text"},
+        {"id": 2, "text": "https://pan.quark.cn/s/dead"},
+        {"id": 3, "text": "https://pan.quark.cn/s/dead https://www.alipan.com/s/ok"},
+        {"id": 4, "text": "https://pan.baidu.com/s/dead"},
+        {"id": 5, "text": "https://example.com/page"},
+        {"id": 6, "text": "again https://pan.quark.cn/s/dead"},
+    ]
+    kept = message_utils.filter_messages(messages)
+
+    assert [m["id"] for m in kept] == [1, 3, 5]
+    assert sorted(calls) == sorted([
+        ("quark", "https://pan.quark.cn/s/dead"),
+        ("ali", "https://www.alipan.com/s/ok"),
+        ("baidu", "https://pan.baidu.com/s/dead"),
+    ])
+    assert active["peak"] >= 2
+
+    # A second export is answered from link_status without any request.
+    calls.clear()
+    assert [m["id"] for m in message_utils.filter_messages(messages)] == [1, 3, 5]
+    assert calls == []
+
+    monkeypatch.setattr(link_check, "LINK_STATUS_ALIVE_TTL_SECONDS", -1)
+    message_utils.filter_messages(messages)
+    assert calls == [("ali", "https://www.alipan.com/s/ok")]
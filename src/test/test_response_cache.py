@@ -0,0 +1,38 @@
+from telegram_bot.response_cache import CachedResponse, ResponseCache
+
+
+def _entry(etag, chat_id, size):
+    return CachedResponse(etag, chat_id, b"x" * size, "application/json")
+
+
+def test_least_recently_used_entries_are_evicted_by_size():
+    cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+    cache.put("/a", _entry("1", "chat-1", 40))
+    cache.put("/b", _entry("1", "chat-1", 40))
+    assert cache.get("/a", "1") is not None
+    cache.put("/c", _entry("1", "chat-2", 40))
+
+    assert cache.get("/b", "1") is None
+    assert cache.get("/a", "1") is not None and cache.get("/c", "1") is not None
+    assert not cache.put("/d", _entry("1", "chat-2", 61))
+    assert cache.stats() == {
+        "entries": 2,
+        "bytes": 80,
+        "max_bytes": 100,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "invalidations": 0,
+    }
+
+
+def test_stale_and_invalidated_entries_are_dropped():
+    cache = ResponseCache(max_bytes=100)
+    cache.put("/a", _entry("1", "chat-1", 10))
+    cache.put("/b", _entry("1", "chat-1", 10))
+    cache.put("/c", _entry("1", "chat-2", 10))
+
+    assert cache.get("/a", "2") is None
+    assert cache.invalidate("chat-1") == 1
+    assert cache.get("/c", "1") is not None
+    assert cache.stats()["invalidations"] == 2 and cache.stats()["bytes"] == 10
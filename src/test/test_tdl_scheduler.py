@@ -0,0 +1,133 @@
+import sys
+import threading
+import time
+
+from telegram_bot.tdl_scheduler import TdlScheduler
+
+
+def _hold(scheduler, job_class, started, release, order=None):
+    def run():
+        with scheduler.slot(job_class):
+            if order is not None:
+                order.append(job_class)
+            started.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_exports_do_not_queue_behind_downloads():
+    scheduler = TdlScheduler({"download": 1, "export": 1}, max_concurrent=2)
+    release = threading.Event()
+    first_dl, second_dl, export = threading.Event(), threading.Event(), threading.Event()
+
+    threads = [_hold(scheduler, "download", first_dl, release)]
+    assert first_dl.wait(1)
+    threads.append(_hold(scheduler, "download", second_dl, release))
+    _wait_until(lambda: scheduler.stats()["classes"]["download"]["queued"] == 1)
+    threads.append(_hold(scheduler, "export", export, release))
+
+    assert export.wait(1)
+    assert not second_dl.is_set()
+    stats = scheduler.stats()
+    assert stats["running"] == 2
+    assert stats["classes"]["download"]["queued"] == 1
+
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["queued"] == 0
+    assert stats["classes"]["download"]["finished"] == 2
+
+
+def test_interactive_jobs_start_while_exports_and_downloads_run():
+    scheduler = TdlScheduler()
+    release = threading.Event()
+    export, download, interactive = threading.Event(), threading.Event(), threading.Event()
+
+    threads = [_hold(scheduler, "export", export, release), _hold(scheduler, "download", download, release)]
+    assert export.wait(1) and download.wait(1)
+    threads.append(_hold(scheduler, "interactive", interactive, release))
+
+    assert interactive.wait(1)
+    assert scheduler.stats()["classes"]["interactive"]["max_wait_seconds"] < 0.5
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    scheduler = TdlScheduler({"interactive": 1, "export": 1, "download": 1}, max_concurrent=1)
+    release_first, release_rest = threading.Event(), threading.Event()
+    order = []
+
+    first = threading.Event()
+    threads = [_hold(scheduler, "download", first, release_first, order)]
+    assert first.wait(1)
+    for job_class in ("download", "export", "interactive"):
+        threads.append(_hold(scheduler, job_class, threading.Event(), release_rest, order))
+    _wait_until(lambda: scheduler.stats()["queued"] == 3)
+
+    release_first.set()
+    release_rest.set()
+    for thread in threads:
+        thread.join(2)
+    assert order == ["download", "interactive", "export", "download"]
+
+
+def test_tdl_output_is_streamed_into_bounded_tails_with_live_progress(monkeypatch):
+    from telegram_bot import tdl_progress, update_messages
+
+    monkeypatch.setattr(tdl_progress, "TDL_OUTPUT_TAIL_LINES", 50)
+    script = (
+        "import sys, time\n"
+        "for i in range(3):\n"
+        "    name = f'chat(1):{i} -> f{i}.jpg ...'\n"
+        "    sys.stdout.write(f'{name} 50.00% [##..] [1.00 MB in 1s; ~ETA: 1s; 1.00 MB/s]\\r')\n"
+        "    sys.stdout.write(f'{name} done! [2.00 MB in 2s; 1.00 MB/s]\\n')\n"
+        "sys.stdout.write('chat(1):9 -> big.mp4 ... 10.00% [#...] [512.00 KB in 1s; 512.00 KB/s]\\n')\n"
+        "for i in range(2000):\n"
+        "    sys.stderr.write(f'noise {i}\\n')\n"
+        "sys.stdout.flush(); sys.stderr.flush()\n"
+        "time.sleep(0.5)\n"
+    )
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.update(
+            done=update_messages._run_tdl_command(
+                [sys.executable, "-c", script],
+                update_messages.get_logger("test"),
+                "fake tdl",
+                job_class="download",
+                chat_id="chat-1",
+            )
+        )
+    )
+    thread.start()
+
+    def live_progress():
+        jobs = update_messages.tdl_scheduler.jobs("chat-1")
+        return jobs and jobs[0].get("progress", {}).get("files_done") == 3
+
+    _wait_until(live_progress, timeout=5)
+    progress = update_messages.tdl_scheduler.jobs("chat-1")[0]["progress"]
+    assert progress["bytes_done"] == 6 * (1 << 20) + 512 * 1024
+    assert progress["files_active"] == 1
+    assert progress["rate_bytes_per_second"] == 512 * 1024
+
+    thread.join(5)
+    completed = result["done"]
+    assert completed.returncode == 0
+    assert len(completed.stderr.splitlines()) == 50
+    assert completed.stderr.splitlines()[-1] == "noise 1999"
+    assert update_messages.tdl_scheduler.jobs("chat-1") == []
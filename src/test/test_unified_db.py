@@ -1,5 +1,8 @@
+import json
 import sqlite3
 import sys
+import threading
+import time
 
 from pathlib import Path
 
@@ -7,7 +10,7 @@ ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from telegram_bot import db_utils, message_utils
+from telegram_bot import db_utils, message_utils, og_utils
 from scripts import migrate_legacy_storage_to_db
 
 
@@ -41,6 +44,30 @@ def test_parse_messages_sets_sender_id_and_is_self(monkeypatch):
     assert messages[1]["user"] == "99"
 
 
+def test_streamed_export_merges_albums_across_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(message_utils, "filter_messages", lambda items: items)
+    monkeypatch.setattr(message_utils, "load_me_id", lambda: "")
+
+    export = tmp_path / "export.json"
+    export.write_text(json.dumps({
+        "id": 1,
+        "messages": [
+            {"id": 1, "text": "solo", "date": 1710000000, "raw": {}},
+            {"id": 2, "text": "album", "date": 1710000001, "file": "a.jpg", "raw": {"GroupedID": 7}},
+            {"id": 3, "text": "", "date": 1710000001, "file": "b.jpg", "raw": {"GroupedID": 7}},
+            {"id": 4, "text": "after", "date": 1710000002, "raw": {}},
+        ],
+    }, indent=4), encoding="utf-8")
+
+    raw_messages = message_utils.iter_json_array(str(export), "messages", chunk_size=16)
+    batches = list(message_utils.iter_parse_messages("chat-a", raw_messages, tz=None, batch_size=2))
+    messages = [m for batch in batches for m in batch]
+
+    assert [m["msg_id"] for m in messages] == [1, 2, 4]
+    assert messages[1]["msg_files"] == ["downloads/chat-a/chat-a_3_b.jpg", "downloads/chat-a/chat-a_2_a.jpg"]
+    assert all(len(batch) <= 2 for batch in batches)
+
+
 def test_init_app_db_creates_unified_tables(tmp_path, monkeypatch):
     app_db = tmp_path / "app.db"
     monkeypatch.setattr(db_utils, "APP_DB_PATH", app_db)
@@ -166,6 +193,124 @@ def test_db_stores_me_id_and_open_graph_cache(tmp_path, monkeypatch):
     assert og_miss == {}
 
 
+def test_open_graph_batch_uses_cache_dedupes_and_caps_per_host(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    monkeypatch.setattr(og_utils, "OG_FETCH_PER_HOST", 2)
+    monkeypatch.setattr(og_utils, "_host_slots", {})
+
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.set_og_cache(conn, "https://cached.example/a", {"title": "cached"})
+    finally:
+        conn.close()
+
+    calls = []
+    active = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_fetch(url):
+        with lock:
+            calls.append(url)
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        return {} if url.endswith("/dead") else {"title": url}
+
+    monkeypatch.setattr(og_utils, "fetch_open_graph_info", fake_fetch)
+    urls = [f"https://slow.example/{i}" for i in range(6)]
+    results = og_utils.get_open_graph_info_many(urls + urls + ["https://cached.example/a", "https://other.example/dead"])
+
+    assert sorted(calls) == sorted(urls + ["https://other.example/dead"])
+    assert active["peak"] <= 3
+    assert results["https://cached.example/a"] == {"title": "cached"}
+    assert results["https://other.example/dead"] is None
+    assert results["https://slow.example/0"] == {"title": "https://slow.example/0"}
+
+    conn = db_utils.get_app_connection()
+    try:
+        cached = db_utils.get_og_cache_many(conn, ["https://slow.example/1", "https://other.example/dead"])
+    finally:
+        conn.close()
+    assert cached == {"https://slow.example/1": {"title": "https://slow.example/1"}, "https://other.example/dead": {}}
+
+
+def test_og_queue_keeps_entries_whose_fetch_raised(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    monkeypatch.setattr(og_utils, "_host_slots", {})
+
+    def message(msg_id, msg):
+        return {
+            "msg_id": msg_id, "date": "2024-01-01 00:00:00", "timestamp": msg_id, "msg_file_name": "",
+            "user": "u", "msg": msg, "ori_height": 0, "ori_width": 0,
+        }
+
+    def fake_fetch(url):
+        if "flaky" in url:
+            raise OSError("connection reset")
+        return {"title": url}
+
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-og", [message(1, "https://ok.example/a"), message(2, "https://flaky.example/b")])
+    finally:
+        conn.close()
+
+    monkeypatch.setattr(og_utils, "fetch_open_graph_info", fake_fetch)
+    assert og_utils.drain_og_queue() == 1
+
+    conn = db_utils.get_app_connection()
+    try:
+        queued = conn.execute("SELECT msg_id, attempts, next_attempt_at > ? FROM og_queue", (int(time.time()),)).fetchall()
+        og_info = conn.execute("SELECT msg_id, og_info FROM messages ORDER BY msg_id").fetchall()
+        cached = db_utils.get_og_cache_many(conn, ["https://flaky.example/b"])
+    finally:
+        conn.close()
+    assert [tuple(row) for row in queued] == [(2, 1, 1)]
+    assert og_info[1][1] is None and json.loads(og_info[0][1]) == {"title": "https://ok.example/a"}
+    assert cached == {}
+
+
+def test_og_queue_is_filled_by_save_and_drained_by_enricher(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    def message(msg_id, msg, msg_file_name=""):
+        return {
+            "msg_id": msg_id, "date": "2024-01-01 00:00:00", "timestamp": msg_id,
+            "msg_file_name": msg_file_name, "msg_files": [], "user": "u", "msg": msg,
+            "reply_to_msg_id": 0, "reply_to_top_id": 0, "replies_num": 0, "reactions": {},
+            "ori_height": 0, "ori_width": 0, "og_info": None,
+        }
+
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-og", [
+            message(1, "see https://a.example/x"),
+            message(2, "no link"),
+            message(3, "https://b.example/y", msg_file_name="downloads/chat-og/chat-og_3_p.jpg"),
+            message(4, "dead https://c.example/z"),
+        ])
+        assert db_utils.og_queue_size(conn) == 2
+        assert conn.execute("SELECT COUNT(*) FROM messages WHERE og_info IS NOT NULL").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+    pages = {"https://a.example/x": {"title": "A", "width": "640", "height": "360"}, "https://c.example/z": None}
+    monkeypatch.setattr(og_utils, "_resolve_open_graph_info_many", lambda urls: ({url: pages[url] for url in urls}, set()))
+    assert og_utils.drain_og_queue(batch_size=1) == 2
+
+    conn = db_utils.get_app_connection()
+    try:
+        rows = conn.execute("SELECT msg_id, og_info, ori_width, ori_height FROM messages ORDER BY msg_id").fetchall()
+        assert db_utils.og_queue_size(conn) == 0
+    finally:
+        conn.close()
+    assert json.loads(rows[0][1])["title"] == "A"
+    assert (rows[0][2], rows[0][3]) == (640, 360)
+    assert rows[3][1] is None
+
+
 def test_migrate_legacy_storage_imports_files_into_db(tmp_path):
     app_db = tmp_path / "app.db"
     chats_file = tmp_path / "chats.json"
@@ -199,3 +344,315 @@ def test_migrate_legacy_storage_imports_files_into_db(tmp_path):
     assert chats[0]["id"] == "chat-9"
     assert me_id == "777"
     assert og_info == {"title": "Legacy"}
+
+
+def test_search_index_is_backfilled_and_follows_deletes(tmp_path, monkeypatch):
+    app_db = tmp_path / "app.db"
+    legacy = sqlite3.connect(str(app_db))
+    legacy.execute(
+        "CREATE TABLE messages(chat_id TEXT NOT NULL, msg_id INTEGER NOT NULL, date TEXT, timestamp INTEGER, "
+        "msg_file_name TEXT, user TEXT, msg TEXT, ori_height INTEGER, ori_width INTEGER, og_info TEXT, "
+        "reactions TEXT, msg_files TEXT, reply_to_msg_id INTEGER, PRIMARY KEY(chat_id, msg_id))"
+    )
+    legacy.execute("INSERT INTO messages(chat_id, msg_id, date, msg) VALUES('chat-1', 1, '2024-01-01', 'legacy text')")
+    legacy.commit()
+    legacy.close()
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", app_db)
+
+    conn = db_utils.get_app_connection()
+    try:
+        join_sql, where_sql, params = db_utils.build_message_search("legacy")
+        sql = f"SELECT m.msg_id FROM {join_sql} messages m WHERE m.chat_id=?{where_sql}"
+        backfilled = conn.execute(sql, ("chat-1", *params)).fetchall()
+
+        db_utils.delete_chat(conn, "chat-1")
+        after_delete = conn.execute(sql, ("chat-1", *params)).fetchall()
+    finally:
+        conn.close()
+
+    assert backfilled == [(1,)]
+    assert after_delete == []
+
+
+def test_trigram_search_matches_cjk_substrings(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    monkeypatch.setattr(db_utils, "SEARCH_ENGINE", "trigram")
+
+    conn = db_utils.get_app_connection(row_factory=sqlite3.Row)
+    try:
+        db_utils.upsert_chat(conn, {"id": "chat-1", "remark": "电影频道"})
+        db_utils.save_messages(
+            conn,
+            "chat-1",
+            [
+                {
+                    "msg_id": msg_id,
+                    "date": "2024-01-01 00:00:00",
+                    "timestamp": msg_id,
+                    "msg_file_name": "",
+                    "user": "99",
+                    "msg": text,
+                    "ori_height": None,
+                    "ori_width": None,
+                }
+                for msg_id, text in [(1, "今天分享高清字幕合集"), (2, "无损音乐专辑"), (3, "字幕组招人")]
+            ],
+        )
+
+        substring = db_utils.search_messages_global(conn, "高清字幕")
+        short = db_utils.search_messages_global(conn, "字幕 -高清")
+        by_remark = db_utils.search_messages_global(conn, "电影频道")
+    finally:
+        conn.close()
+
+    assert [m["msg_id"] for m in substring["messages"]] == [1]
+    assert [m["msg_id"] for m in short["messages"]] == [3]
+    assert by_remark["total"] == 3
+
+
+def test_app_connections_are_pooled_and_share_one_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    first = db_utils.get_app_connection()
+    first.close()
+    reused = db_utils.get_app_connection(row_factory=sqlite3.Row, chat_id="chat-1")
+    nested = db_utils.get_app_connection()
+    try:
+        journal_mode = reused.execute("PRAGMA journal_mode").fetchone()[0]
+        with db_utils.write_connection("chat-1") as writer:
+            db_utils.set_last_export_time(writer, "123")
+        with db_utils.write_connection() as writer_again:
+            pass
+        last_export_time = db_utils.get_last_export_time(reused)
+    finally:
+        nested.close()
+        reused.close()
+
+    released = db_utils.get_app_connection()
+    released_scope = released.chat_id
+    released.close()
+
+    assert reused is first
+    assert nested is not reused
+    assert writer is writer_again
+    assert journal_mode == "wal"
+    assert last_export_time == "123"
+    assert released_scope == ""
+
+
+def test_chat_stats_follow_inserts_reactions_and_deletes(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    def message(msg_id, replies_num=0, reactions=None):
+        return {
+            "msg_id": msg_id,
+            "date": "2024-01-01 00:00:00",
+            "timestamp": 100 + msg_id,
+            "msg_file_name": "",
+            "user": "99",
+            "msg": f"note {msg_id}",
+            "ori_height": None,
+            "ori_width": None,
+            "replies_num": replies_num,
+            "reactions": reactions,
+        }
+
+    liked = {"Results": [{"Reaction": {"Emoticon": "👍"}, "Count": 1}]}
+    conn = db_utils.get_app_connection()
+    try:
+        # The search index triggers must not inflate the counts.
+        assert db_utils.save_messages(conn, "chat-1", [message(1), message(2, replies_num=3), message(3, reactions=liked)]) == 3
+        assert db_utils.save_messages(conn, "chat-1", [message(3), message(4), message(4)]) == 1
+        after_insert = db_utils.get_chat_stats(conn, "chat-1")
+
+        assert db_utils.update_reactions(conn, "chat-1", [(1, liked), (3, None), (99, liked)]) == 2
+        version = db_utils.get_data_versions(conn, ["chat-1"])["chat-1"]
+        # A refresh that finds the same reactions changes nothing, not even the ETags.
+        assert db_utils.update_reactions(conn, "chat-1", [(1, liked), (2, None), (3, None)]) == 0
+        assert db_utils.get_data_versions(conn, ["chat-1"])["chat-1"] == version
+        after_reactions = db_utils.get_chat_stats(conn, "chat-1")
+
+        db_utils.delete_messages(conn, "chat-1", [4, 2])
+        after_delete = db_utils.get_chat_stats(conn, "chat-1")
+
+        conn.execute("UPDATE chat_stats SET total=42 WHERE chat_id='chat-1'")
+        drifted = db_utils.rebuild_chat_stats(conn)
+        rebuilt = db_utils.get_chat_stats(conn, "chat-1")
+
+        assert db_utils.delete_chat(conn, "chat-1")
+        after_chat_delete = db_utils.get_chat_stats(conn, "chat-1")
+        versions = db_utils.get_data_versions(conn, ["chat-1", db_utils.GLOBAL_DATA_VERSION])
+        assert not db_utils.delete_chat(conn, "chat-1")
+        assert db_utils.get_data_versions(conn, ["chat-1", db_utils.GLOBAL_DATA_VERSION]) == versions
+    finally:
+        conn.close()
+
+    assert after_insert["total"] == 4
+    assert after_insert["with_replies"] == 1
+    assert after_insert["with_reactions"] == 1
+    assert (after_insert["min_msg_id"], after_insert["max_msg_id"]) == (1, 4)
+    assert (after_insert["min_timestamp"], after_insert["max_timestamp"]) == (101, 104)
+    assert after_reactions["with_reactions"] == 1
+    assert after_delete["total"] == 2
+    assert after_delete["with_replies"] == 0
+    assert (after_delete["max_msg_id"], after_delete["max_timestamp"]) == (3, 103)
+    assert drifted == ["chat-1"]
+    assert rebuilt["total"] == 2
+    assert after_chat_delete["total"] == 0
+
+
+def test_ingest_message_rows_commits_per_chunk_and_counts_new_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    monkeypatch.setattr(message_utils, "filter_messages", lambda items: items)
+    monkeypatch.setattr(message_utils, "load_me_id", lambda: "")
+
+    raw_messages = [
+        {"id": msg_id, "text": f"note {msg_id}", "date": 1710000000 + msg_id, "raw": {}}
+        for msg_id in (1, 2, 3, 3, 4, 5)
+    ]
+    rows = list(message_utils.iter_message_rows("chat-1", raw_messages, tz=None, batch_size=2))
+    assert [row[1] for row in rows] == [1, 2, 3, 3, 4, 5]
+    assert rows[0][11:16] == (None, None, 0, None, 0)
+
+    class Log:
+        lines = []
+
+        def info(self, line):
+            self.lines.append(line)
+
+    log = Log()
+    inserted = db_utils.ingest_message_rows("chat-1", iter(rows), chunk_size=4, logger=log)
+    again = db_utils.ingest_message_rows("chat-1", iter(rows), chunk_size=4)
+
+    conn = db_utils.get_app_connection()
+    try:
+        stored = [row[0] for row in conn.execute("SELECT msg_id FROM messages WHERE chat_id='chat-1' ORDER BY msg_id")]
+        stats = db_utils.get_chat_stats(conn, "chat-1")
+    finally:
+        conn.close()
+
+    assert inserted == 5 and again == 0
+    assert stored == [1, 2, 3, 4, 5]
+    assert stats["total"] == 5
+    assert len(log.lines) == 2 and "rows=4" in log.lines[0]
+
+
+def test_upsert_refreshes_changed_columns_of_stored_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    def message(msg_id, msg, replies_num=0, reactions=None):
+        return {
+            "msg_id": msg_id,
+            "date": "2024-01-01 00:00:00",
+            "timestamp": 100 + msg_id,
+            "msg_file_name": "",
+            "user": "99",
+            "msg": msg,
+            "ori_height": None,
+            "ori_width": None,
+            "replies_num": replies_num,
+            "reactions": reactions,
+        }
+
+    liked = {"Results": [{"Reaction": {"Emoticon": "👍"}, "Count": 2}]}
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [message(1, "first draft"), message(2, "unchanged", replies_num=1)])
+        conn.execute("UPDATE messages SET og_info='{\"title\": \"kept\"}' WHERE msg_id=2")
+        conn.commit()
+
+        ignored = db_utils.save_messages(conn, "chat-1", [message(1, "ignored edit")])
+        inserted = db_utils.save_messages(
+            conn,
+            "chat-1",
+            [message(1, "edited https://example.com/a", replies_num=4, reactions=liked), message(2, "unchanged", replies_num=1), message(3, "new")],
+            upsert=True,
+        )
+        rows = conn.execute("SELECT msg_id, msg, replies_num, reactions, og_info FROM messages ORDER BY msg_id").fetchall()
+        stats = db_utils.get_chat_stats(conn, "chat-1")
+        totals = conn.execute("SELECT emoticon, total, messages FROM reaction_totals").fetchall()
+        queued = conn.execute("SELECT msg_id, url FROM og_queue ORDER BY msg_id").fetchall()
+
+        join_sql, where_sql, params = db_utils.build_message_search("edited")
+        found = conn.execute(f"SELECT m.msg_id FROM {join_sql} messages m WHERE m.chat_id=?{where_sql}", ("chat-1", *params)).fetchall()
+    finally:
+        conn.close()
+
+    assert ignored == 0 and inserted == 1
+    assert rows[0][1:3] == ("edited https://example.com/a", 4)
+    assert json.loads(rows[0][3]) == liked
+    assert rows[1][1:] == ("unchanged", 1, None, '{"title": "kept"}')
+    assert (stats["total"], stats["with_replies"], stats["with_reactions"]) == (3, 2, 1)
+    assert totals == [("👍", 2, 1)]
+    assert queued == [(1, "https://example.com/a")]
+    assert found == [(1,)]
+
+
+def test_reaction_refresh_exports_a_window_and_sweeps_occasionally(tmp_path, monkeypatch):
+    from telegram_bot import update_messages
+
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    monkeypatch.setattr(update_messages, "REACTION_REFRESH_CHUNK_SIZE", 2)
+    monkeypatch.setattr(update_messages, "REACTION_REFRESH_WINDOW_SECONDS", 3600)
+    monkeypatch.setattr(update_messages, "REACTION_FULL_SWEEP_SECONDS", 86400)
+    liked = {"Results": [{"Reaction": {"Emoticon": "👍"}, "Count": 1}]}
+    commands = []
+
+    def fake_tdl(command, logger, label, **kwargs):
+        commands.append(command)
+        path = command[command.index("-o") + 1]
+        Path(path).write_text(json.dumps({"messages": [
+            {"id": msg_id, "raw": {"Reactions": liked}} for msg_id in (1, 2, 3)
+        ]}), encoding="utf-8")
+        return update_messages.subprocess.CompletedProcess(command, 0, "", "")
+
+    monkeypatch.setattr(update_messages, "_run_tdl_command", fake_tdl)
+    conn = db_utils.get_connection("chat-1")
+    try:
+        db_utils.save_messages(conn, "chat-1", [
+            {"msg_id": msg_id, "date": "2024-01-01 00:00:00", "timestamp": msg_id, "msg_file_name": "",
+             "user": "1", "msg": "x", "ori_height": None, "ori_width": None}
+            for msg_id in (1, 2, 3)
+        ])
+        export = str(tmp_path / "reactions.json")
+        first = update_messages.refresh_chat_reactions("chat-1", export, conn)
+        second = update_messages.refresh_chat_reactions("chat-1", export, conn)
+        stats = db_utils.get_chat_stats(conn, "chat-1")
+    finally:
+        conn.close()
+
+    # The second export carries the same reactions, so nothing is rewritten.
+    assert first == 3 and second == 0
+    assert commands[0][commands[0].index("-i") + 1].startswith("0,")
+    window_start, window_end = map(int, commands[1][commands[1].index("-i") + 1].split(","))
+    assert window_end - window_start == 3600
+    assert stats["with_reactions"] == 3
+    assert not Path(export).exists()
+
+
+def test_reaction_tables_without_totals_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    reactions = {"Results": [{"Reaction": {"Emoticon": "fire"}, "Count": 1}, {"Reaction": {"Emoticon": "fire"}, "Count": 2}]}
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [{
+            "msg_id": 1, "date": "2024-01-01", "timestamp": 1, "msg_file_name": "", "user": "", "msg": "x",
+            "ori_height": None, "ori_width": None, "reactions": reactions,
+        }])
+        conn.execute("DROP TABLE message_reactions")
+        conn.execute("DROP TABLE reaction_totals")
+        conn.execute(
+            "CREATE TABLE message_reactions(chat_id TEXT NOT NULL, msg_id INTEGER NOT NULL, emoticon TEXT NOT NULL, "
+            "count INTEGER NOT NULL, timestamp INTEGER NOT NULL DEFAULT 0, PRIMARY KEY(chat_id, msg_id, emoticon))"
+        )
+        conn.execute(
+            "CREATE TABLE reaction_totals(chat_id TEXT NOT NULL, emoticon TEXT NOT NULL, total INTEGER NOT NULL DEFAULT 0, "
+            "messages INTEGER NOT NULL DEFAULT 0, PRIMARY KEY(chat_id, emoticon))"
+        )
+        conn.commit()
+        db_utils.init_db(conn)
+        totals = conn.execute("SELECT emoticon, total, messages, listed FROM reaction_totals").fetchall()
+    finally:
+        conn.close()
+
+    assert [tuple(row) for row in totals] == [("fire", 3, 1, 1)]
@@ -1,8 +1,18 @@
+import pytest
 from fastapi.testclient import TestClient
 
+from telegram_bot import db_utils, web_server
+from telegram_bot.message_rows import MESSAGE_COLUMNS
+from telegram_bot.response_cache import ResponseCache
 from telegram_bot.web_server import _cleanup_link_provider, app
 
 
+@pytest.fixture(autouse=True)
+def _fresh_response_cache(monkeypatch):
+    # Every test starts a new database whose data versions repeat, so cached pages must not leak between tests.
+    monkeypatch.setattr(web_server, "response_cache", ResponseCache())
+
+
 class _FakeBdPan:
     def is_share_link(self, link: str) -> bool:
         return "pan.baidu.com" in link
@@ -24,3 +34,338 @@ def test_index_page_renders_successfully():
 
     assert response.status_code == 200
     assert "聊天频道管理" in response.text
+
+
+def _message(msg_id: int, text: str) -> dict:
+    return {
+        "msg_id": msg_id,
+        "date": f"2024-01-0{msg_id} 00:00:00",
+        "timestamp": msg_id,
+        "msg_file_name": "",
+        "msg_files": [],
+        "user": "99",
+        "sender_id": "99",
+        "is_self": 0,
+        "msg": text,
+        "reply_to_msg_id": 0,
+        "reply_to_top_id": 0,
+        "replies_num": 0,
+        "reactions": {},
+        "ori_height": None,
+        "ori_width": None,
+        "og_info": None,
+    }
+
+
+@pytest.mark.parametrize("engine", ["trigram", "unicode61"])
+@pytest.mark.parametrize("scan_max_rows", [0, 20000], ids=["index-driven", "chat-driven"])
+def test_search_uses_full_text_index_and_keeps_negation(tmp_path, monkeypatch, engine, scan_max_rows):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    monkeypatch.setattr(db_utils, "SEARCH_ENGINE", engine)
+    monkeypatch.setattr(db_utils, "SEARCH_CHAT_SCAN_MAX_ROWS", scan_max_rows)
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [
+            _message(1, "Alpha release notes"),
+            _message(2, "alpha beta"),
+            _message(3, "gamma"),
+        ])
+        db_utils.save_messages(conn, "chat-2", [_message(1, "alpha elsewhere")])
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+
+    hits = client.get("/search/chat-1", params={"q": "alpha"}).json()
+    assert hits["total"] == 2
+    assert [m["msg_id"] for m in hits["messages"]] == [1, 2]
+
+    excluded = client.get("/search/chat-1", params={"q": "alpha -beta"}).json()
+    assert [m["msg_id"] for m in excluded["messages"]] == [1]
+
+    only_negative = client.get("/search/chat-1", params={"q": "-alpha"}).json()
+    assert [m["msg_id"] for m in only_negative["messages"]] == [3]
+
+    by_date = client.get("/search/chat-1", params={"q": "2024-01-03"}).json()
+    assert [m["msg_id"] for m in by_date["messages"]] == [3]
+
+
+def test_message_pages_follow_msg_id_cursors(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    messages = [_message(i, f"note {i}") for i in range(1, 8)]
+    for m in messages[3:]:
+        m["reply_to_msg_id"] = 1
+    messages[0]["replies_num"] = 4
+    messages[1]["replies_num"] = 4
+    messages[2]["replies_num"] = 9
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", messages)
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+
+    latest = client.get("/messages/chat-1", params={"latest": 1, "limit": 3}).json()
+    assert [m["msg_id"] for m in latest["messages"]] == [5, 6, 7]
+    assert latest["has_more"] is True
+    assert latest["total"] is None
+
+    older = client.get("/messages/chat-1", params={"before_msg_id": 5, "limit": 3, "with_total": 1}).json()
+    assert [m["msg_id"] for m in older["messages"]] == [2, 3, 4]
+    assert older["has_more"] is True
+    assert older["total"] == 7
+
+    oldest = client.get("/messages/chat-1", params={"before_msg_id": 2, "limit": 3}).json()
+    assert [m["msg_id"] for m in oldest["messages"]] == [1]
+    assert oldest["has_more"] is False
+
+    newer = client.get("/messages/chat-1", params={"after_msg_id": 5, "limit": 3}).json()
+    assert [m["msg_id"] for m in newer["messages"]] == [6, 7]
+    assert newer["has_more"] is False
+
+    legacy = client.get("/messages/chat-1", params={"offset": -2, "limit": 2}).json()
+    assert legacy["total"] == 7 and legacy["offset"] == 5
+    assert [m["msg_id"] for m in legacy["messages"]] == [6, 7]
+
+    replies = client.get("/replies/chat-1/1", params={"before_msg_id": 7, "limit": 2}).json()
+    assert [m["msg_id"] for m in replies["messages"]] == [5, 6]
+    assert replies["has_more"] is True
+
+    hits = client.get("/search/chat-1", params={"q": "note", "before_msg_id": 3, "limit": 5}).json()
+    assert [m["msg_id"] for m in hits["messages"]] == [1, 2]
+    assert hits["has_more"] is False
+
+    first = client.get("/messages_by_replies_num/chat-1", params={"cursor": "", "limit": 2}).json()
+    assert [m["msg_id"] for m in first["messages"]] == [3, 2]
+    assert first["has_more"] is True
+    rest = client.get("/messages_by_replies_num/chat-1", params={"cursor": first["next_cursor"], "limit": 2}).json()
+    assert [m["msg_id"] for m in rest["messages"]] == [1]
+    assert rest["has_more"] is False and rest["next_cursor"] is None
+
+    bad = client.get("/messages_by_replies_num/chat-1", params={"cursor": "nope"})
+    assert bad.status_code == 400
+
+
+def test_reaction_endpoints_read_the_reactions_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    def reactions(**counts):
+        return {"Results": [{"Reaction": {"Emoticon": e}, "Count": c} for e, c in counts.items()]}
+
+    messages = [_message(i, f"note {i}") for i in range(1, 5)]
+    messages[0]["reactions"] = reactions(heart=2, fire=1)
+    messages[1]["reactions"] = reactions(heart=5)
+    messages[2]["reactions"] = reactions(heart=2)
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", messages)
+        db_utils.update_reactions(conn, "chat-1", [(1, reactions(fire=1)), (4, reactions(fire=3))])
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+
+    emoticons = client.get("/reactions_emoticons/chat-1").json()["emoticons"]
+    assert emoticons == [{"emoticon": "heart", "count": 7}, {"emoticon": "fire", "count": 4}]
+
+    by_heart = client.get("/messages_by_reaction/chat-1", params={"emoticon": "heart"}).json()
+    assert by_heart["total"] == 2
+    assert [m["msg_id"] for m in by_heart["messages"]] == [2, 3]
+    assert [m["reaction_sort_count"] for m in by_heart["messages"]] == [5, 2]
+
+    second_page = client.get("/messages_by_reaction/chat-1", params={"emoticon": "fire", "offset": 1, "limit": 1}).json()
+    assert second_page["total"] == 2
+    assert [m["msg_id"] for m in second_page["messages"]] == [1]
+
+
+def test_reaction_totals_keep_zero_and_repeated_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+
+    def reactions(*entries):
+        return {"Results": [{"Reaction": {"Emoticon": e}, "Count": c} for e, c in entries]}
+
+    messages = [_message(1, "one"), _message(2, "two")]
+    messages[0]["reactions"] = reactions(("heart", 1), ("fire", 2))
+    messages[1]["reactions"] = reactions(("fire", 1), ("fire", 4))
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", messages)
+        db_utils.update_reactions(conn, "chat-1", [(1, reactions(("heart", 0), ("fire", 2)))])
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+    emoticons = client.get("/reactions_emoticons/chat-1").json()["emoticons"]
+    assert emoticons == [{"emoticon": "fire", "count": 7}, {"emoticon": "heart", "count": 0}]
+
+    by_heart = client.get("/messages_by_reaction/chat-1", params={"emoticon": "heart"}).json()
+    assert (by_heart["total"], by_heart["messages"]) == (0, [])
+    by_fire = client.get("/messages_by_reaction/chat-1", params={"emoticon": "fire"}).json()
+    assert [(m["msg_id"], m["reaction_sort_count"]) for m in by_fire["messages"]] == [(1, 2), (2, 1)]
+
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.update_reactions(conn, "chat-1", [(1, None)])
+    finally:
+        conn.close()
+    emoticons = client.get("/reactions_emoticons/chat-1").json()["emoticons"]
+    assert emoticons == [{"emoticon": "fire", "count": 5}]
+
+
+def test_message_endpoints_decode_replies_and_honour_fields(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    original = _message(1, "original")
+    original["og_info"] = {"title": "preview"}
+    original["user"] = ""
+    reply = _message(2, "reply")
+    reply["reply_to_msg_id"] = 1
+    reply["reactions"] = {"Results": [{"Reaction": {"Emoticon": "heart"}, "Count": 1}]}
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [original, reply])
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+
+    full = client.get("/messages/chat-1/2").json()
+    assert full["reactions"] == reply["reactions"]
+    assert full["reply_message"]["msg_id"] == 1
+    assert full["reply_message"]["og_info"] == {"title": "preview"}
+    assert full["reply_message"]["user"] == "99"
+    assert full["reply_message"]["msg_files"] is None
+    assert set(full) - {"reply_message"} == set(MESSAGE_COLUMNS)
+
+    slim = client.get("/messages/chat-1", params={"fields": "msg,bogus"}).json()["messages"]
+    assert [set(m) - {"reply_message"} for m in slim] == [{"chat_id", "msg_id", "msg"}] * 2
+    assert slim[1]["reply_message"] == {"chat_id": "chat-1", "msg_id": 1, "msg": "original"}
+
+    by_reaction = client.get("/messages_by_reaction/chat-1", params={"emoticon": "heart", "fields": "msg"}).json()
+    assert by_reaction["messages"] == [{
+        "chat_id": "chat-1", "msg_id": 2, "msg": "reply",
+        "reply_message": {"chat_id": "chat-1", "msg_id": 1, "msg": "original"},
+        "reaction_sort_emoticon": "heart", "reaction_sort_count": 1,
+    }]
+
+
+def test_malformed_stored_json_reads_as_null(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [_message(1, "one"), _message(2, "two")])
+        conn.execute("UPDATE messages SET reactions='{\"Results\": [', og_info='{\"title\": \"ok\"}' WHERE msg_id=1")
+        conn.commit()
+    finally:
+        conn.close()
+
+    response = TestClient(app).get("/messages/chat-1")
+    messages = {m["msg_id"]: m for m in response.json()["messages"]}
+    assert messages[1]["reactions"] is None
+    assert messages[1]["og_info"] == {"title": "ok"}
+    assert messages[2]["msg"] == "two"
+
+
+def test_dumps_json_splices_raw_columns_with_and_without_orjson(monkeypatch):
+    import json
+
+    from telegram_bot import message_rows
+
+    reactions = {"Results": [{"Reaction": {"Emoticon": "❤"}, "Count": 3}]}
+    row = ("chat-1", 1, "2024", 1, "", "", None, 0, "hi \"there\" ❤", None, None,
+           None, json.dumps(reactions, ensure_ascii=False), 2, "[]", 0, 0) + (None,) * 17
+    payload = {"total": 1, "messages": message_rows.MessageDecoder(raw_json=True).decode_rows([row])}
+    expected = {"total": 1, "messages": [message_rows.MessageDecoder().decode(row)]}
+
+    assert json.loads(message_rows.dumps_json(payload)) == expected
+    monkeypatch.setattr(message_rows, "orjson", None)
+    monkeypatch.setattr(message_rows, "_Fragment", None)
+    monkeypatch.setattr(message_rows, "_raw", message_rows.RawJSON)
+    payload = {"total": 1, "messages": [message_rows.MessageDecoder(raw_json=True).decode(row)]}
+    assert json.loads(message_rows.dumps_json(payload)) == expected
+
+
+def test_read_endpoints_answer_304_until_the_chat_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [_message(1, "one")])
+        db_utils.save_messages(conn, "chat-2", [_message(1, "other chat")])
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+    first = client.get("/messages/chat-1", params={"limit": 5})
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    cached = client.get("/messages/chat-1", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["etag"] == etag
+    other_params = client.get("/messages/chat-1", params={"limit": 6}, headers={"If-None-Match": etag})
+    assert other_params.status_code == 200
+
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-2", [_message(2, "elsewhere")])
+        unrelated = client.get("/messages/chat-1", params={"limit": 5}, headers={"If-None-Match": etag})
+        db_utils.update_reactions(conn, "chat-1", [(1, {"Results": [{"Reaction": {"Emoticon": "x"}, "Count": 1}]})])
+    finally:
+        conn.close()
+    assert unrelated.status_code == 304
+
+    changed = client.get("/messages/chat-1", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    chats = client.get("/chats")
+    assert client.get("/chats", headers={"If-None-Match": chats.headers["etag"]}).status_code == 304
+
+
+def test_identical_reads_are_served_from_the_response_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "APP_DB_PATH", tmp_path / "app.db")
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [_message(1, "one")])
+    finally:
+        conn.close()
+
+    client = TestClient(app)
+    first = client.get("/messages/chat-1", params={"limit": 5})
+    second = client.get("/messages/chat-1", params={"limit": 5})
+    assert second.content == first.content and second.headers["etag"] == first.headers["etag"]
+    assert web_server.response_cache.stats()["hits"] == 1
+
+    conn = db_utils.get_app_connection()
+    try:
+        db_utils.save_messages(conn, "chat-1", [_message(2, "two")])
+    finally:
+        conn.close()
+    third = client.get("/messages/chat-1", params={"limit": 5})
+    assert len(third.json()["messages"]) == 2
+    assert web_server.response_cache.stats()["invalidations"] == 1
+
+
+def test_unversioned_paths_skip_the_read_pool(monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise AssertionError("read pool used")
+
+    monkeypatch.setattr(web_server.read_pool, "run", unavailable)
+    client = TestClient(app)
+    assert client.get("/sw.js").status_code == 200
+    assert client.get("/downloads/missing.jpg").status_code == 404
+
+
+def test_media_downloads_run_on_their_own_pool(monkeypatch):
+    calls = []
+
+    async def run(fn, *args, **kwargs):
+        calls.append(fn.__name__)
+        return {"ok": True}
+
+    async def unavailable(*args, **kwargs):
+        raise AssertionError("admin pool used")
+
+    monkeypatch.setattr(web_server.download_pool, "run", run)
+    monkeypatch.setattr(web_server.admin_pool, "run", unavailable)
+    response = TestClient(app).post("/download_telegram_media", json={"chat_id": "chat-1", "telegram_url": "https://t.me/c/1/2"})
+    assert response.json() == {"ok": True}
+    assert calls == ["_download_telegram_media"]
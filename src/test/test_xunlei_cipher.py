@@ -0,0 +1,87 @@
+import random
+import string
+from pathlib import Path
+
+import pytest
+
+from telegram_bot import xunlei_cipher
+
+CAPTCHA_SIGN_JS = Path(__file__).with_name("fixtures") / "captcha_sign.js"
+
+
+class _FakeResponse:
+    def __init__(self, payload: dict):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def test_xunlei_session_reuses_credentials_and_renews_rejected_token(monkeypatch):
+    calls = {"algorithm": 0, "device": 0, "token": 0}
+    tokens = iter(["token-1", "token-2", "token-3", "token-4"])
+    rejected = {"token-1"}
+
+    def fake_algorithm():
+        calls["algorithm"] += 1
+        return object()
+
+    def fake_device(algorithm_ctx=None):
+        assert algorithm_ctx is not None
+        calls["device"] += 1
+        return f"device-{calls['device']}"
+
+    def fake_token(device_id):
+        calls["token"] += 1
+        return next(tokens), 300
+
+    def fake_get(url, params=None, headers=None):
+        if headers["x-captcha-token"] in rejected:
+            return _FakeResponse({"error": "captcha_invalid", "error_code": 9})
+        status = "PASS_CODE_EMPTY" if params["share_id"] == "ok" else "DELETED"
+        return _FakeResponse({"share_status": status})
+
+    monkeypatch.setattr(xunlei_cipher, "_load_risk_algorithm", fake_algorithm)
+    monkeypatch.setattr(xunlei_cipher, "_generate_xunlei_device_id", fake_device)
+    monkeypatch.setattr(xunlei_cipher, "_generate_captcha_token", fake_token)
+    monkeypatch.setattr(xunlei_cipher, "http_get", fake_get)
+
+    session = xunlei_cipher.XunleiSession()
+    assert xunlei_cipher.is_xunlei_link_stale("https://pan.xunlei.com/s/ok", session) is False
+    assert xunlei_cipher.is_xunlei_link_stale("https://pan.xunlei.com/s/gone?pwd=1", session) is True
+    assert xunlei_cipher.is_xunlei_link_stale("https://pan.xunlei.com/s/ok", session) is False
+    assert calls == {"algorithm": 1, "device": 1, "token": 2}
+
+    rejected.update({"token-2", "token-3", "token-4"})
+    with pytest.raises(RuntimeError):
+        xunlei_cipher.is_xunlei_link_stale("https://pan.xunlei.com/s/ok", session)
+    assert (calls["algorithm"], calls["device"], calls["token"]) == (2, 2, 4)
+
+
+def _js_captcha_signs(inputs: list[str]) -> list[str]:
+    execjs = pytest.importorskip("execjs")
+    try:
+        ctx = execjs.compile(
+            CAPTCHA_SIGN_JS.read_text(encoding="utf-8")
+            + """
+            function signAll(inputs, salts) {
+                return inputs.map(function (s) {
+                    for (var i = 0; i < salts.length; i++) s = T(s + salts[i]);
+                    return "1." + s;
+                });
+            }
+            """
+        )
+        return ctx.call("signAll", inputs, list(xunlei_cipher._CAPTCHA_SIGN_SALTS))
+    except execjs.RuntimeUnavailableError:
+        pytest.skip("no JavaScript runtime")
+
+
+def test_captcha_sign_matches_the_js_routine():
+    rng = random.Random(20240611)
+    alphabet = string.ascii_letters + string.digits + "+/=.-_ 中文签名é"
+    inputs = ["", "Xqp0kJBXWhwaTpB61.92.33pan.xunlei.com" + "0" * 32 + "1718000000000"]
+    inputs += ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 120))) for _ in range(60)]
+
+    sign = getattr(xunlei_cipher, "__get_captcha_sign")
+    assert [sign(value) for value in inputs] == _js_captcha_signs(inputs)
@@ -15,8 +15,8 @@ const chatId = window.CHAT_ID;
 const pageSize = 20;
 let searchGapCounter = 0;
 let latestChatMsgId = null;
-let oldestIndex = 0;
-let totalMessages = 0;
+let oldestMsgId = null;
+let hasOlderMessages = false;
 
 let isReactionSorting = false;
 let reactionEmoticon = '';
@@ -158,9 +158,14 @@ function openImageViewerFromTile(tile) {
     document.body.classList.add('no-scroll');
 }
 
+// 按 msg_id 游标分页：beforeMsgId 为空时取最新一页
+function msgIdCursorQuery(beforeMsgId) {
+    return beforeMsgId == null ? 'latest=1' : `before_msg_id=${encodeURIComponent(beforeMsgId)}`;
+}
+
 // 动态加载 JSON 数据
-function fetchMessages(offset, limit) {
-    return fetch(`../messages/${chatId}?offset=${offset}&limit=${limit}`)
+function fetchMessages(beforeMsgId, limit) {
+    return fetch(`../messages/${chatId}?${msgIdCursorQuery(beforeMsgId)}&limit=${limit}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('无法加载消息数据');
@@ -172,7 +177,7 @@ function fetchMessages(offset, limit) {
 async function ensureLatestChatMsgId() {
     if (latestChatMsgId !== null) return latestChatMsgId;
     try {
-        const data = await fetchMessages(-1, 1);
+        const data = await fetchMessages(null, 1);
         const m = Array.isArray(data.messages) ? data.messages[0] : null;
         latestChatMsgId = m && m.msg_id != null ? Number(m.msg_id) : null;
     } catch (e) {
@@ -181,8 +186,8 @@ async function ensureLatestChatMsgId() {
     return latestChatMsgId;
 }
 
-function fetchSearchMessages(query, offset, limit) {
-    return fetch(`../search/${chatId}?q=${encodeURIComponent(query)}&offset=${offset}&limit=${limit}`)
+function fetchSearchMessages(query, beforeMsgId, limit) {
+    return fetch(`../search/${chatId}?q=${encodeURIComponent(query)}&${msgIdCursorQuery(beforeMsgId)}&limit=${limit}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('无法加载搜索结果');
@@ -211,8 +216,8 @@ function fetchMessagesByReaction(emoticon, offset, limit) {
         });
 }
 
-function fetchRepliesMessages(replyToMsgId, offset, limit) {
-    return fetch(`../replies/${chatId}/${encodeURIComponent(replyToMsgId)}?offset=${offset}&limit=${limit}`)
+function fetchRepliesMessages(replyToMsgId, beforeMsgId, limit) {
+    return fetch(`../replies/${chatId}/${encodeURIComponent(replyToMsgId)}?${msgIdCursorQuery(beforeMsgId)}&limit=${limit}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('无法加载 replies 列表');
@@ -221,8 +226,8 @@ function fetchRepliesMessages(replyToMsgId, offset, limit) {
         });
 }
 
-function fetchMessagesByRepliesNum(offset, limit) {
-    return fetch(`../messages_by_replies_num/${chatId}?offset=${offset}&limit=${limit}`)
+function fetchMessagesByRepliesNum(cursor, limit) {
+    return fetch(`../messages_by_replies_num/${chatId}?cursor=${encodeURIComponent(cursor || '')}&limit=${limit}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('无法加载 replies_num 排序消息');
@@ -527,20 +532,20 @@ function resetReactionSortingState() {
 
 function resetRepliesNumSortingState() {
     isRepliesNumSorting = false;
-    repliesNumOffset = 0;
-    repliesNumTotal = 0;
+    repliesNumCursor = '';
+    repliesNumHasMore = true;
     isLoadingRepliesNumMessages = false;
 }
 
 let isRepliesViewing = false;
 let repliesToMsgId = null;
-let repliesOldestOffset = 0;
-let repliesTotal = 0;
+let repliesOldestMsgId = null;
+let repliesHasMore = false;
 let isLoadingRepliesMessages = false;
 
 let isRepliesNumSorting = false;
-let repliesNumOffset = 0;
-let repliesNumTotal = 0;
+let repliesNumCursor = '';
+let repliesNumHasMore = true;
 let isLoadingRepliesNumMessages = false;
 
 let _previousViewState = null;
@@ -548,8 +553,8 @@ let _previousViewState = null;
 function resetRepliesViewState() {
     isRepliesViewing = false;
     repliesToMsgId = null;
-    repliesOldestOffset = 0;
-    repliesTotal = 0;
+    repliesOldestMsgId = null;
+    repliesHasMore = false;
     isLoadingRepliesMessages = false;
     const btn = document.getElementById('exitReplies');
     if (btn) btn.classList.add('hidden');
@@ -565,17 +570,17 @@ function _snapshotCurrentViewState(focusMsgId) {
         scrollY: window.scrollY,
         isSearching,
         searchQuery,
-        searchOldestOffset,
-        searchTotal,
+        searchOldestMsgId,
+        searchHasMore,
         isReactionSorting,
         reactionEmoticon,
         reactionOffset,
         reactionTotal,
         isRepliesNumSorting,
-        repliesNumOffset,
-        repliesNumTotal,
-        oldestIndex,
-        totalMessages,
+        repliesNumCursor,
+        repliesNumHasMore,
+        oldestMsgId,
+        hasOlderMessages,
         latestChatMsgId,
         allMessages,
         currentStartIndex,
@@ -597,8 +602,8 @@ async function _restorePreviousViewState() {
     messagesContainer.innerHTML = state.html || '';
     isSearching = !!state.isSearching;
     searchQuery = state.searchQuery || '';
-    searchOldestOffset = Number(state.searchOldestOffset ?? 0);
-    searchTotal = Number(state.searchTotal ?? 0);
+    searchOldestMsgId = state.searchOldestMsgId ?? null;
+    searchHasMore = !!state.searchHasMore;
     isLoadingSearchMessages = false;
     isReactionSorting = !!state.isReactionSorting;
     reactionEmoticon = state.reactionEmoticon || '';
@@ -606,11 +611,11 @@ async function _restorePreviousViewState() {
     reactionTotal = Number(state.reactionTotal ?? 0);
     isLoadingReactionMessages = false;
     isRepliesNumSorting = !!state.isRepliesNumSorting;
-    repliesNumOffset = Number(state.repliesNumOffset ?? 0);
-    repliesNumTotal = Number(state.repliesNumTotal ?? 0);
+    repliesNumCursor = state.repliesNumCursor ?? '';
+    repliesNumHasMore = !!state.repliesNumHasMore;
     isLoadingRepliesNumMessages = false;
-    oldestIndex = Number(state.oldestIndex ?? 0);
-    totalMessages = Number(state.totalMessages ?? 0);
+    oldestMsgId = state.oldestMsgId ?? null;
+    hasOlderMessages = !!state.hasOlderMessages;
     latestChatMsgId = state.latestChatMsgId ?? null;
     allMessages = Array.isArray(state.allMessages) ? state.allMessages : [];
     currentStartIndex = Number(state.currentStartIndex ?? allMessages.length);
@@ -750,8 +755,8 @@ function setRepliesNumSorting(modeValue) {
     if (isSearching) {
         isSearching = false;
         searchQuery = '';
-        searchOldestOffset = 0;
-        searchTotal = 0;
+        searchOldestMsgId = null;
+        searchHasMore = false;
         isLoadingSearchMessages = false;
         updateSearchMoreResultsButton();
         const searchBox = document.getElementById('searchBox');
@@ -759,8 +764,8 @@ function setRepliesNumSorting(modeValue) {
     }
 
     isRepliesNumSorting = true;
-    repliesNumOffset = 0;
-    repliesNumTotal = 0;
+    repliesNumCursor = '';
+    repliesNumHasMore = true;
     isLoadingRepliesNumMessages = false;
     messagesContainer.innerHTML = '';
     overlay.classList.remove('hidden');
@@ -769,17 +774,16 @@ function setRepliesNumSorting(modeValue) {
 
 async function loadMoreRepliesNumMessages(isInitial = false) {
     if (!isRepliesNumSorting || isLoadingRepliesNumMessages) return;
-    if (!isInitial && repliesNumTotal > 0 && repliesNumOffset >= repliesNumTotal) return;
+    if (!isInitial && !repliesNumHasMore) return;
 
     isLoadingRepliesNumMessages = true;
     try {
-        const data = await fetchMessagesByRepliesNum(repliesNumOffset, pageSize);
-        repliesNumTotal = data.total || 0;
+        const data = await fetchMessagesByRepliesNum(repliesNumCursor, pageSize);
+        repliesNumCursor = data.next_cursor || '';
+        repliesNumHasMore = !!data.has_more && !!repliesNumCursor;
         const batch = Array.isArray(data.messages) ? data.messages : [];
         if (batch.length === 0) return;
 
-        repliesNumOffset += batch.length;
-
         const ordered = batch.slice().reverse();
         let html = '';
         for (const m of ordered) {
@@ -835,8 +839,8 @@ async function setRepliesView(targetMsgId) {
     if (isSearching) {
         isSearching = false;
         searchQuery = '';
-        searchOldestOffset = 0;
-        searchTotal = 0;
+        searchOldestMsgId = null;
+        searchHasMore = false;
         isLoadingSearchMessages = false;
         updateSearchMoreResultsButton();
         const searchBox = document.getElementById('searchBox');
@@ -845,8 +849,8 @@ async function setRepliesView(targetMsgId) {
 
     isRepliesViewing = true;
     repliesToMsgId = mid;
-    repliesOldestOffset = 0;
-    repliesTotal = 0;
+    repliesOldestMsgId = null;
+    repliesHasMore = false;
     isLoadingRepliesMessages = false;
 
     const btn = document.getElementById('exitReplies');
@@ -855,10 +859,10 @@ async function setRepliesView(targetMsgId) {
     messagesContainer.innerHTML = '';
     overlay.classList.remove('hidden');
     try {
-        const data = await fetchRepliesMessages(mid, -pageSize, pageSize);
+        const data = await fetchRepliesMessages(mid, null, pageSize);
         const batch = Array.isArray(data.messages) ? data.messages : [];
-        repliesOldestOffset = Number(data.offset ?? 0);
-        repliesTotal = Number(data.total ?? 0);
+        repliesOldestMsgId = batch.length ? Number(batch[0].msg_id) : null;
+        repliesHasMore = !!data.has_more;
 
         const frag = document.createDocumentFragment();
         for (const m of batch) {
@@ -881,7 +885,7 @@ async function setRepliesView(targetMsgId) {
 
 async function loadOlderRepliesMessages() {
     if (!isRepliesViewing || isLoadingRepliesMessages) return;
-    if (repliesOldestOffset <= 0) return;
+    if (!repliesHasMore || repliesOldestMsgId == null) return;
 
     isLoadingRepliesMessages = true;
     showTopLoader();
@@ -890,12 +894,10 @@ async function loadOlderRepliesMessages() {
     const anchorTop = anchorEl ? anchorEl.getBoundingClientRect().top : null;
 
     try {
-        const newOffset = Math.max(0, repliesOldestOffset - pageSize);
-        const count = repliesOldestOffset - newOffset;
-        const data = await fetchRepliesMessages(repliesToMsgId, newOffset, count);
+        const data = await fetchRepliesMessages(repliesToMsgId, repliesOldestMsgId, pageSize);
         const batch = Array.isArray(data.messages) ? data.messages : [];
-        repliesOldestOffset = Number(data.offset ?? newOffset);
-        repliesTotal = Number(data.total ?? repliesTotal);
+        if (batch.length > 0) repliesOldestMsgId = Number(batch[0].msg_id);
+        repliesHasMore = !!data.has_more && batch.length > 0;
 
         if (batch.length > 0) {
             const frag = document.createDocumentFragment();
@@ -933,11 +935,11 @@ function loadOlderRepliesMessagesWithScrollAdjustment() {
 }
 
 function loadMessages() {
-    fetchMessages(-pageSize, pageSize)
+    fetchMessages(null, pageSize)
         .then(data => {
             allMessages = data.messages;
-            oldestIndex = data.offset;
-            totalMessages = data.total;
+            oldestMsgId = allMessages.length ? Number(allMessages[0].msg_id) : null;
+            hasOlderMessages = !!data.has_more;
             loadInitialMessages();
         })
         .catch(error => {
@@ -951,8 +953,8 @@ function loadMessages() {
 let currentStartIndex;
 let isSearching = false;
 let searchQuery = '';
-let searchOldestOffset = 0;
-let searchTotal = 0;
+let searchOldestMsgId = null;
+let searchHasMore = false;
 let isLoadingSearchMessages = false;
 const messagesContainer = document.getElementById('messages');
 
@@ -998,7 +1000,7 @@ function loadInitialMessages() {
     });
 
     function checkAndLoadIfNotScrollable() {
-        if (!isSearching && oldestIndex > 0 && document.body.scrollHeight <= window.innerHeight + 100) {
+        if (!isSearching && hasOlderMessages && document.body.scrollHeight <= window.innerHeight + 100) {
             loadOlderMessagesWithScrollAdjustment();
         }
     }
@@ -1037,7 +1039,7 @@ function waitForMediaToLoad() {
 let isLoadingOlderMessages = false;
 
 async function loadOlderMessages() {
-    if (oldestIndex <= 0 || isLoadingOlderMessages) return;
+    if (!hasOlderMessages || oldestMsgId == null || isLoadingOlderMessages) return;
     isLoadingOlderMessages = true;
     showTopLoader();
 
@@ -1045,10 +1047,9 @@ async function loadOlderMessages() {
     const anchorEl = messagesContainer.querySelector('.message') || messagesContainer.firstElementChild;
     const anchorTop = anchorEl ? anchorEl.getBoundingClientRect().top : null;
     try {
-        let newOffset = Math.max(0, oldestIndex - pageSize);
-        let count = oldestIndex - newOffset;
-        const data = await fetchMessages(newOffset, count);
-        oldestIndex = data.offset;
+        const data = await fetchMessages(oldestMsgId, pageSize);
+        if (data.messages.length > 0) oldestMsgId = Number(data.messages[0].msg_id);
+        hasOlderMessages = !!data.has_more && data.messages.length > 0;
         allMessages = data.messages.concat(allMessages);
         await renderMessagesRange(0, data.messages.length, true);
         currentStartIndex += data.messages.length;
@@ -1082,7 +1083,7 @@ function loadOlderMessagesWithScrollAdjustment() {
 
 async function loadOlderSearchMessages() {
     if (!isSearching || isLoadingSearchMessages) return;
-    if (searchOldestOffset <= 0) return;
+    if (!searchHasMore || searchOldestMsgId == null) return;
 
     isLoadingSearchMessages = true;
     showTopLoader();
@@ -1091,12 +1092,10 @@ async function loadOlderSearchMessages() {
     const anchorTop = anchorEl ? anchorEl.getBoundingClientRect().top : null;
 
     try {
-        const newOffset = Math.max(0, searchOldestOffset - pageSize);
-        const count = searchOldestOffset - newOffset;
-        const data = await fetchSearchMessages(searchQuery, newOffset, count);
+        const data = await fetchSearchMessages(searchQuery, searchOldestMsgId, pageSize);
         const batch = Array.isArray(data.messages) ? data.messages : [];
-        searchOldestOffset = Number(data.offset ?? newOffset);
-        searchTotal = Number(data.total ?? searchTotal);
+        if (batch.length > 0) searchOldestMsgId = Number(batch[0].msg_id);
+        searchHasMore = !!data.has_more && batch.length > 0;
 
         if (batch.length > 0) {
             const existingFirstMsgEl = messagesContainer.querySelector('.message[data-msg-id]');
@@ -1179,7 +1178,7 @@ function checkScroll() {
             loadOlderSearchMessagesWithScrollAdjustment();
             return;
         }
-        if (!isSearching && !isReactionSorting && !isRepliesNumSorting && !isRepliesViewing && window.scrollY < 50 && oldestIndex > 0) {
+        if (!isSearching && !isReactionSorting && !isRepliesNumSorting && !isRepliesViewing && window.scrollY < 50 && hasOlderMessages) {
             loadOlderMessagesWithScrollAdjustment();
         }
     }, 200);
@@ -1202,8 +1201,8 @@ function searchMessages() {
     if (!searchValue) {
         isSearching = false;
         searchQuery = '';
-        searchOldestOffset = 0;
-        searchTotal = 0;
+        searchOldestMsgId = null;
+        searchHasMore = false;
         isLoadingSearchMessages = false;
         updateSearchMoreResultsButton();
         messagesContainer.innerHTML = "";
@@ -1214,11 +1213,11 @@ function searchMessages() {
     isSearching = true;
     searchQuery = searchValue;
     try {
-        fetchSearchMessages(searchQuery, -pageSize, pageSize)
+        fetchSearchMessages(searchQuery, null, pageSize)
             .then(async (data) => {
                 const batch = Array.isArray(data.messages) ? data.messages : [];
-                searchOldestOffset = Number(data.offset ?? 0);
-                searchTotal = Number(data.total ?? 0);
+                searchOldestMsgId = batch.length ? Number(batch[0].msg_id) : null;
+                searchHasMore = !!data.has_more;
 
                 messagesContainer.innerHTML = "";
                 searchGapCounter = 0;
@@ -1274,7 +1273,7 @@ function searchMessages() {
 
 function updateSearchMoreResultsButton() {
     const existing = document.getElementById('searchMoreResults');
-    const shouldShow = isSearching && searchOldestOffset > 0 && !isPageScrollable();
+    const shouldShow = isSearching && searchHasMore && !isPageScrollable();
     if (!shouldShow) {
         if (existing) existing.remove();
         return;
@@ -1292,7 +1291,7 @@ function updateSearchMoreResultsButton() {
 async function ensureSearchScrollable() {
     // 如果搜索结果太少导致没有滚动条，则自动补一些更老的搜索结果，直到可滚动或没有更多
     let guard = 0;
-    while (isSearching && searchOldestOffset > 0 && !isPageScrollable() && guard < 5) {
+    while (isSearching && searchHasMore && !isPageScrollable() && guard < 5) {
         guard += 1;
         await loadOlderSearchMessages();
         await nextTick();